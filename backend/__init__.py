@@ -1,3 +1,4 @@
 from backend.environment import Environment
 from backend.robot import Robot
+from backend.robot_batch import RobotBatch
 from backend.vgmm import VGMM
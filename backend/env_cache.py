@@ -0,0 +1,165 @@
+"""Compiled environments — the built graphs of an Environment on disk.
+
+save_compiled writes every graph of an Environment to one .npz file of
+index arrays: the Points once each, and each edge as indices into them,
+with its side, eid and dual. load_compiled reads it back into an
+Environment with no sweeps or ray casts; only the PolygonGraph is set up
+again from its polygons. cache_key names a file after the polygons and
+the geometric tolerances, so Environment.build(cache_dir=...) can tell
+when a cached build still applies.
+"""
+
+import hashlib
+
+import numpy as np
+
+from pyvisgraph import Point, Edge, PointPool
+from pyvisgraph.graph import PolygonGraph, ChainGraph, Graph
+from pyvisgraph import visible_vertices
+from pyvisgraph.visible_vertices import angle, edge_distance
+
+# Bump when the file layout or the meaning of the graphs changes
+FORMAT_VERSION = 2
+
+# The tolerances the graphs depend on, as part of cache_key
+_TOLERANCES = ("INF", "T_ccw", "T_on_segment", "COLIN_TOLERANCE")
+
+_RAY_GRAPHS = ("bitangent_comp", "inflection", "extension")
+
+
+def cache_key(polygons):
+    """Return a hex digest of the polygons' coordinates (lists of Points),
+    the geometric tolerances and FORMAT_VERSION."""
+    digest = hashlib.sha256()
+    digest.update(f"v{FORMAT_VERSION}".encode())
+    for name in _TOLERANCES:
+        digest.update(f"{name}={getattr(visible_vertices, name)!r}".encode())
+    for polygon in polygons:
+        xy = np.array([(p.x, p.y) for p in polygon], dtype="<f8")
+        digest.update(len(polygon).to_bytes(8, "little"))
+        digest.update(xy.tobytes())
+    return digest.hexdigest()
+
+
+def save_compiled(env, path, key=None):
+    """Write all graphs of env, building any not built yet, to path (.npz),
+    under key, by default the cache_key of env's polygons as PolygonGraph
+    kept them. Environment.build passes the key of the polygons it was
+    given, which it names the file after."""
+    graph = env.polygon_graph
+    points = list(graph.get_points())
+    index = {id(p): i for i, p in enumerate(points)}
+
+    def at(p):
+        # Ray end points are added as they come, keeping shared Points shared
+        i = index.get(id(p))
+        if i is None:
+            i = index[id(p)] = len(points)
+            points.append(p)
+        return i
+
+    def pairs(edges):
+        return np.array([(at(e.p1), at(e.p2)) for e in edges], dtype=np.int32).reshape(-1, 2)
+
+    arrays = {
+        "version": np.array(FORMAT_VERSION),
+        "key": np.array(key if key is not None else cache_key(graph.polygons)),
+        "polygon_ptr": np.cumsum([0] + [len(p) for p in graph.polygons]),
+        "polygon_points": np.array([at(p) for poly in graph.polygons for p in poly],
+                                   dtype=np.int32),
+        "visibility": pairs(env.visibility_graph.get_edges()),
+    }
+
+    chains = list(env.convex_chains.chains.values())
+    arrays["chain_ids"] = np.array([c.chain_id for c in chains], dtype=np.int64)
+    arrays["chain_vertex_ptr"] = np.cumsum([0] + [len(c.vertices) for c in chains])
+    arrays["chain_vertices"] = np.array([at(v) for c in chains for v in c.vertices],
+                                        dtype=np.int32)
+    arrays["chain_edge_ptr"] = np.cumsum([0] + [len(c.edges) for c in chains])
+    arrays["chain_edges"] = pairs([e for c in chains for e in c.edges])
+
+    for name in _RAY_GRAPHS:
+        edges = list(getattr(env, name).get_edges())
+        arrays[name] = pairs(edges)
+        arrays[name + "_side"] = np.array([e.side for e in edges], dtype=np.int8)
+        arrays[name + "_eid"] = np.array([_eid_number(e) for e in edges], dtype=np.int64)
+    # A dual is another edge of the graph, or else (for a ray of a point
+    # obstacle, or one whose twin the Graph dropped as equal to another ray)
+    # an edge of its own, stored by its points and side
+    edges = list(env.bitangent_comp.get_edges())
+    position = {id(e): k for k, e in enumerate(edges)}
+    arrays["bitangent_comp_dual"] = np.array(
+        [position.get(id(e.dual), -1) for e in edges], dtype=np.int64)
+    arrays["bitangent_comp_dual_edge"] = np.array(
+        [(at(e.dual.p1), at(e.dual.p2), e.dual.side) for e in edges],
+        dtype=np.int32).reshape(-1, 3)
+
+    arrays["points"] = np.array([(p.x, p.y) for p in points], dtype=float).reshape(-1, 2)
+    with open(path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+
+
+def load_compiled(env, path, key=None):
+    """Load the graphs written by save_compiled into env. If key is given,
+    the file must have been saved under that cache_key."""
+    with np.load(path) as data:
+        if int(data["version"]) != FORMAT_VERSION:
+            raise ValueError(f"{path}: compiled environment format "
+                             f"{int(data['version'])}, expected {FORMAT_VERSION}")
+        if key is not None and str(data["key"]) != key:
+            raise ValueError(f"{path}: compiled for other polygons")
+        arrays = {name: data[name] for name in data.files}
+
+    points = [Point(x, y) for x, y in arrays["points"].tolist()]
+    ptr, ids = arrays["polygon_ptr"].tolist(), arrays["polygon_points"].tolist()
+    graph = PolygonGraph([[points[i] for i in ids[a:b]] for a, b in zip(ptr[:-1], ptr[1:])])
+
+    # Added in build's order, so the edge set iterates as the saved one did
+    lines = [Edge(points[i], points[j]) for i, j in arrays["visibility"].tolist()]
+    vid = graph.vertex_id
+    lines.sort(key=lambda e: (vid(e.p1), angle(e.p1, e.p2), edge_distance(e.p1, e.p2)))
+    visibility_graph = Graph()
+    visibility_graph.add_edges(lines)
+
+    convex_chains = ChainGraph()
+    vertex_ptr, vertices = arrays["chain_vertex_ptr"].tolist(), arrays["chain_vertices"].tolist()
+    edge_ptr, chain_edges = arrays["chain_edge_ptr"].tolist(), arrays["chain_edges"].tolist()
+    for c, chain_id in enumerate(arrays["chain_ids"].tolist()):
+        convex_chains.new_chain(
+            chain_id,
+            [points[i] for i in vertices[vertex_ptr[c]:vertex_ptr[c + 1]]],
+            # The chain edges are the PolygonGraph's own
+            [graph[points[i], points[j]][0] for i, j in chain_edges[edge_ptr[c]:edge_ptr[c + 1]]],
+        )
+
+    rays = {}
+    for name, prefix in zip(_RAY_GRAPHS, ("BC", "INF", "EX")):
+        edges = []
+        for (i, j), side, eid in zip(arrays[name].tolist(), arrays[name + "_side"].tolist(),
+                                     arrays[name + "_eid"].tolist()):
+            edge = Edge(points[i], points[j], side)
+            edge.eid = f"{prefix}_{eid}" if eid >= 0 else None
+            edges.append(edge)
+        rays[name] = edges
+    edges = rays["bitangent_comp"]
+    for edge, k, (i, j, side) in zip(edges, arrays["bitangent_comp_dual"].tolist(),
+                                     arrays["bitangent_comp_dual_edge"].tolist()):
+        if k >= 0:
+            edge.dual = edges[k]
+        else:
+            edge.dual = Edge(points[i], points[j], side)
+            if side != 0:
+                edge.dual.dual = edge
+
+    built = {"visibility_graph": visibility_graph, "convex_chains": convex_chains}
+    for name in _RAY_GRAPHS:
+        built[name] = Graph()
+        built[name].add_edges(rays[name])
+    env._vis_graph.restore(graph, PointPool(points), **built)
+    env._restored()
+
+
+def _eid_number(edge):
+    if edge.eid is None:
+        return -1
+    return int(edge.eid.rpartition("_")[2])
@@ -4,17 +4,43 @@ import glob
 import json
 import os
 import re
+import zipfile
+
+import numpy as np
 
 from pyvisgraph import Point, Edge
+from pyvisgraph.batch_geometry import (
+    as_point_array, edges_to_array, edge_cross_points, ccw_array)
+from pyvisgraph.edge_grid import EdgeGrid
+from pyvisgraph.event_arrangement import EventArrangement
 from pyvisgraph.vis_graph import VisGraph
 from pyvisgraph.visible_vertices import ccw, edge_cross_point, edge_distance, CCW, CW
-from backend.gap import GapEvent, GapEventType
+from backend.env_cache import cache_key, save_compiled, load_compiled
+from backend.gap import Gap, GapEvent, GapEventTable, GapEventType
+
+
+# Event graphs with more edges than this get an EdgeGrid for gap_events_along
+_GRID_MIN_EDGES = 256
+
+# eid prefix of each event graph's edges, as in event_sinks.EVENT_GRAPHS
+_EID_PREFIXES = {"bitangent_comp": "BC", "inflection": "INF", "extension": "EX"}
+
+# Event graph, approach side -> event type, and whether the approach side is
+# first multiplied by the event edge's side; as in gap_events_along
+_EVENT_TYPES = (
+    ("bitangent_comp", {1: GapEventType.M, -1: GapEventType.S}, True),
+    ("inflection", {1: GapEventType.A, -1: GapEventType.D}, True),
+    ("extension", {-1: GapEventType.N, 1: GapEventType.P}, False),
+)
 
 
 class Environment:
     """Owns the geometric structures for a polygon environment.
 
-    After calling build(), the following read-only properties expose each graph:
+    After calling build(), and as add_polygon() and remove_polygon() update
+    them, the following read-only properties expose each graph. Each one
+    but polygon_graph is built, with the graphs it depends on, when first
+    read (or by build(eager=True)):
         polygon_graph    -- directed polygon boundary (PolygonGraph)
         visibility_graph -- bitangent edges between vertices (Graph)
         convex_chains    -- maximal convex vertex chains (ChainGraph)
@@ -26,25 +52,154 @@ class Environment:
     def __init__(self):
         self._vis_graph = VisGraph()
         self._built = False
+        # graph name -> (edges, (M, 4) coordinate array, EdgeGrid or None)
+        # for gap_events_along
+        self._event_arrays = {}
+        # graph name -> the graph object whose edges have eids
+        self._numbered = {}
+        # All event edges in _EVENT_TYPES order, their (M, 4) coordinates,
+        # the _EVENT_TYPES row of each and an EdgeGrid over them, for next_event
+        self._event_index = None
+        self._event_position = {}
+        # Per event edge: its _EVENT_TYPES row and the factor applied to the
+        # approach side (the edge's side, or 1); per row: side + 1 -> etype.
+        # Built with _event_index, for _segment_events
+        self._event_kinds = None
+        self._event_sides = None
+        self._event_table = None
+        # EventArrangement answering find_visible_vertices, once built
+        self._arrangement = None
 
     # ------------------------------------------------------------------
     # Build / persistence
     # ------------------------------------------------------------------
 
-    def build(self, polygons, status=True):
-        """Build all geometric graphs from a list of polygons.
+    def build(self, polygons, status=True, workers=None, shared_order=False,
+              arrangement=False, eager=False, cache_dir=None):
+        """Build the polygon graph from a list of polygons; the other graphs
+        are built on first use, or now if eager.
 
         The first polygon is the outer wall; all others are obstacles.
         Each polygon is a list of Points in order (CW or CCW).
+        workers > 1 runs the visibility graph sweeps in a process pool;
+        shared_order selects the shared angular-order builder (see VisGraph.build).
+        arrangement also runs build_arrangement, which needs every graph.
+        cache_dir, if given, is a directory of compiled environments (see
+        env_cache): the graphs are loaded from there if these polygons were
+        built before, and otherwise built in full and saved there; a file
+        that cannot be read or is for another format is rebuilt the same way.
+        """
+        if cache_dir is not None:
+            key = cache_key(polygons)
+            path = os.path.join(cache_dir, key + ".npz")
+            try:
+                load_compiled(self, path, key)
+            except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+                # Missing, unreadable or stale: build, and overwrite it
+                self._vis_graph.build(polygons, status=status, workers=workers,
+                                      shared_order=shared_order, eager=True)
+                self._rebuilt()
+                os.makedirs(cache_dir, exist_ok=True)
+                # Write then rename, so a reader never sees half a file
+                save_compiled(self, path + ".tmp", key)
+                os.replace(path + ".tmp", path)
+        else:
+            self._vis_graph.build(polygons, status=status, workers=workers,
+                                  shared_order=shared_order, eager=eager)
+            self._rebuilt()
+        if arrangement:
+            self.build_arrangement()
+        elif eager:
+            self._events()
+
+    def add_polygon(self, polygon):
+        """Add an obstacle (or the wall, if there is none yet), a list of
+        Points, updating the graphs incrementally instead of rebuilding;
+        see VisGraph.add_polygon. Returns its polygon id, or None if it was
+        dropped as degenerate.
+
+        The result is the same as build on the longer polygon list, except
+        that event edges are numbered (eid) afresh.
         """
-        self._vis_graph.build(polygons, status=status)
+        pid = self._vis_graph.add_polygon(polygon)
+        self._rebuilt()
+        return pid
+
+    def remove_polygon(self, pid):
+        """Remove polygon pid, updating the graphs incrementally as
+        add_polygon does; the polygons after it move down one id. Raises
+        IndexError if there is no polygon pid, leaving the graphs as they
+        were."""
+        self._vis_graph.remove_polygon(pid)
+        self._rebuilt()
+
+    def _restored(self):
+        """_rebuilt for graphs that come with their eids."""
+        for name in _EID_PREFIXES:
+            self._numbered[name] = getattr(self._vis_graph, name)
+        self._rebuilt()
+
+    def _rebuilt(self):
+        """Drop what was derived from the previous graphs; an arrangement
+        that was built is built again."""
+        had_arrangement = self._arrangement is not None
         self._built = True
-        for i, edge in enumerate(self._vis_graph.bitangent_comp.get_edges()):
-            edge.eid = f"BC_{i}"
-        for i, edge in enumerate(self._vis_graph.extension.get_edges()):
-            edge.eid = f"EX_{i}"
-        for i, edge in enumerate(self._vis_graph.inflection.get_edges()):
-            edge.eid = f"INF_{i}"
+        self._arrangement = None
+        self._event_arrays = {}
+        self._event_index = None
+        self._event_position = {}
+        self._event_kinds = self._event_sides = self._event_table = None
+        if had_arrangement:
+            self.build_arrangement()
+
+    def _event_graph(self, name):
+        """The named event graph, its edges given eids once it is built."""
+        graph = getattr(self._vis_graph, name)
+        if self._numbered.get(name) is not graph:
+            for i, edge in enumerate(graph.get_edges()):
+                edge.eid = f"{_EID_PREFIXES[name]}_{i}"
+            self._numbered[name] = graph
+        return graph
+
+    def _events(self):
+        """Return _event_index, building the event graphs and the lookups
+        over them first if need be."""
+        if self._event_index is None:
+            self._index_events()
+        return self._event_index
+
+    def _index_events(self):
+        """Build the lookups over the event edges."""
+        for name in ("bitangent_comp", "inflection", "extension"):
+            # In eid order, which is the edge set's order when they were
+            # numbered, and stays so for graphs loaded by load_compiled
+            edges = sorted(self._event_graph(name).get_edges(),
+                           key=lambda e: int(e.eid.rpartition("_")[2]))
+            # Below a few hundred edges one vectorized test of them all is
+            # cheaper than walking grid cells
+            grid = EdgeGrid(edges) if len(edges) > _GRID_MIN_EDGES else None
+            self._event_arrays[name] = (edges, edges_to_array(edges), grid)
+        all_edges = [e for name, _, _ in _EVENT_TYPES for e in self._event_arrays[name][0]]
+        kinds = [row for row, (name, _, _) in enumerate(_EVENT_TYPES)
+                 for _ in self._event_arrays[name][0]]
+        self._event_index = (all_edges, edges_to_array(all_edges), kinds,
+                             EdgeGrid(all_edges))
+        self._event_position = {id(e): k for k, e in enumerate(all_edges)}
+        self._event_kinds = np.array(kinds, dtype=np.intp)
+        self._event_sides = np.array(
+            [e.side if _EVENT_TYPES[row][2] else 1 for e, row in zip(all_edges, kinds)],
+            dtype=np.intp)
+        self._event_table = np.full((len(_EVENT_TYPES), 3), -1)
+        for row, (_, types, _) in enumerate(_EVENT_TYPES):
+            for value, event_type in types.items():
+                self._event_table[row, value + 1] = event_type.value
+
+    def build_arrangement(self):
+        """Cache the bitangent vertices per piece of the event ray
+        arrangement, so that find_visible_vertices and gaps_at look them up
+        instead of sweeping once a piece has been queried. Worth it when
+        many positions are queried; see EventArrangement."""
+        self._arrangement = EventArrangement(self.polygon_graph, self.event_edges)
 
     def save(self, path):
         """Save polygon list to a JSON file."""
@@ -53,12 +208,22 @@ class Environment:
         with open(path, "w") as f:
             json.dump(data, f)
 
-    def load(self, path):
-        """Load polygon list from a JSON file and rebuild."""
+    def load(self, path, cache_dir=None):
+        """Load polygon list from a JSON file and rebuild; see build for
+        cache_dir."""
         with open(path, "r") as f:
             data = json.load(f)
         polygons = [[Point(p[0], p[1]) for p in poly] for poly in data["polygons"]]
-        self.build(polygons, status=False)
+        self.build(polygons, status=False, cache_dir=cache_dir)
+
+    def save_compiled(self, path):
+        """Save all graphs, building any not built yet, to a binary file
+        that load_compiled reads back without rebuilding them."""
+        save_compiled(self, path)
+
+    def load_compiled(self, path):
+        """Load the graphs saved by save_compiled."""
+        load_compiled(self, path)
 
     @staticmethod
     def latest_save(directory="./environments"):
@@ -74,16 +239,53 @@ class Environment:
 
     def find_visible_vertices(self, pos):
         """Return all polygon vertices visible (bitangent) from pos."""
+        if self._arrangement is not None:
+            return self._arrangement.bitangents(pos)
         return self._vis_graph.find_visible_vertices(pos)
 
+    def gaps_at(self, pos, visibility=None):
+        """Return the Gaps a robot at pos sees, one per bitangent vertex.
+        visibility is the VisibilityPolygon of pos if already swept; its
+        bitangent vertices are used instead of finding them again."""
+        if visibility is not None:
+            return self._gaps(pos, visibility.bitangents)
+        return self._gaps(pos, self.find_visible_vertices(pos))
+
+    def gaps_at_points(self, points):
+        """gaps_at for each of a list of points or an (N, 2) array."""
+        points = as_point_array(points)
+        if self._arrangement is not None:
+            visible = self._arrangement.bitangents_batch(points)
+        else:
+            visible = [self._vis_graph.find_visible_vertices(Point(x, y))
+                       for x, y in points.tolist()]
+        return [self._gaps(Point(x, y), vertices)
+                for (x, y), vertices in zip(points.tolist(), visible)]
+
+    def visibility_polygon(self, pos):
+        """Return the VisibilityPolygon seen from pos: its boundary, the
+        bitangent vertices (as find_visible_vertices) and the shadow point
+        behind each tangent vertex, from one angular sweep."""
+        return self._vis_graph.visibility_polygon(pos)
+
     def point_valid(self, point):
         """True if point is inside the wall and outside all obstacles."""
         return self._vis_graph.point_valid(point)
 
+    def points_valid(self, points):
+        """Boolean array version of point_valid for a list of points or an
+        (N, 2) array."""
+        return self._vis_graph.points_valid(points)
+
     def point_in_polygon(self, point):
         """Return polygon_id if point is inside a polygon, -1 otherwise."""
         return self._vis_graph.point_in_polygon(point)
 
+    def classify_points(self, points):
+        """Array version of point_in_polygon for a list of points or an
+        (N, 2) array."""
+        return self._vis_graph.classify_points(points)
+
     def point_in_wall(self, point):
         return self._vis_graph.point_in_wall(point)
 
@@ -113,47 +315,161 @@ class Environment:
         Intersects path_edge with all three critical-event graphs and classifies
         each crossing as A/D/S/M/N/P based on which side the robot came from.
         """
+        self._events()
         events = []
-
-        # Bitangent complement: triggers Merge (M) and Split (S)
-        for edge in self._vis_graph.bitangent_comp.get_edges():
-            p = edge_cross_point(path_edge, edge)
-            if p and p != path_edge.p2:
-                side = _approach_side(path_edge, edge)
-                if side * edge.side == 1:
-                    events.append(GapEvent(p, edge, GapEventType.M))
-                elif side * edge.side == -1:
-                    events.append(GapEvent(p, edge, GapEventType.S))
-                else:
-                    raise ValueError(f"Unexpected side product: {side * edge.side}")
-
-        # Inflection lines: triggers Appear (A) and Disappear (D)
-        for edge in self._vis_graph.inflection.get_edges():
-            p = edge_cross_point(path_edge, edge)
-            if p and p != path_edge.p2:
-                side = _approach_side(path_edge, edge)
-                if side * edge.side == 1:
-                    events.append(GapEvent(p, edge, GapEventType.A))
-                elif side * edge.side == -1:
-                    events.append(GapEvent(p, edge, GapEventType.D))
-                else:
-                    raise ValueError(f"Unexpected side product: {side * edge.side}")
-
-        # Extension lines: triggers Proceed (N) and Retreat (P)
-        for edge in self._vis_graph.extension.get_edges():
-            p = edge_cross_point(path_edge, edge)
-            if p and p != path_edge.p2:
-                side = _approach_side(path_edge, edge)
-                if side == -1:
-                    events.append(GapEvent(p, edge, GapEventType.N))
-                elif side == 1:
-                    events.append(GapEvent(p, edge, GapEventType.P))
-                else:
-                    raise ValueError(f"Unexpected side: {side}")
+        for name, types, by_edge_side in _EVENT_TYPES:
+            for p, edge in self._crossings(path_edge, name):
+                if p != path_edge.p2:
+                    events.append(_classify(path_edge, p, edge, types, by_edge_side))
 
         events.sort(key=lambda e: edge_distance(e.pos, path_edge.p1))
         return events
 
+    def next_event(self, pos, direction, max_dist, exclude=(), at=()):
+        """Return the gap events at the first event edge crossing from pos
+        along direction, no further than max_dist, or [].
+
+        The events are those gap_events_along would give first for
+        Edge(pos, pos + max_dist * direction): a crossing at pos counts and
+        one at exactly max_dist does not. Several events are returned only
+        when several event edges cross at that point. Event edges in exclude
+        are skipped, e.g. those just crossed at pos.
+
+        at lists event edges through pos that are crossed right there, e.g.
+        when turning back across them. Their events are returned without a
+        search, as intersecting a segment with an edge through its start
+        point is at the mercy of rounding.
+
+        Otherwise the event grid is walked cell by cell from pos, so the cost
+        follows the edges near the ray up to the first crossing, not the
+        number of event edges. A zero direction has no first crossing and
+        returns [].
+        """
+        length = (direction.x ** 2 + direction.y ** 2) ** 0.5
+        if length == 0:
+            return []
+        edges, coords, kinds, grid = self._events()
+        end = Point(pos.x + direction.x / length * max_dist,
+                    pos.y + direction.y / length * max_dist)
+        path_edge = Edge(pos, end)
+        if at:
+            events = []
+            for k in sorted(self._event_position[id(edge)] for edge in at):
+                _, types, by_edge_side = _EVENT_TYPES[kinds[k]]
+                events.append(_classify(path_edge, pos, edges[k], types, by_edge_side))
+            return events
+        tested = set()
+        found = []
+        for positions, t_leave in grid.ray_cells(pos, direction):
+            new = [k for k in positions if k not in tested]
+            tested.update(new)
+            new = [k for k in new if edges[k] not in exclude]
+            if new:
+                points, hit = edge_cross_points((pos.x, pos.y), (end.x, end.y), coords[new])
+                for i in np.flatnonzero(hit):
+                    p = Point(points[i, 0], points[i, 1])
+                    if p != end:
+                        found.append((edge_distance(pos, p), new[i], p))
+            if found and min(found)[0] < t_leave - 1e-9 * grid.cell:
+                break
+            if t_leave > max_dist:
+                break
+        if not found:
+            return []
+        nearest = min(found)[0]
+        events = []
+        for _, k, p in sorted(f for f in found if f[0] == nearest):
+            _, types, by_edge_side = _EVENT_TYPES[kinds[k]]
+            events.append(_classify(path_edge, p, edges[k], types, by_edge_side))
+        return events
+
+    def _crossings(self, path_edge, graph_name):
+        """Yield (point, edge) for each edge of the named event graph that
+        path_edge crosses, in edge order (see edge_cross_point). Only the
+        edges sharing a grid cell with path_edge are tested, once the graph
+        is large enough to have an EdgeGrid."""
+        edges, coords, grid = self._event_arrays[graph_name]
+        if grid is None:
+            candidates = np.arange(len(edges))
+        else:
+            candidates = grid.segment_edges(path_edge)
+            if not candidates:
+                return
+            coords = coords[candidates]
+        p1, p2 = path_edge.p1, path_edge.p2
+        points, hit = edge_cross_points((p1.x, p1.y), (p2.x, p2.y), coords)
+        for i in np.flatnonzero(hit):
+            yield Point(points[i, 0], points[i, 1]), edges[candidates[i]]
+
+    def gap_events_along_polyline(self, points, chunk_size=64):
+        """Return a GapEventTable of the gap events along every segment of
+        the polyline through points (Points or an (N, 2) array).
+
+        Row for row the same events as gap_events_along on each segment,
+        found with one vectorized pass over the event edges. Segment and
+        edge pairs whose bounding boxes do not overlap are dropped first.
+        """
+        pts = as_point_array(points)
+        p1, p2 = pts[:-1], pts[1:]
+        seg, k = _box_pairs(p1, p2, self._events()[1], chunk_size)
+        return self._segment_events(p1, p2, seg, k)
+
+    def gap_events_along_segments(self, starts, ends):
+        """Return a GapEventTable of the gap events along each segment from
+        starts[i] to ends[i] (Points or (N, 2) arrays), for many unrelated
+        short segments such as one step of many robots.
+
+        Row for row the same events as gap_events_along on each segment.
+        The candidate edges of each segment are those sharing an event grid
+        cell with its bounding box, so the cost follows the cells the
+        segments cover rather than segments times event edges.
+        """
+        p1, p2 = as_point_array(starts), as_point_array(ends)
+        grid = self._events()[3]
+        seg, k = grid.box_edges(np.minimum(p1, p2), np.maximum(p1, p2))
+        return self._segment_events(p1, p2, seg, k)
+
+    def _segment_events(self, p1, p2, seg, k):
+        """GapEventTable of the crossings among the candidate pairs of
+        segment p1[seg]-p2[seg] and event edge k."""
+        edges, coords, kinds, _ = self._event_index
+        cross, hit = edge_cross_points(p1[seg], p2[seg], coords[k])
+        seg, k, cross = seg[hit], k[hit], cross[hit]
+        # A crossing at the segment's end belongs to the next segment
+        at_end = (cross[:, 0] == p2[seg, 0]) & (cross[:, 1] == p2[seg, 1])
+        seg, k, cross = seg[~at_end], k[~at_end], cross[~at_end]
+        # _approach_side
+        side = ccw_array(coords[k, 0:2], coords[k, 2:4], p1[seg])
+        after = ccw_array(coords[k, 0:2], coords[k, 2:4], p2[seg])
+        side = np.where(side == 0, -after, side)
+        side = side * self._event_sides[k]
+        etype = self._event_table[self._event_kinds[k], side + 1]
+        if (etype < 0).any():
+            raise ValueError(f"Unexpected side: {side[etype < 0][0]}")
+
+        # Same key as gap_events_along's stable sort by edge_distance, with
+        # ties in graph then edge order, i.e. by index into edges
+        dist = np.sqrt(np.float_power(cross[:, 0] - p1[seg, 0], 2)
+                       + np.float_power(cross[:, 1] - p1[seg, 1], 2))
+        order = np.lexsort((k, dist, seg))
+        seg, k, cross, etype, dist = seg[order], k[order], cross[order], etype[order], dist[order]
+        length = np.hypot(p2[:, 0] - p1[:, 0], p2[:, 1] - p1[:, 1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = dist / length[seg]
+        return GapEventTable(seg, t, cross, k, etype, edges)
+
+    def _gaps(self, pos, vertices):
+        graph = self.polygon_graph
+        gaps = []
+        for v in vertices:
+            dir = (v - pos).unit_vec()
+            side = 0  # point obstacles have no side
+            next_point = graph.get_next_point(v)
+            if next_point:
+                side = ccw(pos, v, next_point)
+            gaps.append(Gap(v, side, dir))
+        return gaps
+
     # ------------------------------------------------------------------
     # Graph access (read-only properties)
     # ------------------------------------------------------------------
@@ -172,15 +488,51 @@ class Environment:
 
     @property
     def bitangent_comp(self):
-        return self._vis_graph.bitangent_comp
+        return self._event_graph("bitangent_comp")
 
     @property
     def inflection(self):
-        return self._vis_graph.inflection
+        return self._event_graph("inflection")
 
     @property
     def extension(self):
-        return self._vis_graph.extension
+        return self._event_graph("extension")
+
+    @property
+    def event_edges(self):
+        """All event edges, indexed as GapEventTable.edge of the tables from
+        gap_events_along_polyline and gap_events_along_segments."""
+        return self._events()[0]
+
+
+def _box_pairs(p1, p2, coords, chunk_size):
+    """Return (segment_idx, edge_idx) for the segments p1[i]-p2[i] and edges
+    whose bounding boxes overlap; a crossing lies in both boxes."""
+    ex_lo = np.minimum(coords[:, 0], coords[:, 2])
+    ex_hi = np.maximum(coords[:, 0], coords[:, 2])
+    ey_lo = np.minimum(coords[:, 1], coords[:, 3])
+    ey_hi = np.maximum(coords[:, 1], coords[:, 3])
+    seg_parts, edge_parts = [np.zeros(0, dtype=np.intp)], [np.zeros(0, dtype=np.intp)]
+    for start in range(0, len(p1), chunk_size):
+        a, b = p1[start:start + chunk_size], p2[start:start + chunk_size]
+        sx_lo, sx_hi = np.minimum(a[:, 0], b[:, 0])[:, None], np.maximum(a[:, 0], b[:, 0])[:, None]
+        sy_lo, sy_hi = np.minimum(a[:, 1], b[:, 1])[:, None], np.maximum(a[:, 1], b[:, 1])[:, None]
+        i, k = np.nonzero((sx_lo <= ex_hi) & (ex_lo <= sx_hi) & (sy_lo <= ey_hi) & (ey_lo <= sy_hi))
+        seg_parts.append(start + i)
+        edge_parts.append(k)
+    return np.concatenate(seg_parts), np.concatenate(edge_parts)
+
+
+def _classify(path_edge, p, edge, types, by_edge_side):
+    """Return the GapEvent for path_edge crossing the event edge at p, given
+    the event edge's _EVENT_TYPES row."""
+    side = _approach_side(path_edge, edge)
+    if by_edge_side:
+        side *= edge.side
+    if side not in types:
+        what = "side product" if by_edge_side else "side"
+        raise ValueError(f"Unexpected {what}: {side}")
+    return GapEvent(p, edge, types[side])
 
 
 def _approach_side(path_edge, event_edge):
@@ -0,0 +1,103 @@
+"""Event sinks — where Robot reports the gap events it processes.
+
+A sink is any object with an emit(event) method taking a GapEvent. Robot
+has no sink by default, so processing events costs nothing beyond the
+events themselves; pass one of these to watch or record them.
+"""
+
+from collections import deque
+
+import numpy as np
+
+
+# One record of an EventLogSink file
+EVENT_RECORD = np.dtype([
+    ("x", "<f8"),
+    ("y", "<f8"),
+    ("etype", "u1"),    # GapEventType value
+    ("graph", "u1"),    # index into EVENT_GRAPHS, or 255 for an edge without eid
+    ("edge", "<u4"),    # number in the edge's eid
+])
+
+# eid prefixes given by Environment.build, in EVENT_RECORD graph order
+EVENT_GRAPHS = ("BC", "INF", "EX")
+
+
+class PrintSink:
+    """Print one line per event, as Robot.move used to."""
+
+    def emit(self, event):
+        print(f"{event.etype.name}  edge={event.edge.eid}  pos={event.pos}")
+
+
+class RingBufferSink:
+    """Keep the last maxlen events in memory.
+
+    events -- deque of GapEvent, oldest first
+    """
+
+    def __init__(self, maxlen=4096):
+        self.events = deque(maxlen=maxlen)
+
+    def emit(self, event):
+        self.events.append(event)
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        return iter(self.events)
+
+
+class EventLogSink:
+    """Append events to a binary file of EVENT_RECORD records.
+
+    Records are buffered and written every buffer_size events and on
+    flush() or close(); use it as a context manager. read_event_log()
+    loads the file back.
+    """
+
+    def __init__(self, path, buffer_size=4096):
+        self.path = path
+        self._file = open(path, "ab")
+        self._buffer = np.zeros(buffer_size, dtype=EVENT_RECORD)
+        self._count = 0
+
+    def emit(self, event):
+        record = self._buffer[self._count]
+        record["x"] = event.pos.x
+        record["y"] = event.pos.y
+        record["etype"] = event.etype.value
+        record["graph"], record["edge"] = _edge_key(event.edge)
+        self._count += 1
+        if self._count == len(self._buffer):
+            self.flush()
+
+    def flush(self):
+        self._buffer[:self._count].tofile(self._file)
+        self._count = 0
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_event_log(path):
+    """Return the records of an EventLogSink file as an EVENT_RECORD array."""
+    return np.fromfile(path, dtype=EVENT_RECORD)
+
+
+def _edge_key(edge):
+    eid = getattr(edge, "eid", None)
+    if eid is None:
+        return 255, 0
+    prefix, _, number = eid.rpartition("_")
+    return EVENT_GRAPHS.index(prefix), int(number)
@@ -1,4 +1,5 @@
 from pyvisgraph import Point, Edge
+import numpy as np
 from numpy.linalg import norm
 from enum import Enum
 from dataclasses import dataclass
@@ -10,6 +11,7 @@ class Gap:
     def __init__(self, vertex, side, dir):
         assert isinstance(vertex, Point)
         assert abs(norm(dir) - 1) < 1e-10
+        self.id = None
         self.vertex = vertex
         self.side = side
         self.dir = dir
@@ -35,3 +37,46 @@ class GapEvent:
     edge: Edge    # the critical-event edge that was crossed
     etype: GapEventType
 
+
+@dataclass
+class EventInfo:
+    etype: GapEventType
+    gap1_id: int            # the gap that appears, disappears, splits or absorbs
+    gap2_id: int = None     # the gap split off or merged away (S/M only)
+
+
+
+class GapEventTable:
+    """Gap events along a polyline, one array per field.
+
+    Row r is an event on segment[r], from points[segment[r]] to
+    points[segment[r] + 1], at parameter t[r] in [0, 1) along it and at
+    position pos[r]. It crosses edges[edge[r]] and has type
+    GapEventType(etype[r]). Rows are sorted by segment, and within a
+    segment in the order gap_events_along returns them.
+    """
+
+    def __init__(self, segment, t, pos, edge, etype, edges):
+        self.segment = segment
+        self.t = t
+        self.pos = pos
+        self.edge = edge
+        self.etype = etype
+        self.edges = edges
+
+    def __len__(self):
+        return len(self.segment)
+
+    @property
+    def eids(self):
+        """The eid of each row's event edge."""
+        return [self.edges[k].eid for k in self.edge]
+
+    def events(self, segment):
+        """Return the GapEvents of one segment, as gap_events_along would."""
+        lo, hi = np.searchsorted(self.segment, [segment, segment + 1])
+        return [
+            GapEvent(Point(*self.pos[r]), self.edges[self.edge[r]],
+                     GapEventType(self.etype[r]))
+            for r in range(lo, hi)
+        ]
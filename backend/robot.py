@@ -1,57 +1,196 @@
-from pyvisgraph import Edge, ccw, CCW, CW
-from backend.gap import Gap, GapEventType, is_tracking_event
+from bisect import insort
+
+import numpy as np
+
+from pyvisgraph import Point, Edge, CCW, CW
+from pyvisgraph.visible_vertices import edge_distance
+from backend.gap import Gap, EventInfo, GapEventType, is_tracking_event
+from backend.vgmm import VGMM
 
 
 class Robot:
     """Robot that detects gaps and processes gap events as it moves.
 
     pos  -- current Point position
-    gaps -- list of currently visible Gap objects
+    sink -- where processed GapEvents are reported (see backend.event_sinks),
+            or None
+    vgmm -- VGMM fed the EventInfo of every A/D/S/M event, if requested
+    gaps -- list of currently visible Gap objects, in order of appearance.
+            Each gap gets a new integer id when it appears (at start, A or
+            S) and keeps it through N/P events until it goes (D or M).
+    gap_directions -- (g, 2) array of the unit directions to those gaps
+    visibility -- VisibilityPolygon seen from pos
+
+    Gap directions are only recomputed, all at once, when gaps or
+    gap_directions is read after the robot or its gaps have changed, and
+    the visibility polygon when it is read after the robot has moved.
     """
 
-    def __init__(self, env, pos):
+    def __init__(self, env, pos, sink=None, vgmm=False):
         self.env = env
         self.pos = pos
-        self.gaps = []
+        self.sink = sink
+        self.vgmm = None
+        # Gap -> None in order of appearance, and gap vertex -> [Gap] in the
+        # same order, so that events find, add and remove gaps in O(1) and
+        # _find_gap picks the gap a scan of gaps would
+        self._gaps = {}
+        self._gap_at = {}
         self._gap_count = 0
+        # (g, 2) unit directions to the gaps from pos, or None when stale
+        self._directions = None
+        # (event edge, direction) crossed by advance at the current position
+        self._crossed = []
+        # Gaps added, removed or moved, recorded while sample_gap_angles runs
+        self._touched = None
+        # VisibilityPolygon of the position it was swept from, or None
+        self._visibility = None
         self._detect_gaps()
+        if vgmm:
+            self.vgmm = VGMM(self.gaps)
 
     # ------------------------------------------------------------------
     # Public interface
     # ------------------------------------------------------------------
 
-    def move(self, path_edge):
-        """Process all gap events along path_edge and advance position."""
-        events = self.env.gap_events_along(path_edge)
-        for event in events:
-            print(f"{event.etype.name}  edge={event.edge.eid}  pos={event.pos}")
-            event_info = self._apply_event(event)
-            self.pos = event.pos
-            self._update_directions()
-            # if not is_tracking_event(event):
-            #     self.gnt(event_info)
+    @property
+    def gaps(self):
+        if self._directions is None:
+            self._refresh_directions()
+        return list(self._gaps)
+
+    @property
+    def gap_directions(self):
+        if self._directions is None:
+            self._refresh_directions()
+        return self._directions
+
+    @property
+    def visibility(self):
+        if self._visibility is None or self._visibility.origin != self.pos:
+            self._visibility = self.env.visibility_polygon(self.pos)
+        return self._visibility
+
+    def move(self, path_edge, events=None):
+        """Process all gap events along path_edge and advance position.
+        Returns the events processed.
+
+        events -- the events along path_edge if already known, e.g. from
+                  GapEventTable.events; computed otherwise.
+        """
+        if events is None:
+            events = self.env.gap_events_along(path_edge)
+        self._process(events)
+        self._crossed = []
 
         self.pos = path_edge.p2
         self._update_directions()
+        return events
+
+    def advance(self, direction, max_dist):
+        """Move along direction up to the next gap event, or max_dist if no
+        event comes first, and process the events there.
+
+        Returns the events processed ([] if max_dist was reached) so that a
+        controller can steer between events. Calling advance again from the
+        event position picks up from the next crossing, or crosses back
+        right away if the new direction heads back over the edges just
+        crossed. A zero direction goes nowhere and returns [].
+        """
+        length = (direction.x ** 2 + direction.y ** 2) ** 0.5
+        if length == 0:
+            return []
+        exclude = [edge for edge, _ in self._crossed]
+        back = [edge for edge, d in self._crossed
+                if _side(edge, direction) == -_side(edge, d) != 0]
+        events = self.env.next_event(self.pos, direction, max_dist, exclude, back)
+        if events:
+            self._process(events)
+            self._crossed = [(event.edge, direction) for event in events]
+        else:
+            self._crossed = []
+            self.pos = Point(self.pos.x + direction.x / length * max_dist,
+                             self.pos.y + direction.y / length * max_dist)
+            self._update_directions()
+        return events
+
+    def sample_gap_angles(self, path_edge, ts, events=None):
+        """Move along path_edge as move() does and return (gap_ids, angles),
+        the bearing of every gap at the points p1 + t * (p2 - p1) for t in ts.
+
+        angles is a (len(ts), len(gap_ids)) array; column j holds gap
+        gap_ids[j] and is NaN where that gap is not visible. At the point of
+        an event the gaps are those from before it, as after a move ending
+        there. Between events the gap vertices are fixed, so each bearing is
+        evaluated in closed form for all the samples in between at once.
+        """
+        if events is None:
+            events = self.env.gap_events_along(path_edge)
+        ts = np.asarray(ts, dtype=float).reshape(-1)
+        p1, p2 = path_edge.p1, path_edge.p2
+        length = edge_distance(p1, p2)
+        t_events = np.array([edge_distance(p1, e.pos) / length for e in events])
+        # Interval k lies between events k - 1 and k
+        interval = np.searchsorted(t_events, ts, side="left")
+
+        # (gap id, vertex, first interval, end interval) per fixed vertex
+        pieces = []
+        opened = {gap.id: (gap.vertex, 0) for gap in self._gaps}
+        gap_ids = list(opened)
+        self._touched = []
+        try:
+            for k, event in enumerate(events, 1):
+                self._process([event])
+                for gap in self._touched:
+                    if gap.id in opened:
+                        vertex, start = opened.pop(gap.id)
+                        pieces.append((gap.id, vertex, start, k))
+                    else:
+                        gap_ids.append(gap.id)
+                    if gap in self._gaps:
+                        opened[gap.id] = (gap.vertex, k)
+                self._touched.clear()
+        finally:
+            self._touched = None
+        for gid, (vertex, start) in opened.items():
+            pieces.append((gid, vertex, start, len(events) + 1))
+        self._crossed = []
+        self.pos = p2
+        self._update_directions()
+
+        x = (1 - ts) * p1.x + ts * p2.x
+        y = (1 - ts) * p1.y + ts * p2.y
+        column = {gid: j for j, gid in enumerate(gap_ids)}
+        angles = np.full((len(ts), len(gap_ids)), np.nan)
+        order = np.argsort(interval, kind="stable")
+        bounds = np.searchsorted(interval[order], [(p[2], p[3]) for p in pieces])
+        for (gid, vertex, _, _), (lo, hi) in zip(pieces, bounds.reshape(-1, 2)):
+            rows = order[lo:hi]
+            angles[rows, column[gid]] = np.arctan2(vertex.y - y[rows], vertex.x - x[rows])
+        return np.array(gap_ids, dtype=int), angles
 
     # ------------------------------------------------------------------
     # Internal helpers
     # ------------------------------------------------------------------
 
+    def _process(self, events):
+        for event in events:
+            if self.sink is not None:
+                self.sink.emit(event)
+            event_info = self._apply_event(event)
+            self.pos = event.pos
+            self._update_directions()
+            if self.vgmm is not None and not is_tracking_event(event):
+                self.vgmm(event_info)
+
     def _detect_gaps(self):
         """Find all bitangent vertices from the current position and register them as gaps."""
-        graph = self.env.polygon_graph
-        for v in self.env.find_visible_vertices(self.pos):
-            dir = (v - self.pos).unit_vec()
-            side = 0  # point obstacles have no side
-            next_point = graph.get_next_point(v)
-            if next_point:
-                side = ccw(self.pos, v, next_point)
-            gap = Gap(v, side, dir)
-            self.gaps.append(gap)
+        for gap in self.env.gaps_at(self.pos, self.visibility):
+            self._add_gap(gap)
 
     def _apply_event(self, event):
-        """Mutate gap list for one event."""
+        """Mutate gap list for one event. Returns its EventInfo, or None for
+        the tracking events N and P, which keep every gap and its id."""
         graph = self.env.polygon_graph
         etype = event.etype
         edge = event.edge
@@ -59,19 +198,19 @@ class Robot:
         if etype == GapEventType.N:
             if edge.side == CCW:
                 gap = self._find_gap(edge.p1)
-                gap.vertex = graph.get_next_point(edge.p1)
+                self._move_gap(gap, graph.get_next_point(edge.p1))
             else:  # CW
                 gap = self._find_gap(graph.get_prev_point(edge.p1))
-                gap.vertex = edge.p1
+                self._move_gap(gap, edge.p1)
             return None
 
         elif etype == GapEventType.P:
             if edge.side == CW:
                 gap = self._find_gap(edge.p1)
-                gap.vertex = graph.get_prev_point(edge.p1)
+                self._move_gap(gap, graph.get_prev_point(edge.p1))
             else:  # CCW
                 gap = self._find_gap(graph.get_next_point(edge.p1))
-                gap.vertex = edge.p1
+                self._move_gap(gap, edge.p1)
             return None
 
         elif etype == GapEventType.A:
@@ -80,13 +219,13 @@ class Robot:
                 edge.side,
                 (edge.p1 - edge.p2).unit_vec(),
             )
-            self.gaps.append(new_gap)
-            # return EventInfo(etype, new_gap.id, None)
+            self._add_gap(new_gap)
+            return EventInfo(etype, new_gap.id, None)
 
         elif etype == GapEventType.D:
             gap = self._find_gap(edge.p1)
-            self.gaps.remove(gap)
-            # return EventInfo(etype, gap.id, None)
+            self._remove_gap(gap)
+            return EventInfo(etype, gap.id, None)
 
         elif etype == GapEventType.S:
             gap = self._find_gap(edge.p1)
@@ -96,22 +235,72 @@ class Robot:
                 -1 * dual.side,
                 (edge.p1 - edge.p2).unit_vec(),
             )
-            self.gaps.append(new_gap)
-            # return EventInfo(etype, gap.id, new_gap.id)
+            self._add_gap(new_gap)
+            return EventInfo(etype, gap.id, new_gap.id)
 
         elif etype == GapEventType.M:
             gap = self._find_gap(edge.p1)
             dual_gap = self._find_gap(edge.dual.p1)
-            self.gaps.remove(dual_gap)
-            # return EventInfo(etype, gap.id, dual_gap.id)
+            self._remove_gap(dual_gap)
+            return EventInfo(etype, gap.id, dual_gap.id)
 
     def _find_gap(self, vertex):
-        for gap in self.gaps:
-            if gap.vertex == vertex:
-                return gap
-        raise RuntimeError(f"Gap with vertex {vertex} not found.")
+        try:
+            return self._gap_at[vertex][0]
+        except KeyError:
+            raise RuntimeError(f"Gap with vertex {vertex} not found.") from None
+
+    def _add_gap(self, gap):
+        gap.id = self._gap_count
+        self._gap_count += 1
+        self._directions = None
+        if self._touched is not None:
+            self._touched.append(gap)
+        self._gaps[gap] = None
+        self._gap_at.setdefault(gap.vertex, []).append(gap)
+
+    def _remove_gap(self, gap):
+        self._directions = None
+        if self._touched is not None:
+            self._touched.append(gap)
+        del self._gaps[gap]
+        self._unindex(gap)
+
+    def _move_gap(self, gap, vertex):
+        """Move gap to a new vertex, keeping its place in the gap order."""
+        self._directions = None
+        if self._touched is not None:
+            self._touched.append(gap)
+        self._unindex(gap)
+        gap.vertex = vertex
+        # Ids grow in order of appearance, and a moved gap keeps its place
+        insort(self._gap_at.setdefault(vertex, []), gap, key=lambda g: g.id)
 
+    def _unindex(self, gap):
+        # Gaps rarely share a vertex, so the list almost always holds one
+        at_vertex = self._gap_at[gap.vertex]
+        at_vertex.remove(gap)
+        if not at_vertex:
+            del self._gap_at[gap.vertex]
 
     def _update_directions(self):
-        for gap in self.gaps:
-            gap.dir = (gap.vertex - self.pos).unit_vec()
+        # Deferred to the next read of gaps or gap_directions
+        self._directions = None
+
+    def _refresh_directions(self):
+        gaps = list(self._gaps)
+        d = np.array([(g.vertex.x, g.vertex.y) for g in gaps], dtype=float).reshape(-1, 2)
+        d -= (self.pos.x, self.pos.y)
+        # Row-wise dot products, which round like the norm() in unit_vec
+        d /= np.sqrt(d[:, None, :] @ d[:, :, None])[:, 0]
+        for gap, row in zip(gaps, d):
+            gap.dir = row
+        self._directions = d
+
+
+def _side(edge, direction):
+    """Sign of the cross product of edge and direction: the side of edge a
+    step along direction ends up on."""
+    cross = ((edge.p2.x - edge.p1.x) * direction.y
+             - (edge.p2.y - edge.p1.y) * direction.x)
+    return (cross > 0) - (cross < 0)
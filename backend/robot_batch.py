@@ -0,0 +1,192 @@
+from bisect import insort
+
+import numpy as np
+
+from pyvisgraph import CCW, CW
+from backend.gap import Gap, GapEventType
+
+
+_A, _D, _S, _M, _N, _P = (GapEventType[name].value for name in "ADSMNP")
+
+
+class RobotBatch:
+    """Many robots moving through one built Environment, stepped together.
+
+    Each step finds the gap events of every robot at once with
+    Environment.gap_events_along_segments and applies them as Robot would,
+    to gap state kept as flat arrays over all robots rather than as Gap
+    objects. Gaps get the same ids Robot would give them.
+
+    positions -- (N, 2) array of robot positions
+    Gap store, one slot per gap in order of appearance (the arrays have
+    spare capacity; gap_slots lists the slots of the visible gaps):
+        gap_robot  -- robot index
+        gap_vertex -- index into vertices of the gap vertex
+        gap_side   -- gap side
+        gap_id     -- gap id, counted per robot
+        gap_alive  -- False once the gap has gone
+    """
+
+    def __init__(self, env, positions):
+        self.env = env
+        self.positions = np.array(positions, dtype=float).reshape(-1, 2)
+        graph = env.polygon_graph
+        self.vertices = list(graph.get_points())
+        index = {v: i for i, v in enumerate(self.vertices)}
+        self._xy = np.array([(v.x, v.y) for v in self.vertices], dtype=float).reshape(-1, 2)
+        self._next = [index.get(graph.get_next_point(v), -1) for v in self.vertices]
+        self._prev = [index.get(graph.get_prev_point(v), -1) for v in self.vertices]
+
+        # Per event edge, as indexed by GapEventTable.edge
+        edges = env.event_edges
+        self._edge_p1 = [index[e.p1] for e in edges]
+        self._edge_side = [e.side for e in edges]
+        self._dual_p1 = [index[e.dual.p1] if e.dual is not None else -1 for e in edges]
+        self._dual_side = [e.dual.side if e.dual is not None else 0 for e in edges]
+
+        self.gap_robot = np.zeros(0, dtype=np.intp)
+        self.gap_vertex = np.zeros(0, dtype=np.intp)
+        self.gap_side = np.zeros(0, dtype=np.int8)
+        self.gap_id = np.zeros(0, dtype=np.intp)
+        self.gap_alive = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._dead = 0
+        # (robot, vertex) -> [slot] in order of appearance, as Robot's
+        # vertex index
+        self._slots = {}
+        self._next_id = [0] * len(self.positions)
+
+        for r, gaps in enumerate(env.gaps_at_points(self.positions)):
+            for gap in gaps:
+                self._add(r, index[gap.vertex], gap.side)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def step(self, targets):
+        """Move every robot from its position to its row of targets, an
+        (N, 2) array, processing the gap events on the way.
+
+        Returns the GapEventTable of the step, with the robot index as the
+        segment: table.events(r) is robot r's event log for the step.
+        """
+        targets = np.array(targets, dtype=float).reshape(-1, 2)
+        table = self.env.gap_events_along_segments(self.positions, targets)
+        edge_p1, edge_side = self._edge_p1, self._edge_side
+        for r, k, etype in zip(table.segment.tolist(), table.edge.tolist(),
+                               table.etype.tolist()):
+            v = edge_p1[k]
+            if etype == _N:
+                if edge_side[k] == CCW:
+                    self._move(r, v, self._next[v])
+                else:  # CW
+                    self._move(r, self._prev[v], v)
+            elif etype == _P:
+                if edge_side[k] == CW:
+                    self._move(r, v, self._prev[v])
+                else:  # CCW
+                    self._move(r, self._next[v], v)
+            elif etype == _A:
+                self._add(r, v, edge_side[k])
+            elif etype == _D:
+                self._remove(self._find(r, v))
+            elif etype == _S:
+                self._find(r, v)
+                self._add(r, self._dual_p1[k], -self._dual_side[k])
+            elif etype == _M:
+                self._find(r, v)
+                self._remove(self._find(r, self._dual_p1[k]))
+        self.positions = targets
+        if self._dead > max(self._size - self._dead, 1024):
+            self._compact()
+        return table
+
+    def gap_slots(self, robot=None):
+        """Return the slots of the visible gaps, of one robot or of all of
+        them, in order of robot and appearance."""
+        alive = np.flatnonzero(self.gap_alive[:self._size])
+        if robot is not None:
+            alive = alive[self.gap_robot[alive] == robot]
+        return alive[np.argsort(self.gap_robot[alive], kind="stable")]
+
+    def gap_angles(self, robot=None):
+        """Return (robots, ids, angles) for the visible gaps, of one robot or
+        of all of them: the bearing of each gap vertex from its robot."""
+        slots = self.gap_slots(robot)
+        robots = self.gap_robot[slots]
+        d = self._xy[self.gap_vertex[slots]] - self.positions[robots]
+        return robots, self.gap_id[slots], np.arctan2(d[:, 1], d[:, 0])
+
+    def gaps(self, robot):
+        """Robot.gaps for one robot: its visible gaps as Gap objects."""
+        result = []
+        pos = self.positions[robot]
+        for slot in self.gap_slots(robot).tolist():
+            d = self._xy[self.gap_vertex[slot]] - pos
+            gap = Gap(self.vertices[self.gap_vertex[slot]], int(self.gap_side[slot]),
+                      d / np.sqrt(d @ d))
+            gap.id = int(self.gap_id[slot])
+            result.append(gap)
+        return result
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _find(self, robot, vertex):
+        try:
+            return self._slots[robot, vertex][0]
+        except KeyError:
+            raise RuntimeError(
+                f"Robot {robot}: gap with vertex {self.vertices[vertex]} not found."
+            ) from None
+
+    def _add(self, robot, vertex, side):
+        if self._size == len(self.gap_robot):
+            self._grow(max(2 * self._size, 64))
+        slot = self._size
+        self._size += 1
+        self.gap_robot[slot] = robot
+        self.gap_vertex[slot] = vertex
+        self.gap_side[slot] = side
+        self.gap_id[slot] = self._next_id[robot]
+        self.gap_alive[slot] = True
+        self._next_id[robot] += 1
+        self._slots.setdefault((robot, vertex), []).append(slot)
+
+    def _remove(self, slot):
+        self.gap_alive[slot] = False
+        self._dead += 1
+        self._unindex(slot)
+
+    def _move(self, robot, old, new):
+        slot = self._find(robot, old)
+        self._unindex(slot)
+        self.gap_vertex[slot] = new
+        # Slots are handed out in order of appearance, and keep it
+        insort(self._slots.setdefault((robot, new), []), slot)
+
+    def _unindex(self, slot):
+        key = (int(self.gap_robot[slot]), int(self.gap_vertex[slot]))
+        at_vertex = self._slots[key]
+        at_vertex.remove(slot)
+        if not at_vertex:
+            del self._slots[key]
+
+    def _grow(self, capacity):
+        for name in ("gap_robot", "gap_vertex", "gap_side", "gap_id", "gap_alive"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _compact(self):
+        """Drop the slots of gaps that have gone."""
+        keep = np.flatnonzero(self.gap_alive[:self._size])
+        for name in ("gap_robot", "gap_vertex", "gap_side", "gap_id", "gap_alive"):
+            setattr(self, name, getattr(self, name)[keep])
+        self._size = len(keep)
+        self._dead = 0
+        self._slots = {}
+        for slot, key in enumerate(zip(self.gap_robot.tolist(), self.gap_vertex.tolist())):
+            self._slots.setdefault(key, []).append(slot)
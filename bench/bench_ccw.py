@@ -0,0 +1,109 @@
+"""Benchmark ccw() against the normalized predicate it replaced.
+
+Usage:
+    python -m bench.bench_ccw [--calls N] [--repeat R] [--no-builds] [--maps GLOB]
+
+Times single calls on a mix of random, collinear, near-threshold and small
+integer lattice triples, checks that both predicates classify every triple
+the same, and then times an eager Environment.build of each map in
+environments/ with ccw swapped back to the old predicate and as it is.
+"""
+
+import argparse
+import random
+import sys
+from math import sqrt
+
+from pyvisgraph import visible_vertices
+from pyvisgraph.classes import Point
+from pyvisgraph.visible_vertices import ccw, T_ccw, CCW, CW
+from bench.common import sample_maps, best_of, print_builds
+
+
+def ccw_baseline(A, B, C):
+    """ccw() before the squared-cross-product filter."""
+    v_AB = [(B.x - A.x), (B.y - A.y)]
+    v_AC = [(C.x - A.x), (C.y - A.y)]
+    n_AB = sqrt(v_AB[0] ** 2 + v_AB[1] ** 2)
+    n_AC = sqrt(v_AC[0] ** 2 + v_AC[1] ** 2)
+    if n_AB == 0 or n_AC == 0:
+        return 0
+
+    area = float(v_AB[0] * v_AC[1] - v_AB[1] * v_AC[0])
+    collinear_coef = area / n_AB / n_AC
+
+    if collinear_coef > T_ccw:
+        return CCW
+    elif collinear_coef < -T_ccw:
+        return CW
+    else:
+        return 0
+
+
+def triples(n, seed=0):
+    """n triples: 30% random, 30% collinear, 30% within 1e-6 of the T_ccw
+    threshold, 10% small integer lattice points with repeats."""
+    rng = random.Random(seed)
+    result = []
+    for k in range(n):
+        kind = k % 10
+        a = Point(rng.uniform(-100, 100), rng.uniform(-100, 100))
+        if kind < 3:
+            b = Point(rng.uniform(-100, 100), rng.uniform(-100, 100))
+            c = Point(rng.uniform(-100, 100), rng.uniform(-100, 100))
+        elif kind < 6:
+            dx, dy = rng.uniform(-10, 10), rng.uniform(-10, 10)
+            t = rng.uniform(-5, 5)
+            b, c = Point(a.x + dx, a.y + dy), Point(a.x + t * dx, a.y + t * dy)
+        elif kind < 9:
+            dx, dy = rng.uniform(-10, 10), rng.uniform(-10, 10)
+            n_ab = sqrt(dx * dx + dy * dy)
+            # Offset c from the line AB so the normalized cross product is
+            # T_ccw, give or take a relative 1e-6
+            s = rng.uniform(1, 5)
+            off = T_ccw * s * (1 + rng.uniform(-1e-6, 1e-6)) * rng.choice((-1, 1))
+            b = Point(a.x + dx, a.y + dy)
+            c = Point(a.x + s * dx - off * dy / n_ab, a.y + s * dy + off * dx / n_ab)
+        else:
+            a, b, c = (Point(rng.randint(0, 3), rng.randint(0, 3)) for _ in range(3))
+        result.append((a, b, c))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200000,
+                        help="triples in the microbenchmark (default 200000)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="best of this many runs (default 5; builds use 1)")
+    parser.add_argument("--no-builds", action="store_true",
+                        help="skip the environment builds")
+    parser.add_argument("--maps", default="*.svg",
+                        help="glob of the maps in environments/ to build (default *.svg)")
+    args = parser.parse_args()
+
+    data = triples(args.calls)
+    mismatches = sum(ccw_baseline(*t) != ccw(*t) for t in data)
+    print(f"{len(data)} triples, {mismatches} classified differently")
+
+    def loop(fn):
+        return lambda: [fn(a, b, c) for a, b, c in data]
+
+    before = best_of(loop(ccw_baseline), args.repeat) / len(data)
+    after = best_of(loop(ccw), args.repeat) / len(data)
+    print(f"per call: baseline {before * 1e9:.0f} ns, current {after * 1e9:.0f} ns, "
+          f"{before / after:.2f}x")
+
+    if not args.no_builds:
+        # Every module that imported ccw by name gets the baseline too
+        owners = [m for name, m in list(sys.modules.items())
+                  if name.split(".")[0] in ("pyvisgraph", "backend")
+                  and getattr(m, "ccw", None) is ccw]
+        assert visible_vertices in owners
+        print_builds(sample_maps(args.maps),
+                     [(m, "ccw", ccw_baseline) for m in owners], repeat=1)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Benchmark Point/Edge hashing against the XOR hashes they replaced.
+
+Usage:
+    python -m bench.bench_hashing [--size N] [--repeat R] [--no-builds] [--maps GLOB]
+
+Measures dict and set throughput on a symmetric N x N lattice of Points and
+the edges between lattice neighbours, where XOR hashing collides mirrored
+points, zeroes the diagonal and cancels shared coordinates of edges. Then
+times an eager Environment.build of each map in environments/ with the XOR
+hashes patched back in, and as it is.
+"""
+
+import argparse
+import sys
+
+from pyvisgraph.classes import Point, Edge
+from bench.common import sample_maps, best_of, patched, print_builds
+
+
+def point_hash_baseline(self):
+    return self.x.__hash__() ^ self.y.__hash__()
+
+
+def edge_hash_baseline(self):
+    return self.p1.__hash__() ^ self.p2.__hash__()
+
+
+BASELINE = [(Point, "__hash__", point_hash_baseline), (Edge, "__hash__", edge_hash_baseline)]
+
+
+def lattice(size):
+    """Points of the size x size integer lattice, as floats, and the edges
+    between horizontal and vertical neighbours."""
+    grid = [[Point(float(i), float(j)) for j in range(size)] for i in range(size)]
+    points = [p for row in grid for p in row]
+    edges = [Edge(grid[i][j], grid[i + di][j + dj])
+             for i in range(size) for j in range(size)
+             for di, dj in ((1, 0), (0, 1)) if i + di < size and j + dj < size]
+    return points, edges
+
+
+def throughput(size, repeat):
+    """Return [(operation, ops per second)] on the lattice."""
+    points, edges = lattice(size)
+    copies = [Point(p.x, p.y) for p in points]
+    reversed_edges = [Edge(e.p2, e.p1) for e in edges]
+    table = {p: p for p in points}
+    edge_set = set(edges)
+    cases = [
+        ("point dict build", len(points), lambda: {p: p for p in points}),
+        ("point lookup (same object)", len(points), lambda: [table[p] for p in points]),
+        ("point lookup (equal copy)", len(copies), lambda: [table[p] for p in copies]),
+        ("edge set build", len(edges), lambda: set(edges)),
+        ("edge lookup (reversed copy)", len(edges),
+         lambda: [e in edge_set for e in reversed_edges]),
+    ]
+    return [(name, n / best_of(fn, repeat)) for name, n, fn in cases]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=60,
+                        help="lattice side (default 60)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="best of this many runs (default 3; builds use 1)")
+    parser.add_argument("--no-builds", action="store_true",
+                        help="skip the environment builds")
+    parser.add_argument("--maps", default="*.svg",
+                        help="glob of the maps in environments/ to build (default *.svg)")
+    args = parser.parse_args()
+
+    # Tables are built inside each run, so the patched hash is the one used
+    with patched(*BASELINE):
+        before = throughput(args.size, args.repeat)
+    after = throughput(args.size, args.repeat)
+    print(f"{args.size}x{args.size} lattice, k ops/s")
+    print(f"{'operation':<30} {'baseline':>9} {'current':>9}")
+    for (name, b), (_, a) in zip(before, after):
+        print(f"{name:<30} {b / 1e3:9.0f} {a / 1e3:9.0f}")
+
+    if not args.no_builds:
+        print_builds(sample_maps(args.maps), BASELINE, repeat=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
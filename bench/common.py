@@ -0,0 +1,66 @@
+"""Helpers shared by the benchmark scripts in bench/."""
+
+import glob
+import os
+import time
+from contextlib import contextmanager
+
+from pyvisgraph.classes import Point
+from backend import Environment
+from utils.svg_utils import parse_svg_env_file
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def sample_maps(pattern="*.svg"):
+    """Return {name: [(x, y), ...]}: the wall of each map in environments/
+    matching pattern. SVGs without an 'env' polygon are skipped."""
+    maps = {}
+    for path in sorted(glob.glob(os.path.join(ROOT, "environments", pattern))):
+        try:
+            maps[os.path.basename(path)] = parse_svg_env_file(path)["env_polygon_points"]
+        except ValueError:
+            continue
+    return maps
+
+
+def best_of(fn, repeat):
+    """Smallest wall time of repeat calls of fn, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def time_build(wall, repeat=1):
+    """Best time of an eager Environment.build of the wall."""
+    def build():
+        Environment().build([[Point(x, y) for x, y in wall]], status=False, eager=True)
+    return best_of(build, repeat)
+
+
+@contextmanager
+def patched(*patches):
+    """Set each (owner, name, value) for the duration of the block."""
+    saved = [(owner, name, owner.__dict__[name]) for owner, name, _ in patches]
+    try:
+        for owner, name, value in patches:
+            setattr(owner, name, value)
+        yield
+    finally:
+        for owner, name, value in saved:
+            setattr(owner, name, value)
+
+
+def print_builds(maps, baseline, repeat):
+    """Print build times of every map with and without the baseline patches."""
+    if maps:
+        time_build(next(iter(maps.values())))  # warm up imports and caches
+    print(f"{'map':<22} {'baseline':>9} {'current':>9} {'speedup':>8}")
+    for name, wall in maps.items():
+        with patched(*baseline):
+            before = time_build(wall, repeat)
+        after = time_build(wall, repeat)
+        print(f"{name:<22} {before:8.2f}s {after:8.2f}s {before / after:7.2f}x")
@@ -5,7 +5,7 @@ from numpy import array
 
 from utils.utils import *
 import pyvisgraph as vg
-from pyvisgraph.visible_vertices import intersect_point, edge_distance
+from pyvisgraph.visible_vertices import edge_distance
 
 gameDisplay = None
 display_width = 1600
@@ -102,34 +102,7 @@ def draw_text(mode_txt, color, size, x, y):
 
 
 def _compute_shadow_endpoint(robot_pos, gap_vertex, graph):
-    dx = gap_vertex.x - robot_pos.x
-    dy = gap_vertex.y - robot_pos.y
-    length = math.sqrt(dx * dx + dy * dy)
-    if length == 0:
-        return None, None
-    far = vg.Point(gap_vertex.x + dx / length * 3000,
-                   gap_vertex.y + dy / length * 3000)
-    min_dist = float('inf')
-    nearest = None
-    hit_edge = None
-    for edge in graph.get_edges():
-        if gap_vertex in edge:
-            continue
-        p = intersect_point(gap_vertex, far, edge)
-        if p is None:
-            continue
-        if not (min(edge.p1.x, edge.p2.x) - 1 <= p.x <= max(edge.p1.x, edge.p2.x) + 1):
-            continue
-        if not (min(edge.p1.y, edge.p2.y) - 1 <= p.y <= max(edge.p1.y, edge.p2.y) + 1):
-            continue
-        if (p.x - gap_vertex.x) * dx + (p.y - gap_vertex.y) * dy <= 0:
-            continue
-        d = edge_distance(gap_vertex, p)
-        if d < min_dist:
-            min_dist = d
-            nearest = p
-            hit_edge = edge
-    return nearest, hit_edge
+    return graph.first_hit(gap_vertex, gap_vertex - robot_pos, exclude=(gap_vertex,))
 
 
 def _build_shadow_graph(graph, shadow_insertions):
@@ -167,14 +140,17 @@ def _trace_invisible_area(gap, shadow_pt, next_pt, prev_pt, max_steps=5000):
     return vertices
 
 
-def draw_invisible_areas(robot, graph):
+def draw_invisible_areas(robot, graph, visibility=None):
     global gameDisplay
     if robot is None or not robot.gaps:
         return
 
+    # Shadow points of a VisibilityPolygon of robot.pos save a ray per gap
+    shadows = visibility.shadows if visibility is not None else {}
     shadow_info = []
     for gap in robot.gaps:
-        shadow_pt, hit_edge = _compute_shadow_endpoint(robot.pos, gap.vertex, graph)
+        shadow_pt, hit_edge = shadows.get(gap.vertex) or _compute_shadow_endpoint(
+            robot.pos, gap.vertex, graph)
         if shadow_pt is not None and hit_edge is not None:
             shadow_info.append((gap, shadow_pt, hit_edge))
     if not shadow_info:
@@ -5,6 +5,7 @@ import pygame
 
 import pyvisgraph as vg
 from backend import Environment, Robot
+from backend.event_sinks import PrintSink
 from frontend.display import (
     init_game_display, draw_polygon, draw_edges, draw_edges_side,
     draw_vertices, draw_gap_sensor, draw_text, draw_invisible_areas,
@@ -57,9 +58,10 @@ class Simulator:
             return
         close_edge = vg.Edge(self.work_polygon[-1], self.work_polygon[0])
         if not self._edge_crosses_existing(close_edge, close_edge=True):
-            self.polygons.append(self.work_polygon)
+            self.env.add_polygon(self.work_polygon)
             self.work_polygon = []
-            self.build()
+            self.polygons = self.env.polygon_graph.polygons
+            self.built = True
         else:
             print("ERROR: Edge cross!")
 
@@ -67,8 +69,8 @@ class Simulator:
         if self.work_polygon:
             self.work_polygon.pop()
         elif self.polygons:
-            self.polygons.pop()
-            self.build()
+            self.env.remove_polygon(len(self.polygons) - 1)
+            self.polygons = self.env.polygon_graph.polygons
 
     def clear_all(self):
         self.__init__()
@@ -104,7 +106,7 @@ class Simulator:
         else:
             self.path.append(point)
             _write_path_csv(point)
-            self.robot = Robot(self.env, point)
+            self.robot = Robot(self.env, point, sink=PrintSink())
 
     def _clear_path(self):
         self.path = []
@@ -272,7 +274,8 @@ def game_loop():
             for poly in sim.polygons[1:]:
                 draw_polygon(poly, gray, 3)
 
-        if sim.built and sim.show_static_visgraph:
+        # Draw mode only needs the polygons; the graphs are built on leaving it
+        if sim.built and sim.show_static_visgraph and not sim.mode_draw:
             draw_edges_side(sim.env.bitangent_comp.get_edges(), c_matlab[0], c_matlab[1], 2)
             draw_edges_side(sim.env.extension.get_edges(), lightblue, lightred, 1)
             draw_edges(sim.env.visibility_graph.get_edges(), lightgreen, 1)
@@ -294,7 +297,8 @@ def game_loop():
                 )
 
         if sim.robot and sim.built:
-            draw_invisible_areas(sim.robot, sim.env.polygon_graph)
+            # The robot sweeps once per position, not once per frame
+            draw_invisible_areas(sim.robot, sim.env.polygon_graph, sim.robot.visibility)
 
         draw_gap_sensor(sim.robot)
 
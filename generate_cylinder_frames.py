@@ -10,6 +10,7 @@ accumulated up to that point in time.
 """
 
 import argparse
+import math
 import os
 import shutil
 import time
@@ -20,9 +21,7 @@ import pyvista as pv
 from tqdm import tqdm
 
 from backend.environment import Environment
-from backend.gap import GapEventType
 from backend.robot import Robot
-from pyvisgraph import CCW, CW
 from pyvisgraph.classes import Edge, Point
 from utils.svg_utils import interpolate_path, parse_svg_env_file
 
@@ -67,83 +66,24 @@ WINDOW_SIZE = (3840, 2160)
 # ---------------------------------------------------------------------------
 
 class TrackedRobot(Robot):
-    """Robot subclass that assigns stable IDs to gaps and records history.
-
-    Overrides _apply_event to intercept vertex-changing events (N/P) and
-    appearance/disappearance events (A/D/S/M) so that each gap retains a
-    stable integer ID across the full trajectory.
-    """
-
-    def __init__(self, env, pos):
-        self._next_id = 0
-        self._vertex_to_id = {}
-        super().__init__(env, pos)
-        for gap in self.gaps:
-            self._alloc_id(gap.vertex)
-
-    def _alloc_id(self, vertex):
-        gid = self._next_id
-        self._next_id += 1
-        self._vertex_to_id[vertex] = gid
-        return gid
-
-    def _apply_event(self, event):
-        etype = event.etype
-        edge = event.edge
-        graph = self.env.polygon_graph
-
-        # --- update vertex-to-id mapping BEFORE parent mutates gap list ---
-        if etype == GapEventType.N:
-            if edge.side == CCW:
-                old_v, new_v = edge.p1, graph.get_next_point(edge.p1)
-            else:
-                old_v, new_v = graph.get_prev_point(edge.p1), edge.p1
-            gid = self._vertex_to_id.pop(old_v, None)
-            if gid is not None:
-                self._vertex_to_id[new_v] = gid
-
-        elif etype == GapEventType.P:
-            if edge.side == CW:
-                old_v, new_v = edge.p1, graph.get_prev_point(edge.p1)
-            else:
-                old_v, new_v = graph.get_next_point(edge.p1), edge.p1
-            gid = self._vertex_to_id.pop(old_v, None)
-            if gid is not None:
-                self._vertex_to_id[new_v] = gid
-
-        elif etype == GapEventType.D:
-            self._vertex_to_id.pop(edge.p1, None)
-
-        elif etype == GapEventType.M:
-            self._vertex_to_id.pop(edge.dual.p1, None)
-
-        result = super()._apply_event(event)
-
-        # --- register newly created gaps AFTER parent appends them ---
-        if etype == GapEventType.A:
-            if edge.p1 not in self._vertex_to_id:
-                self._alloc_id(edge.p1)
-
-        elif etype == GapEventType.S:
-            if edge.dual.p1 not in self._vertex_to_id:
-                self._alloc_id(edge.dual.p1)
-
-        return result
+    """Robot that reports its gap directions by stable gap ID."""
 
     def current_gap_angles(self):
         """Return dict {gap_id: angle_rad} for all currently visible gaps."""
         result = {}
         for gap in self.gaps:
-            gid = self._vertex_to_id.get(gap.vertex)
-            if gid is not None:
-                angle = np.arctan2(float(gap.dir[1]), float(gap.dir[0]))
-                result[gid] = angle
+            angle = np.arctan2(float(gap.dir[1]), float(gap.dir[0]))
+            result[gap.id] = angle
         return result
 
 
-def run_simulation(svg_path):
+def run_simulation(svg_path, substeps=1, cache_dir=None):
     """Parse SVG, build environment, run TrackedRobot; return gap histories.
 
+    Each path segment is sampled at substeps evenly spaced points, the last
+    at its end, from the closed-form gap bearings of sample_gap_angles.
+    cache_dir is passed on to Environment.build.
+
     Returns
     -------
     histories : dict {gap_id: [(step, angle_rad), ...]}
@@ -157,13 +97,14 @@ def run_simulation(svg_path):
     print("Building environment ...")
     wall = [Point(x, y) for x, y in svg_data["env_polygon_points"]]
     env = Environment()
-    env.build([wall], status=True)
+    env.build([wall], status=True, cache_dir=cache_dir)
 
     print(f"Interpolating {N_PATH_POINTS} path points ...")
     path_pts = interpolate_path(svg_data["path_points"], N_PATH_POINTS)
 
     print("Simulating robot ...")
     robot = TrackedRobot(env, Point(*path_pts[0]))
+    event_table = env.gap_events_along_polyline(path_pts)
     histories = {}
 
     def record(step):
@@ -171,11 +112,18 @@ def run_simulation(svg_path):
             histories.setdefault(gid, []).append((step, angle))
 
     record(0)
+    ts = np.arange(1, substeps + 1) / substeps
     for i in tqdm(range(1, len(path_pts))):
-        robot.move(Edge(Point(*path_pts[i - 1]), Point(*path_pts[i])))
-        record(i)
+        gap_ids, angles = robot.sample_gap_angles(
+            Edge(Point(*path_pts[i - 1]), Point(*path_pts[i])), ts,
+            event_table.events(i - 1))
+        for j, row in enumerate(angles):
+            step = (i - 1) * substeps + j + 1
+            for gid, angle in zip(gap_ids.tolist(), row.tolist()):
+                if not math.isnan(angle):
+                    histories.setdefault(gid, []).append((step, angle))
 
-    return histories, len(path_pts) - 1
+    return histories, (len(path_pts) - 1) * substeps
 
 
 # ---------------------------------------------------------------------------
@@ -324,8 +272,9 @@ def render_frame(histories, max_step, total_steps, output_path,
 # ---------------------------------------------------------------------------
 
 def generate_cylinder_frames(svg_path, stride=10, final_only=False,
-                              window_size=WINDOW_SIZE, workers=None):
-    histories, total_steps = run_simulation(svg_path)
+                              window_size=WINDOW_SIZE, workers=None, substeps=1,
+                              cache_dir=None):
+    histories, total_steps = run_simulation(svg_path, substeps, cache_dir)
 
     base = os.path.splitext(os.path.abspath(svg_path))[0]
     out_dir = base + "_cylinder_frames"
@@ -379,6 +328,13 @@ if __name__ == "__main__":
                         help="Output resolution as WxH (default 3840x2160)")
     parser.add_argument("--workers", type=int, default=None,
                         help="Number of parallel render workers (default: all CPUs)")
+    parser.add_argument("--substeps", type=int, default=1,
+                        help="Gap angle samples per path segment (default 1)")
+    parser.add_argument("--cache-dir", default="environments/cache",
+                        help="Directory of compiled environments reused between runs "
+                             "(default environments/cache)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always build the environment, without reading or writing the cache")
     args = parser.parse_args()
 
     w, h = (int(v) for v in args.window_size.split("x"))
@@ -388,4 +344,6 @@ if __name__ == "__main__":
         final_only=args.final_only,
         window_size=(w, h),
         workers=args.workers,
+        substeps=args.substeps,
+        cache_dir=None if args.no_cache else args.cache_dir,
     )
@@ -38,6 +38,7 @@ from tqdm import tqdm
 
 from backend.environment import Environment
 from backend.robot import Robot
+from backend.event_sinks import PrintSink
 from pyvisgraph.classes import Point, Edge
 from utils.svg_utils import (
     parse_svg_env_file,
@@ -61,7 +62,7 @@ VIEW_ELEV = 31.4
 
 
 def _build_env(polygon_points, extra_points=(), is_obstacle=False, margin=20.0,
-               status=False):
+               status=False, cache_dir=None):
     """Build Environment from a list of (x, y) tuples.
 
     When is_obstacle=True the polygon is treated as an obstacle (infeasible
@@ -73,6 +74,9 @@ def _build_env(polygon_points, extra_points=(), is_obstacle=False, margin=20.0,
     extra_points is an iterable of (x, y) pairs included in the bounding-box
     computation (e.g. the robot path points) so the synthetic wall is
     guaranteed to contain the whole trajectory.
+
+    cache_dir, if given, is passed on to Environment.build to reuse
+    compiled environments between runs.
     """
     polygon = [Point(x, y) for x, y in polygon_points]
     env = Environment()
@@ -84,15 +88,16 @@ def _build_env(polygon_points, extra_points=(), is_obstacle=False, margin=20.0,
         y0, y1 = min(ys) - margin, max(ys) + margin
         synthetic_wall = [Point(x0, y0), Point(x1, y0),
                           Point(x1, y1), Point(x0, y1)]
-        env.build([synthetic_wall, polygon], status=status)
+        env.build([synthetic_wall, polygon], status=status, cache_dir=cache_dir)
     else:
-        env.build([polygon], status=status)
+        env.build([polygon], status=status, cache_dir=cache_dir)
     return env
 
 
 def generate_frames(svg_path, show_frame_number=False, show_event_lines=False,
                     generate_vgm=False, n_arrows=2000, n_fine=5000, dist_tol=3.0,
-                    is_obstacle=False, margin=20.0, show_shadow=True):
+                    is_obstacle=False, margin=20.0, show_shadow=True,
+                    print_events=False, cache_dir=None):
     """Parse *svg_path* once, then write all frame types per path point."""
     env_path_id = 'obstacle' if is_obstacle else 'env'
     print(f"Parsing {svg_path} ...")
@@ -104,7 +109,8 @@ def generate_frames(svg_path, show_frame_number=False, show_event_lines=False,
     print("Building environment ...")
     path_pts_raw = svg_data['path_points']
     env = _build_env(svg_data['env_polygon_points'], extra_points=path_pts_raw,
-                     is_obstacle=is_obstacle, margin=margin, status=True)
+                     is_obstacle=is_obstacle, margin=margin, status=True,
+                     cache_dir=cache_dir)
     polygon_graph = env.polygon_graph
 
     print(f"Interpolating {N_PATH_POINTS} points along path ...")
@@ -159,14 +165,19 @@ def generate_frames(svg_path, show_frame_number=False, show_event_lines=False,
         print(f"Event lines SVG: {el_path}")
 
     print("Generating frames ...")
-    robot = Robot(env, Point(*path_pts[0]))
+    robot = Robot(env, Point(*path_pts[0]),
+                  sink=PrintSink() if print_events else None)
+    event_table = env.gap_events_along_polyline(path_pts)
     for i, (px, py) in enumerate(path_pts): #enumerate(tqdm(path_pts))
         print(f"Frame {i:04d} / {N_PATH_POINTS}  pos=({px:.4f}, {py:.4f})")
         if i > 0:
-            robot.move(Edge(Point(*path_pts[i - 1]), Point(px, py)))
+            robot.move(Edge(Point(*path_pts[i - 1]), Point(px, py)),
+                       event_table.events(i - 1))
 
         gaps = robot.gaps
         try:
+            # The robot moves every frame, and a ray per gap is cheaper
+            # than a fresh visibility sweep
             shadow_polys = compute_shadow_polygons(robot.pos, gaps, polygon_graph)
         except Exception:
             shadow_polys = []
@@ -272,9 +283,17 @@ if __name__ == '__main__':
                         help='margin around the bounding box for the synthetic wall (default 20.0)')
     parser.add_argument('--no-shadow', action='store_true',
                         help='omit shadow (hidden-area) polygons from the frame SVGs')
+    parser.add_argument('--print-events', action='store_true',
+                        help='print each gap event the robot processes')
+    parser.add_argument('--cache-dir', default='environments/cache',
+                        help='directory of compiled environments reused between runs '
+                             '(default environments/cache)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='always build the environment, without reading or writing the cache')
     args = parser.parse_args()
     generate_frames(args.svg_file, show_frame_number=args.frame_number,
                     show_event_lines=args.event_lines, generate_vgm=args.vgm_lift,
                     n_arrows=args.n_arrows, n_fine=args.n_fine, dist_tol=args.dist_tol,
                     is_obstacle=args.obstacle, margin=args.margin,
-                    show_shadow=not args.no_shadow)
+                    show_shadow=not args.no_shadow, print_events=args.print_events,
+                    cache_dir=None if args.no_cache else args.cache_dir)
@@ -1,4 +1,4 @@
-from pyvisgraph.classes import Point, Edge
+from pyvisgraph.classes import Point, Edge, PointPool, VisibilityPolygon
 from pyvisgraph.graph import PolygonGraph
 from pyvisgraph.vis_graph import VisGraph
 from pyvisgraph.visible_vertices import CW, CCW, edge_distance, ccw, edge_cross_point
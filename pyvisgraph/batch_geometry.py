@@ -0,0 +1,205 @@
+"""Array versions of the geometric predicates in visible_vertices.
+
+Points are float arrays of shape (..., 2) holding (x, y) and edges are arrays
+of shape (..., 4) holding (p1.x, p1.y, p2.x, p2.y); inputs broadcast against
+each other, so one segment can be tested against M edges, or K points (as a
+(K, 1, 2) array) against M edges, in a single call. Each function performs
+the same float operations as its scalar counterpart, so the results agree
+with ccw, intersect_point, on_segment, edge_cross_point and polygon_crossing
+bit for bit.
+"""
+
+import numpy as np
+
+from pyvisgraph.classes import Point
+from pyvisgraph.visible_vertices import INF, CCW, CW, T_ccw, T_on_segment
+
+
+def points_to_array(points):
+    """Return an (N, 2) array of the coordinates of points."""
+    return np.array([(p.x, p.y) for p in points], dtype=float).reshape(-1, 2)
+
+
+def as_point_array(points):
+    """Return points, a list of Points or (x, y) pairs or an array, as an
+    (N, 2) float array; an array of that shape is returned as is."""
+    if isinstance(points, np.ndarray):
+        return np.asarray(points, float).reshape(-1, 2)
+    return np.array([(p.x, p.y) if isinstance(p, Point) else p for p in points],
+                    dtype=float).reshape(-1, 2)
+
+
+def edges_to_array(edges):
+    """Return an (M, 4) array of the endpoint coordinates of edges."""
+    return np.array(
+        [(e.p1.x, e.p1.y, e.p2.x, e.p2.y) for e in edges], dtype=float
+    ).reshape(-1, 4)
+
+
+def ccw_array(a, b, c):
+    """Array version of ccw(): 1 if counter clockwise, -1 if clockwise, 0 if
+    collinear or if a coincides with b or c."""
+    a, b, c = np.asarray(a, float), np.asarray(b, float), np.asarray(c, float)
+    abx = b[..., 0] - a[..., 0]
+    aby = b[..., 1] - a[..., 1]
+    acx = c[..., 0] - a[..., 0]
+    acy = c[..., 1] - a[..., 1]
+    n_AB = np.sqrt(abx * abx + aby * aby)
+    n_AC = np.sqrt(acx * acx + acy * acy)
+    area = abx * acy - aby * acx
+    with np.errstate(divide="ignore", invalid="ignore"):
+        collinear_coef = area / n_AB / n_AC
+    result = np.zeros(collinear_coef.shape, dtype=np.int8)
+    result[collinear_coef > T_ccw] = CCW
+    result[collinear_coef < -T_ccw] = CW
+    result[(n_AB == 0) | (n_AC == 0)] = 0
+    return result
+
+
+def intersect_points(p1, p2, edges):
+    """Array version of intersect_point(): where the line through p1, p2
+    intersects the line of each edge. Rows with no intersection (parallel
+    lines) are NaN."""
+    p1, p2, edges = np.asarray(p1, float), np.asarray(p2, float), np.asarray(edges, float)
+    p1x, p1y = p1[..., 0], p1[..., 1]
+    p2x, p2y = p2[..., 0], p2[..., 1]
+    e1x, e1y, e2x, e2y = edges[..., 0], edges[..., 1], edges[..., 2], edges[..., 3]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pslope = (p1y - p2y) / (p1x - p2x)
+        eslope = (e1y - e2y) / (e1x - e2x)
+        # General case
+        x = (eslope * e1x - pslope * p1x + p1y - e1y) / (eslope - pslope)
+        y = eslope * (x - e1x) + e1y
+        x, y = np.broadcast_arrays(x, y)
+        x, y = x.copy(), y.copy()
+        x[pslope == eslope] = np.nan
+        # Vertical path line
+        p_vertical = np.broadcast_to(p1x == p2x, x.shape)
+        x = np.where(p_vertical, p1x, x)
+        y = np.where(p_vertical, eslope * (p1x - e1x) + e1y, y)
+        # Vertical edge
+        e_vertical = np.broadcast_to(e1x == e2x, x.shape)
+        x = np.where(e_vertical, np.where(p_vertical, np.nan, e1x), x)
+        y = np.where(e_vertical, pslope * (e1x - p1x) + p1y, y)
+    y = np.where(np.isnan(x), np.nan, y)
+
+    # An endpoint of the path line on the edge is returned as is
+    p2_in = ((p2x == e1x) & (p2y == e1y)) | ((p2x == e2x) & (p2y == e2y))
+    x = np.where(p2_in, p2x, x)
+    y = np.where(p2_in, p2y, y)
+    p1_in = ((p1x == e1x) & (p1y == e1y)) | ((p1x == e2x) & (p1y == e2y))
+    x = np.where(p1_in, p1x, x)
+    y = np.where(p1_in, p1y, y)
+    return np.stack((x, y), axis=-1)
+
+
+def on_segments(p, q, r, check_collinear=True):
+    """Array version of on_segment(): whether q lies on segment pr."""
+    p, q, r = np.asarray(p, float), np.asarray(q, float), np.asarray(r, float)
+    px, py, qx, qy, rx, ry = p[..., 0], p[..., 1], q[..., 0], q[..., 1], r[..., 0], r[..., 1]
+    in_x = (qx <= np.maximum(px, rx) + T_on_segment) & (qx >= np.minimum(px, rx) - T_on_segment)
+    in_y = (qy <= np.maximum(py, ry) + T_on_segment) & (qy >= np.minimum(py, ry) - T_on_segment)
+    result = np.where(px == rx, in_y, np.where(py == ry, in_x, in_x & in_y))
+    if check_collinear:
+        result &= ccw_array(p, q, r) == 0
+    return result
+
+
+def edge_cross_points(p1, p2, edges):
+    """Array version of edge_cross_point() for the segment p1-p2 against each
+    edge. Returns (points, hit): the crossing points and a boolean mask of
+    the rows where the segments actually cross."""
+    edges = np.asarray(edges, float)
+    pts = intersect_points(p1, p2, edges)
+    hit = ~np.isnan(pts[..., 0])
+    hit &= on_segments(p1, pts, p2, check_collinear=False)
+    hit &= on_segments(edges[..., 0:2], pts, edges[..., 2:4], check_collinear=False)
+    return pts, hit
+
+
+def edge_intersects(p1, q1, edges):
+    """Array version of edge_intersect(): whether segment p1-q1 intersects each edge."""
+    edges = np.asarray(edges, float)
+    p2, q2 = edges[..., 0:2], edges[..., 2:4]
+    o1 = ccw_array(p1, q1, p2)
+    o2 = ccw_array(p1, q1, q2)
+    o3 = ccw_array(p2, q2, p1)
+    o4 = ccw_array(p2, q2, q1)
+    return (
+        ((o1 != o2) & (o3 != o4))
+        | ((o1 == 0) & on_segments(p1, p2, q1))
+        | ((o2 == 0) & on_segments(p1, q2, q1))
+        | ((o3 == 0) & on_segments(p2, p1, q2))
+        | ((o4 == 0) & on_segments(p2, q1, q2))
+    )
+
+
+def polygon_crossings(points, poly_edges):
+    """Array version of polygon_crossing(): for each of the (K, 2) points,
+    whether it is internal to the polygon whose edges are the (M, 4) array
+    poly_edges."""
+    point_idx, _ = crossing_pairs(points, poly_edges)
+    counts = np.bincount(point_idx, minlength=len(np.reshape(points, (-1, 2))))
+    return counts % 2 == 1
+
+
+def crossing_pairs(points, edges, chunk_size=1024):
+    """Return (point_idx, edge_idx) for every (point, edge) pair where the
+    crossings test of polygon_crossing() counts the edge for the point.
+
+    Pairs that polygon_crossing() skips on its bounding checks are dropped
+    before any orientation test, so the cost follows the number of edges
+    level with each point rather than K * M.
+    """
+    points = np.asarray(points, float).reshape(-1, 2)
+    edges = np.asarray(edges, float).reshape(-1, 4)
+    e1x, e1y, e2x, e2y = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+    point_parts, edge_parts = [], []
+    for start in range(0, len(points), chunk_size):
+        px = points[start:start + chunk_size, 0, None]
+        py = points[start:start + chunk_size, 1, None]
+        candidate = ~(
+            ((py < e1y) & (py < e2y))
+            | ((py > e1y) & (py > e2y))
+            | ((px > e1x) & (px > e2x))
+        )
+        i, k = np.nonzero(candidate)
+        crosses = _crosses(points[start + i], edges[k])
+        point_parts.append(start + i[crosses])
+        edge_parts.append(k[crosses])
+    if not point_parts:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    return np.concatenate(point_parts), np.concatenate(edge_parts)
+
+
+def _crosses(p1, edges):
+    """Per row, whether polygon_crossing() counts the edge for point p1."""
+    e1, e2 = edges[:, 0:2], edges[:, 2:4]
+    p2 = np.stack((np.full(len(p1), float(INF)), p1[:, 1]), axis=-1)
+    # Deal with points collinear to p1
+    c1 = ccw_array(p1, e1, p2) == 0
+    c2 = ccw_array(p1, e2, p2) == 0
+    collinear_x = np.where(c1, edges[:, 0], edges[:, 2])
+    adjacent_y = np.where(c1, edges[:, 3], edges[:, 1])
+    return np.where(
+        c1 ^ c2,
+        (collinear_x > p1[:, 0]) & (adjacent_y > p1[:, 1]),
+        ~c1 & ~c2 & edge_intersects(p1, p2, edges),
+    )
+
+
+def closest_edge_points(p, edges):
+    """Vectorized first step of closest_point(): the point of each (M, 4) edge
+    closest to p, and its distance. Returns (points, distances)."""
+    edges = np.asarray(edges, float)
+    px, py = p[0], p[1]
+    e1x, e1y, e2x, e2y = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+    num = (px - e1x) * (e2x - e1x) + (py - e1y) * (e2y - e1y)
+    # float_power rounds like the scalar code's ** 2; power squares instead
+    denom = np.float_power(e2x - e1x, 2) + np.float_power(e2y - e1y, 2)
+    u = num / denom
+    x = np.where(u < 0, e1x, np.where(u > 1, e2x, e1x + u * (e2x - e1x)))
+    y = np.where(u < 0, e1y, np.where(u > 1, e2y, e1y + u * (e2y - e1y)))
+    d = np.sqrt(np.float_power(x - px, 2) + np.float_power(y - py, 2))
+    return np.stack((x, y), axis=-1), d
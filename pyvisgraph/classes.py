@@ -47,7 +47,9 @@ class Point(object):
         return "(%.2f, %.2f)" % (self.x, self.y)
 
     def __hash__(self):
-        return self.x.__hash__() ^ self.y.__hash__()
+        # Hash the pair: x ^ y would collide mirrored points and zero the
+        # whole diagonal y == x.
+        return hash((self.x, self.y))
 
     def __repr__(self):
         return "Point(%.2f, %.2f)" % (self.x, self.y)
@@ -127,7 +129,36 @@ class Edge(object):
         return "Edge({!r}, {!r})".format(self.p1, self.p2)
 
     def __hash__(self):
-        return self.p1.__hash__() ^ self.p2.__hash__()
+        # Symmetric, since edges compare equal either way round, but without
+        # XOR's cancellation of a shared coordinate (vertical and horizontal
+        # edges used to collide on their common x or y).
+        return hash(self.p1) + hash(self.p2)
+
+
+class PointPool(object):
+    """Interning table: equal Points map to one shared instance.
+
+    dict and set lookups compare identity before calling Point.__eq__, so
+    keys that share instances are found without any Python-level
+    comparison.
+    """
+
+    __slots__ = ("_points",)
+
+    def __init__(self, points=()):
+        self._points = {}
+        for point in points:
+            self.intern(point)
+
+    def intern(self, point):
+        """Return the pooled Point equal to point, adding point if it is new."""
+        return self._points.setdefault((point.x, point.y), point)
+
+    def __contains__(self, point):
+        return (point.x, point.y) in self._points
+
+    def __len__(self):
+        return len(self._points)
 
 
 
@@ -137,14 +168,14 @@ class Chain():
      
     Attributes:
         chain_id (int): The id of the chain
-        start (Point): The start point
-        end (Point): The end point
-        vertices (set): The set of all vertices in the chain
-        edges (set): The set of all edges in the chain
+        start (Point): The start point, None for a closed chain
+        end (Point): The end point, None for a closed chain
+        vertices (list): The vertices of the chain, from start to end
+        edges (list): The edges between consecutive vertices, in the same order
     """
     def __init__(self,chain_id,vertices,edges):
-        assert isinstance(vertices,set), "vertices must be a set"
-        assert isinstance(edges,set), "edges must be a set"
+        assert isinstance(vertices,list), "vertices must be a list"
+        assert isinstance(edges,list), "edges must be a list"
         self.chain_id = chain_id
         self.start = None
         self.end = None
@@ -152,7 +183,34 @@ class Chain():
         self.edges = edges
 
     def add_edges(self,edges):
-        self.edges.update(edges)
+        self.edges.extend(edges)
 
     def add_points(self,vertices):
-        self.vertices.update(vertices)
\ No newline at end of file
+        self.vertices.extend(vertices)
+
+class VisibilityPolygon(object):
+    __slots__ = ("origin", "vertices", "bitangents", "shadows")
+    """The region visible from a point, from one angular sweep.
+
+    Attributes:
+        origin (Point): the viewpoint
+        vertices (list): the boundary of the star-shaped visible region, in
+            increasing angle() around origin; polygon vertices and shadow
+            points where the view drops off a tangent vertex
+        bitangents (list): the visible bitangent vertices, as returned by
+            bitangent_lines(origin, graph)
+        shadows (dict): tangent vertex -> (Point, Edge), where the ray from
+            origin past that vertex lands on the boundary
+    """
+
+    def __init__(self, origin):
+        self.origin = origin
+        self.vertices = []
+        self.bitangents = []
+        self.shadows = {}
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def __iter__(self):
+        return iter(self.vertices)
@@ -0,0 +1,251 @@
+from collections import defaultdict
+from math import floor, sqrt
+
+import numpy as np
+
+from pyvisgraph.classes import Point
+from pyvisgraph.point_location import ranks, csr_ptr, expand_rows
+from pyvisgraph.visible_vertices import intersect_point, on_segment, edge_distance
+
+
+class EdgeGrid(object):
+    """Uniform grid over a set of edges for first-hit ray queries.
+
+    Each cell lists the edges whose segment passes through it. A ray query
+    walks the cells along the ray in order (Amanatides & Woo) and stops once
+    the closest hit so far lies before the cell being left, so it only tests
+    the edges near the ray instead of every edge.
+
+    Attributes:
+        edges (list): the indexed edges; the position is the tie-break order
+        cells (dict): (i, j) -> list of edge positions
+    """
+
+    def __init__(self, edges, edges_per_cell=2.0, max_cells=1 << 20):
+        self.edges = list(edges)
+        self.cells = defaultdict(list)
+        self._csr = None
+        if not self.edges:
+            self.x0 = self.y0 = 0.0
+            self.cell = 1.0
+            self.nx = self.ny = 0
+            self.diag = 1.0
+            return
+
+        xs = [p.x for e in self.edges for p in (e.p1, e.p2)]
+        ys = [p.y for e in self.edges for p in (e.p1, e.p2)]
+        width = max(max(xs) - min(xs), 1e-9)
+        height = max(max(ys) - min(ys), 1e-9)
+        n_cells = min(max(len(self.edges) / edges_per_cell, 1.0), max_cells)
+        self.cell = max(sqrt(width * height / n_cells), max(width, height) / 4096)
+        # Pad by half a cell so edges on the bounding box sit inside the grid
+        self.x0 = min(xs) - self.cell / 2
+        self.y0 = min(ys) - self.cell / 2
+        self.nx = int(width / self.cell) + 2
+        self.ny = int(height / self.cell) + 2
+        self.diag = sqrt(width ** 2 + height ** 2) + 2 * self.cell
+        self._eps = 1e-9 * self.cell
+
+        for k, edge in enumerate(self.edges):
+            for cell in self._edge_cells(edge):
+                self.cells[cell].append(k)
+
+    def first_hit(self, origin, direction, exclude=(), line=None):
+        """Return (point, edge) of the closest edge hit by the ray from origin
+        along direction, or (None, None).
+
+        Edges incident on any point in exclude are skipped, and a hit must lie
+        strictly ahead of origin. Ties keep the edge indexed first, as a linear
+        scan over edges would. line, if given, is the pair of points handed to
+        intersect_point, so a caller extending an existing segment gets the
+        same intersections as testing against that segment's line.
+        """
+        dx, dy = direction.x, direction.y
+        length = sqrt(dx * dx + dy * dy)
+        if length == 0 or self.nx == 0:
+            return None, None
+        ux, uy = dx / length, dy / length
+        if line is None:
+            # Second point defining the ray's line, well beyond the grid
+            scale = max(1e6, self.diag) / length
+            line = (origin, Point(origin.x + dx * scale, origin.y + dy * scale))
+
+        tested = set()
+        best = None
+        for positions, t_next in self._walk(origin, ux, uy):
+            for k in positions:
+                if k in tested:
+                    continue
+                tested.add(k)
+                edge = self.edges[k]
+                if any(v in edge for v in exclude):
+                    continue
+                p = intersect_point(line[0], line[1], edge)
+                if p is None or p == origin:
+                    continue
+                if not on_segment(edge.p1, p, edge.p2):
+                    continue
+                if (p.x - origin.x) * dx + (p.y - origin.y) * dy <= 0:
+                    continue
+                d = edge_distance(origin, p)
+                if best is None or (d, k) < best[:2]:
+                    best = (d, k, p)
+            if best is not None and best[0] < t_next - self._eps:
+                break
+
+        if best is None:
+            return None, None
+        return best[2], self.edges[best[1]]
+
+    def segment_edges(self, segment):
+        """Return the positions, in increasing order, of the edges that share
+        a cell with segment, an Edge. Every edge the segment touches is among
+        them."""
+        if self.nx == 0:
+            return []
+        found = set()
+        for cell in self._edge_cells(segment):
+            found.update(self.cells.get(cell, ()))
+        return sorted(found)
+
+    def cell_arrays(self):
+        """Return (ptr, positions): the cell lists as CSR arrays, with cell
+        (i, j) as row i * ny + j."""
+        if self._csr is None:
+            cells = sorted(self.cells)
+            rows = np.repeat([i * self.ny + j for i, j in cells],
+                             [len(self.cells[c]) for c in cells]).astype(np.intp)
+            ptr = csr_ptr(rows, self.nx * self.ny)
+            positions = np.array([k for c in cells for k in self.cells[c]], dtype=np.intp)
+            self._csr = (ptr, positions)
+        return self._csr
+
+    def box_edges(self, lo, hi):
+        """Vectorized segment_edges for the (N, 2) boxes lo-hi: returns
+        (box_idx, positions), each edge sharing a cell with a box once, in
+        increasing (box, position) order. Meant for small boxes; the cost
+        follows the number of cells they cover."""
+        lo, hi = np.asarray(lo, float).reshape(-1, 2), np.asarray(hi, float).reshape(-1, 2)
+        if self.nx == 0 or len(lo) == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        i0, j0 = self.cells_of(lo - self._eps)
+        i1, j1 = self.cells_of(hi + self._eps)
+        height = j1 - j0 + 1
+        counts = (i1 - i0 + 1) * height
+        box = np.repeat(np.arange(len(lo)), counts)
+        rank = ranks(counts)
+        i = i0[box] + rank // height[box]
+        j = j0[box] + rank % height[box]
+        box, k = expand_rows(*self.cell_arrays(), i * self.ny + j, box)
+        key = np.unique(box * len(self.edges) + k)
+        return key // len(self.edges), key % len(self.edges)
+
+    def ray_cells(self, origin, direction):
+        """Yield (positions, t) for each cell the ray from origin along
+        direction passes through, in order: the edge positions listed in the
+        cell, and the distance from origin at which the ray leaves it. An edge
+        spanning several cells is listed again in each of them."""
+        dx, dy = direction.x, direction.y
+        length = sqrt(dx * dx + dy * dy)
+        if length == 0 or self.nx == 0:
+            return iter(())
+        return self._walk(origin, dx / length, dy / length)
+
+    def _walk(self, origin, ux, uy):
+        """ray_cells for the unit direction (ux, uy)."""
+        t_enter, t_exit = self._clip(origin, ux, uy)
+        if t_enter is None:
+            return
+        x = origin.x + ux * t_enter
+        y = origin.y + uy * t_enter
+        i = min(max(int(floor((x - self.x0) / self.cell)), 0), self.nx - 1)
+        j = min(max(int(floor((y - self.y0) / self.cell)), 0), self.ny - 1)
+
+        if ux > 0:
+            step_i, t_max_x = 1, (self.x0 + (i + 1) * self.cell - origin.x) / ux
+        elif ux < 0:
+            step_i, t_max_x = -1, (self.x0 + i * self.cell - origin.x) / ux
+        else:
+            step_i, t_max_x = 0, float("inf")
+        if uy > 0:
+            step_j, t_max_y = 1, (self.y0 + (j + 1) * self.cell - origin.y) / uy
+        elif uy < 0:
+            step_j, t_max_y = -1, (self.y0 + j * self.cell - origin.y) / uy
+        else:
+            step_j, t_max_y = 0, float("inf")
+        t_delta_x = self.cell / abs(ux) if ux else float("inf")
+        t_delta_y = self.cell / abs(uy) if uy else float("inf")
+
+        while True:
+            t_next = min(t_max_x, t_max_y)
+            yield self.cells.get((i, j), ()), t_next
+            if t_next > t_exit:
+                return
+            if t_max_x < t_max_y:
+                i += step_i
+                t_max_x += t_delta_x
+            else:
+                j += step_j
+                t_max_y += t_delta_y
+            if not (0 <= i < self.nx and 0 <= j < self.ny):
+                return
+
+    def _clip(self, origin, ux, uy):
+        """Return the (t_enter, t_exit) ray parameters inside the grid, or (None, None)."""
+        t_enter, t_exit = 0.0, float("inf")
+        for o, u, lo, hi in (
+            (origin.x, ux, self.x0, self.x0 + self.nx * self.cell),
+            (origin.y, uy, self.y0, self.y0 + self.ny * self.cell),
+        ):
+            if u == 0:
+                if not lo <= o <= hi:
+                    return None, None
+                continue
+            t1 = (lo - o) / u
+            t2 = (hi - o) / u
+            if t1 > t2:
+                t1, t2 = t2, t1
+            t_enter = max(t_enter, t1)
+            t_exit = min(t_exit, t2)
+        if t_enter > t_exit:
+            return None, None
+        return t_enter, t_exit
+
+    def _edge_cells(self, edge):
+        """Yield every cell the edge passes through, widened by a small margin."""
+        (ax, ay), (bx, by) = (edge.p1.x, edge.p1.y), (edge.p2.x, edge.p2.y)
+        if ax > bx:
+            ax, ay, bx, by = bx, by, ax, ay
+        eps = self._eps
+        i0 = self._col(ax - eps)
+        i1 = self._col(bx + eps)
+        for i in range(i0, i1 + 1):
+            # y range of the segment within this column
+            cx0 = max(ax, self.x0 + i * self.cell)
+            cx1 = min(bx, self.x0 + (i + 1) * self.cell)
+            if bx == ax:
+                ya, yb = ay, by
+            else:
+                slope = (by - ay) / (bx - ax)
+                ya = ay + slope * (cx0 - ax)
+                yb = ay + slope * (cx1 - ax)
+            j0 = self._row(min(ya, yb) - eps)
+            j1 = self._row(max(ya, yb) + eps)
+            for j in range(j0, j1 + 1):
+                yield i, j
+
+    def cell_of(self, point):
+        """Return the (i, j) cell of point, clamped to the grid."""
+        return self._col(point.x), self._row(point.y)
+
+    def cells_of(self, points):
+        """Vectorized cell_of for an (N, 2) array: returns the (i, j) arrays."""
+        i = np.clip(np.floor((points[:, 0] - self.x0) / self.cell), 0, self.nx - 1)
+        j = np.clip(np.floor((points[:, 1] - self.y0) / self.cell), 0, self.ny - 1)
+        return i.astype(np.intp), j.astype(np.intp)
+
+    def _col(self, x):
+        return min(max(int(floor((x - self.x0) / self.cell)), 0), self.nx - 1)
+
+    def _row(self, y):
+        return min(max(int(floor((y - self.y0) / self.cell)), 0), self.ny - 1)
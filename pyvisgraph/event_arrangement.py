@@ -0,0 +1,133 @@
+import numpy as np
+
+from pyvisgraph.classes import Point, Edge
+from pyvisgraph.batch_geometry import edges_to_array
+from pyvisgraph.edge_grid import EdgeGrid
+from pyvisgraph.point_location import expand_rows
+from pyvisgraph.visible_vertices import bitangent_lines, angle, edge_distance
+
+
+class EventArrangement(object):
+    """Point location in the arrangement of the critical-event rays.
+
+    The bitangent vertices seen from a point only change where the point
+    crosses a bitangent complement, inflection or extension ray, so they
+    are constant on each face of the arrangement those rays form with the
+    polygon edges. The sweep's bitangent test also flips where the point
+    crosses the line of a polygon edge, and only convex chain edges have
+    extension rays, so every polygon edge is extended both ways to its
+    first hit as well. The rays and edges are put in an EdgeGrid. Inside one
+    grid cell, the side of each line crossing the cell cuts it into convex
+    pieces that no ray or edge enters, so each piece lies in a single face.
+    A piece is named by its cell and that side signature. The first query
+    in a piece runs bitangent_lines, and later queries reuse the vertex set
+    and sort it around the query point, as the sweep orders its output.
+
+    This is a cache over the arrangement, not the arrangement itself: the
+    faces are not built up front (a map like env_1 has tens of thousands of
+    pieces, each needing a sweep), a lookup tests every line listed in the
+    point's cell rather than descending a point location structure, and
+    there are no face-to-face links; a moving robot follows the event rays
+    along its path instead (Environment.next_event). At most max_faces
+    pieces are kept, the least recently used dropped first.
+
+    A point within a relative 1e-9 of one of the lines lies on (or too
+    close to call) a face boundary. It is answered by a fresh sweep and not
+    cached.
+
+    Attributes:
+        graph (PolygonGraph): the environment boundary
+        grid (EdgeGrid): the polygon edges, the event rays and the polygon
+            edge extensions
+        faces (dict): (cell, side signature) -> tuple of bitangent vertices,
+            least recently used first
+        max_faces (int): the most pieces kept in faces
+    """
+
+    def __init__(self, graph, event_edges, max_faces=100000):
+        self.graph = graph
+        self.max_faces = max_faces
+        edges = list(graph.get_edges())
+        self.grid = EdgeGrid(edges + list(event_edges) + _extensions(graph, edges))
+        self.faces = {}
+        self._coords = edges_to_array(self.grid.edges)
+        lengths = np.hypot(self._coords[:, 2] - self._coords[:, 0],
+                           self._coords[:, 3] - self._coords[:, 1])
+        # |cross product| below this is too close to the line to trust
+        self._near = 1e-9 * lengths * self.grid.diag
+        self._lines = self._coords.tolist()
+        self._near_list = self._near.tolist()
+
+    def bitangents(self, p):
+        """Return the vertices bitangent_lines(p, graph) would return."""
+        grid = self.grid
+        if grid.nx == 0:
+            return bitangent_lines(p, self.graph)
+        cell = grid.cell_of(p)
+        lines, near = self._lines, self._near_list
+        signature = []
+        for k in grid.cells.get(cell, ()):
+            ax, ay, bx, by = lines[k]
+            cross = (bx - ax) * (p.y - ay) - (by - ay) * (p.x - ax)
+            if abs(cross) <= near[k]:
+                return bitangent_lines(p, self.graph)
+            signature.append(cross > 0)
+        return self._lookup(p, (cell, tuple(signature)))
+
+    def bitangents_batch(self, points):
+        """bitangents for each row of an (N, 2) array of points."""
+        points = np.asarray(points, float).reshape(-1, 2)
+        grid = self.grid
+        if grid.nx == 0:
+            return [bitangent_lines(Point(x, y), self.graph) for x, y in points.tolist()]
+        col, row = grid.cells_of(points)
+        cell_id = col * grid.ny + row
+        point_idx, k = expand_rows(*grid.cell_arrays(), cell_id, np.arange(len(points)))
+        a, b = self._coords[k, 0:2], self._coords[k, 2:4]
+        q = points[point_idx]
+        cross = (b[:, 0] - a[:, 0]) * (q[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (q[:, 0] - a[:, 0])
+        near = np.zeros(len(points), dtype=bool)
+        near[point_idx[np.abs(cross) <= self._near[k]]] = True
+        positive = cross > 0
+        ptr = np.searchsorted(point_idx, np.arange(len(points) + 1))
+
+        result = []
+        for i, (x, y) in enumerate(points.tolist()):
+            p = Point(x, y)
+            if near[i]:
+                result.append(bitangent_lines(p, self.graph))
+                continue
+            cell = divmod(int(cell_id[i]), grid.ny)
+            signature = tuple(positive[ptr[i]:ptr[i + 1]].tolist())
+            result.append(self._lookup(p, (cell, signature)))
+        return result
+
+    def _lookup(self, p, key):
+        vertices = self.faces.pop(key, None)
+        if vertices is None:
+            visible = bitangent_lines(p, self.graph)
+            if len(self.faces) >= self.max_faces:
+                del self.faces[next(iter(self.faces))]
+            self.faces[key] = tuple(visible)
+            return visible
+        # Reinserted as the most recently used
+        self.faces[key] = vertices
+        return sorted(vertices, key=lambda v: (angle(p, v), edge_distance(p, v)))
+
+
+def _extensions(graph, edges):
+    """Return the rays extending each edge past both endpoints to the first
+    polygon edge hit, or across the whole graph if nothing is hit."""
+    xs = [p.x for e in edges for p in (e.p1, e.p2)]
+    ys = [p.y for e in edges for p in (e.p1, e.p2)]
+    diag = edge_distance(Point(min(xs, default=0), min(ys, default=0)),
+                         Point(max(xs, default=0), max(ys, default=0)))
+    rays = []
+    for edge in edges:
+        for a, b in ((edge.p1, edge.p2), (edge.p2, edge.p1)):
+            hit, _ = graph.first_hit(b, b - a, exclude=(a, b), line=(a, b))
+            if hit is None:
+                scale = diag / edge_distance(a, b)
+                hit = Point(b.x + (b.x - a.x) * scale, b.y + (b.y - a.y) * scale)
+            rays.append(Edge(b, hit))
+    return rays
@@ -22,9 +22,16 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+from bisect import bisect_left
 from collections import defaultdict
+from collections.abc import Mapping
 import sys
+
+import numpy as np
 from pyvisgraph.classes import Point, Edge, Chain
+from pyvisgraph.edge_grid import EdgeGrid
+from pyvisgraph.point_location import PointLocator
+from pyvisgraph.batch_geometry import edges_to_array
 from pyvisgraph.visible_vertices import polygon_crossing, edge_cross_point
 
 eps = 0.01
@@ -58,6 +65,13 @@ class Graph(object):
                 return edge.p1
         return None
 
+    def get_prev_edge(self, point):
+        """The edge from get_prev_point(point) to point, or None."""
+        for edge in self[point]:
+            if point == edge.p2:
+                return edge
+        return None
+
     def get_points(self):
         return list(self.graph)
 
@@ -150,14 +164,43 @@ class PolygonGraph(Graph):
 
     Edge direction: follow the direction of an edge, the infeasible area should
     be on the righthand side.
+
+    Storage: each distinct vertex has an integer id, its index in
+    get_points(). coords is the (N, 2) array of vertex coordinates and
+    next_ids / prev_ids give the id of the following / preceding vertex
+    along the edge direction (-1 if none), so get_next_point and
+    get_prev_point are O(1). edge_ids is the (M, 2) array of the (p1, p2)
+    ids of each edge, and the edges incident on each vertex are kept as
+    index lists in the order a set of them would iterate. vertex_id finds
+    the id of a Point by its coordinates, through the vertices sorted by x.
+    Besides the Points given in polygons, nothing else is kept per vertex:
+    the Edge objects of edges, polygon_edges and graph[p] are made from
+    edge_ids on first use, once. The graph is immutable once built.
+
+    Ray casting against the boundary goes through first_hit, which uses an
+    EdgeGrid built on first use. Likewise locate and is_valid (and their batch
+    versions) use a PointLocator. polygon_edge_array caches each polygon's
+    edges as an array for the batch_geometry kernels.
     """
 
     def __init__(self, polygons):
-        self.graph = defaultdict(set)
-        self.edges = set()
-        self.polygon_edges = defaultdict(set)
-        self.polygon_vertices = defaultdict(list)
+        self._edge_grid = None
+        self._point_locator = None
+        self._edge_arrays = {}
+        self._edges = None
+        self._polygon_edges = None
         self.polygons = []
+        polygon_edges = defaultdict(set)
+        # Built with the same sets as a plain Graph, so that the orders kept
+        # by _compact match the iteration orders of one.
+        adjacency = defaultdict(set)
+        edges = set()
+
+        def add_edge(edge):
+            adjacency[edge.p1].add(edge)
+            adjacency[edge.p2].add(edge)
+            edges.add(edge)
+
         pid = 0
         for polygon in polygons:
             while polygon[0] == polygon[-1] and len(polygon) > 1:
@@ -171,7 +214,8 @@ class PolygonGraph(Graph):
                 for point in polygon:
                     point.polygon_id = pid
                     # Currently, the single point is not added to polygon_vertices
-                    self.add_point(point)
+                    assert not point in adjacency, f"add_point: {point} already in graph"
+                    adjacency[point] = set()
             else:
                 # But modifying an object that affects its hash or equality while it's in a set can lead to undefined behavior.
                 current_edges = []
@@ -181,10 +225,9 @@ class PolygonGraph(Graph):
                     if len(polygon) > 2:
                         point.polygon_id = pid
                         sibling_point.polygon_id = pid
-                        self.polygon_edges[pid].add(edge)
-                        self.polygon_vertices[pid].append(point)
+                        polygon_edges[pid].add(edge)
                         current_edges.append(edge)
-                    self.add_edge(edge)
+                    add_edge(edge)
 
                 # Make sure the infeasible area is on the righthand side of each edge looking from p1 to p2
                 # If not, flip p1 and p2 of the edge
@@ -214,6 +257,232 @@ class PolygonGraph(Graph):
             self.polygons.append(polygon)
             pid += 1
 
+        self._compact(adjacency, list(edges), polygon_edges)
+
+    def _compact(self, adjacency, edges, polygon_edges):
+        """Store the vertices, edges and incidence as index arrays; the Edge
+        objects built on the way are dropped."""
+        points = list(adjacency)
+        self._points = points
+        ids = {p: vid for vid, p in enumerate(points)}
+        edge_index = {id(edge): k for k, edge in enumerate(edges)}
+
+        self.edge_ids = np.array([(ids[e.p1], ids[e.p2]) for e in edges],
+                                 dtype=np.int32).reshape(-1, 2)
+        # The edges of polygon _polygon_ids[i] are _polygon_edge_ids[ptr[i]:
+        # ptr[i + 1]], in the order of the set they were collected in
+        self._polygon_ids = np.array(list(polygon_edges), dtype=np.int32)
+        self._polygon_edge_ptr = np.zeros(len(polygon_edges) + 1, dtype=np.int32)
+        self._polygon_edge_ptr[1:] = np.cumsum([len(polygon_edges[pid]) for pid in polygon_edges])
+        self._polygon_edge_ids = np.array(
+            [edge_index[id(e)] for pid in polygon_edges for e in polygon_edges[pid]],
+            dtype=np.int32,
+        )
+        counts = [len(adjacency[p]) for p in points]
+        self._incident_ptr = np.zeros(len(points) + 1, dtype=np.int32)
+        self._incident_ptr[1:] = np.cumsum(counts)
+        self._incident = np.array(
+            [edge_index[id(e)] for p in points for e in adjacency[p]], dtype=np.int32
+        )
+
+        self.coords = np.array([(p.x, p.y) for p in points], dtype=float).reshape(-1, 2)
+        self.next_ids = np.full(len(points), -1, dtype=np.int32)
+        self.prev_ids = np.full(len(points), -1, dtype=np.int32)
+        self._x_order = np.argsort(self.coords[:, 0], kind="stable").astype(np.int32)
+        self._x_sorted = self.coords[self._x_order, 0]
+        self._make_views()
+
+        for vid, p in enumerate(points):
+            # First match in set order, as a scan of graph[p] would find
+            for e in adjacency[p]:
+                if p == e.p1 and self.next_ids[vid] < 0:
+                    self.next_ids[vid] = ids[e.p2]
+                if p == e.p2 and self.prev_ids[vid] < 0:
+                    self.prev_ids[vid] = ids[e.p1]
+
+    def _make_views(self):
+        # memoryviews index several times faster than the arrays themselves
+        self._next = memoryview(self.next_ids)
+        self._prev = memoryview(self.prev_ids)
+        self._ptr = memoryview(self._incident_ptr)
+        self._inc = memoryview(self._incident)
+        self._xs = memoryview(self._x_sorted)
+        self._xo = memoryview(self._x_order)
+        self._ys = memoryview(self.coords[:, 1])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ("_next", "_prev", "_ptr", "_inc", "_xs", "_xo", "_ys"):
+            del state[name]
+        # Made again from edge_ids on first use
+        state["_edges"] = state["_polygon_edges"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._make_views()
+
+    def vertex_id(self, point):
+        """Return the integer id of the vertex equal to point, or -1."""
+        xs = self._xs
+        i = bisect_left(xs, point.x)
+        while i < len(xs) and xs[i] == point.x:
+            vid = self._xo[i]
+            if self._ys[vid] == point.y:
+                return vid
+            i += 1
+        return -1
+
+    @property
+    def edges(self):
+        """The edges as a list of Edges, in edge_ids order."""
+        if self._edges is None:
+            points = self._points
+            self._edges = [Edge(points[a], points[b]) for a, b in self.edge_ids.tolist()]
+        return self._edges
+
+    @property
+    def polygon_edges(self):
+        """Polygon id -> list of its Edges (the same objects as in edges)."""
+        if self._polygon_edges is None:
+            edges, ptr = self.edges, self._polygon_edge_ptr.tolist()
+            ids = self._polygon_edge_ids.tolist()
+            self._polygon_edges = defaultdict(set)
+            for i, pid in enumerate(self._polygon_ids.tolist()):
+                self._polygon_edges[pid] = [edges[k] for k in ids[ptr[i]:ptr[i + 1]]]
+        return self._polygon_edges
+
+    @property
+    def polygon_vertices(self):
+        """Polygon id -> list of its Points in the order given, for the
+        polygons (not single Points) only."""
+        vertices = defaultdict(list)
+        for pid in self._polygon_ids.tolist():
+            vertices[pid] = list(self.polygons[pid])
+        return vertices
+
+    def _incident_edges(self, vid):
+        start, end = self._ptr[vid], self._ptr[vid + 1]
+        edges, inc = self.edges, self._inc
+        if end - start == 2:
+            return (edges[inc[start]], edges[inc[start + 1]])
+        return tuple([edges[inc[k]] for k in range(start, end)])
+
+    @property
+    def graph(self):
+        """Point -> tuple of incident Edges, as a read-only mapping."""
+        return _AdjacencyView(self)
+
+    def get_points(self):
+        return list(self._points)
+
+    def get_next_point(self, point):
+        vid = self.vertex_id(point)
+        if vid < 0:
+            return None
+        vid = self._next[vid]
+        return self._points[vid] if vid >= 0 else None
+
+    def get_prev_point(self, point):
+        vid = self.vertex_id(point)
+        if vid < 0:
+            return None
+        vid = self._prev[vid]
+        return self._points[vid] if vid >= 0 else None
+
+    def add_edge(self, edge):
+        raise TypeError("PolygonGraph is immutable; build a new one from polygons")
+
+    def add_point(self, point):
+        raise TypeError("PolygonGraph is immutable; build a new one from polygons")
+
+    def __getitem__(self, p):
+        """Edges incident on Point p, or on both Points of the pair p, as a
+        tuple in the order a Graph's edge set would iterate them."""
+        if isinstance(p, Point):
+            vid = self.vertex_id(p)
+            return self._incident_edges(vid) if vid >= 0 else ()
+        elif len(p) == 2 and isinstance(p[0], Point) and isinstance(p[1], Point):
+            if p[0] in self and p[1] in self:
+                return tuple(e for e in self[p[0]] if e in self[p[1]])
+            else:
+                print("__getitem__: point not in graph!")
+                return ()
+        else:
+            print("__getitem__: ERROR: Wrong input type!")
+            return ()
+
+    def __contains__(self, item):
+        if isinstance(item, Point):
+            return self.vertex_id(item) >= 0
+        if isinstance(item, Edge):
+            return item in self[item.p1]
+        return False
+
+    def first_hit(self, origin, direction, exclude=(), line=None):
+        """Return (point, edge) where the ray from origin along direction first
+        hits the boundary, or (None, None). Edges incident on a point in
+        exclude are ignored; see EdgeGrid.first_hit for line."""
+        if self._edge_grid is None:
+            self._edge_grid = EdgeGrid(self.edges)
+        return self._edge_grid.first_hit(origin, direction, exclude, line)
+
+    @property
+    def point_locator(self):
+        if self._point_locator is None:
+            self._point_locator = PointLocator(self.polygon_edges)
+        return self._point_locator
+
+    def locate(self, point):
+        """Return the id of the polygon point is interior to, or -1; same
+        result as point_in_polygon."""
+        return self.point_locator.locate(point)
+
+    def locate_points(self, points):
+        """Batch version of locate for an (N, 2) array of points."""
+        return self.point_locator.locate_points(points)
+
+    def is_valid(self, point):
+        """Return True if point is inside the wall and outside all obstacles;
+        same result as point_valid."""
+        return self.point_locator.is_valid(point)
+
+    def valid_points(self, points):
+        """Batch version of is_valid for an (N, 2) array of points."""
+        return self.point_locator.valid_points(points)
+
+    def polygon_edge_array(self, polygon_id):
+        """Return (edges, coords): the polygon's edges as a list and their
+        endpoints as an (M, 4) array in the same order."""
+        if polygon_id not in self._edge_arrays:
+            edges = list(self.polygon_edges[polygon_id])
+            self._edge_arrays[polygon_id] = (edges, edges_to_array(edges))
+        return self._edge_arrays[polygon_id]
+
+
+class _AdjacencyView(Mapping):
+    """Read-only Point -> incident Edges view of a PolygonGraph."""
+
+    __slots__ = ("_polygon_graph",)
+
+    def __init__(self, polygon_graph):
+        self._polygon_graph = polygon_graph
+
+    def __getitem__(self, point):
+        vid = self._polygon_graph.vertex_id(point)
+        if vid < 0:
+            raise KeyError(point)
+        return self._polygon_graph._incident_edges(vid)
+
+    def __contains__(self, point):
+        return self._polygon_graph.vertex_id(point) >= 0
+
+    def __iter__(self):
+        return iter(self._polygon_graph._points)
+
+    def __len__(self):
+        return len(self._polygon_graph._points)
+
 
 class ChainGraph(Graph):
     def __init__(self):
@@ -222,15 +491,18 @@ class ChainGraph(Graph):
         self.chains = defaultdict(Chain)
 
     def new_chain(self, chain_id, vertices, edges):
+        """Add a chain of vertices in boundary order and the edges between
+        them; it is closed if it has as many edges as vertices."""
         assert (
             not chain_id in self.chains
         ), f"new_chain: Chain id {chain_id} already in chains"
-        self.chains[chain_id] = Chain(chain_id, set(vertices), set(edges))
+        self.chains[chain_id] = Chain(chain_id, list(vertices), list(edges))
         self.add_points(vertices)
         self.add_edges(edges)
         self.start_and_end(chain_id)
 
     def add_to_chain(self, chain_id, vertices, edges):
+        """Continue the chain past its end with vertices and edges."""
         assert (
             chain_id in self.chains
         ), f"add_to_chain: Chain id {chain_id} not in chains"
@@ -248,21 +520,11 @@ class ChainGraph(Graph):
     def start_and_end(self, chain_id):
         assert (
             chain_id in self.chains
-        ), f"add_to_chain: Chain id {chain_id} not in chains"
-        self.chains[chain_id].start = None
-        self.chains[chain_id].end = None
-
-        vertices = self.chains[chain_id].vertices
-        if len(vertices) == 1:
-            self.chains[chain_id].start = list(vertices)[0]
-            self.chains[chain_id].end = list(vertices)[0]
-
-        for p in vertices:
-            if self.get_next_point(p) in vertices and (
-                not self.get_prev_point(p) in vertices
-            ):
-                self.chains[chain_id].start = p
-            if (not self.get_next_point(p) in vertices) and self.get_prev_point(
-                p
-            ) in vertices:
-                self.chains[chain_id].end = p
+        ), f"start_and_end: Chain id {chain_id} not in chains"
+        chain = self.chains[chain_id]
+        if chain.vertices and len(chain.edges) < len(chain.vertices):
+            chain.start = chain.vertices[0]
+            chain.end = chain.vertices[-1]
+        else:
+            chain.start = None
+            chain.end = None
@@ -0,0 +1,307 @@
+from bisect import bisect_right
+
+import numpy as np
+
+from pyvisgraph.classes import Point
+from pyvisgraph.batch_geometry import edges_to_array, _crosses
+from pyvisgraph.visible_vertices import INF, ray_crosses_edge
+
+
+class PointLocator(object):
+    """Slab decomposition of polygon edges for point location.
+
+    The distinct y values of the edge endpoints cut the plane into
+    horizontal slabs, and each slab lists the edges spanning it, ordered
+    left to right; horizontal edges are listed under their y value instead.
+    Edges do not cross inside a slab, so for every position in a slab the
+    polygons a point just left of that edge lies in are fixed, and they are
+    stored with the slab. A query bisects for its slab, then for the first
+    edge to its right, in O(log n).
+
+    The answers agree exactly with polygon_crossing, point_in_polygon and
+    point_valid. When a point is too close to an edge or a slab boundary for
+    ccw() to be sure of its side, or the slab fails the checks made when
+    building, the query instead runs the crossings test of polygon_crossing
+    on the edges of its slab.
+
+    Attributes:
+        polygon_ids (list): the polygon ids, in polygon_edges order
+        edges (list): the indexed edges, grouped by polygon
+        edge_polygon (ndarray): position in polygon_ids of each edge's polygon
+        ys (ndarray): the sorted distinct endpoint y values; slab s lies
+            between ys[s] and ys[s + 1]
+    """
+
+    def __init__(self, polygon_edges):
+        self.polygon_ids = list(polygon_edges)
+        self.edges = []
+        owner = []
+        for k, pid in enumerate(self.polygon_ids):
+            self.edges.extend(polygon_edges[pid])
+            owner.extend([k] * len(polygon_edges[pid]))
+        self.edge_polygon = np.array(owner, dtype=np.intp)
+        self.coords = edges_to_array(self.edges)
+        # Position of the wall: a valid point is inside it and nothing else
+        self._wall = self.polygon_ids.index(0) if 0 in self.polygon_ids else -1
+
+        x1, y1, x2, y2 = self.coords.T
+        low = np.minimum(y1, y2)
+        self._high = np.maximum(y1, y2)
+        self.ys = np.unique(np.concatenate((low, self._high)))
+        first = np.searchsorted(self.ys, low)
+        spans = np.searchsorted(self.ys, self._high) - first
+        flat = np.nonzero(spans == 0)[0]
+        self._flat_ptr = csr_ptr(first[flat], len(self.ys))
+        self._flat_edges = flat[np.argsort(first[flat], kind="stable")]
+
+        # Edge k is listed in slabs first[k] .. first[k] + spans[k] - 1,
+        # ordered by where it crosses the middle of the slab
+        edge_ids = np.repeat(np.arange(len(self.edges)), spans)
+        slab = np.repeat(first, spans) + ranks(spans)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self._inv_slope = (x2 - x1) / (y2 - y1)
+        if len(slab):
+            y_mid = (self.ys[slab] + self.ys[slab + 1]) / 2
+            order = np.lexsort((self._x_at(edge_ids, y_mid), slab))
+        else:
+            order = np.zeros(0, dtype=np.intp)
+        slab, self._slab_edges = slab[order], edge_ids[order]
+        self._slab_ptr = csr_ptr(slab, len(self.ys))
+        self._build_fast_path(slab)
+        self._make_views()
+
+    def _x_at(self, k, y):
+        return self.coords[k, 0] + (y - self.coords[k, 1]) * self._inv_slope[k]
+
+    def _build_fast_path(self, slab):
+        """Store the answers for each slab position and the checks that tell
+        when they can be used."""
+        n_slabs = max(len(self.ys) - 1, 0)
+        k = self._slab_edges
+        # Lengths up to _scale apart meet the ccw() threshold T_ccw < 1e-9
+        # only within _tol of a line
+        extent = np.abs(self.coords).max() if len(self.coords) else 0.0
+        self._scale = 2 * (extent + INF)
+        self._tol = 1e-9 * self._scale
+        self._x_max = self.coords[:, [0, 2]].max() if len(self.coords) else 0.0
+        self._x_min = self.coords[:, [0, 2]].min() if len(self.coords) else 0.0
+
+        # Distance to an edge's line is its horizontal gap times its lean
+        dx = self.coords[:, 2] - self.coords[:, 0]
+        dy = self.coords[:, 3] - self.coords[:, 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lean = np.abs(dy) / np.hypot(dx, dy)
+        self._min_lean = np.ones(n_slabs)
+        np.minimum.at(self._min_lean, slab, lean[k])
+        # The edges must keep their order across the whole slab, and the
+        # rays' far end Point(INF, y) must stay clear of them
+        safe = (INF - self._x_max) * self._min_lean > self._tol
+        if len(slab):
+            same = slab[1:] == slab[:-1]
+            for y in (self.ys[slab], self.ys[slab + 1]):
+                x = self._x_at(k, y)
+                crossed = same & (x[1:] < x[:-1])
+                safe[slab[1:][crossed]] = False
+        self._safe = safe
+
+        # Polygons a point lies in just left of each slab position
+        ptr, owner = self._slab_ptr, self.edge_polygon[k].tolist()
+        valid_set = {self._wall} if self._wall >= 0 else set()
+        locate = [-1] * len(k)
+        valid = [False] * len(k)
+        for s in range(n_slabs):
+            inside = set()
+            for j in range(ptr[s + 1] - 1, ptr[s] - 1, -1):
+                inside ^= {owner[j]}
+                locate[j] = self.polygon_ids[min(inside)] if inside else -1
+                valid[j] = inside == valid_set
+        self._pos_locate = np.array(locate + [-1], dtype=np.intp)
+        self._pos_valid = np.array(valid + [not valid_set], dtype=np.uint8)
+
+    def _make_views(self):
+        self._ys = memoryview(self.ys)
+        self._sp = memoryview(self._slab_ptr)
+        self._se = memoryview(self._slab_edges)
+        self._fp = memoryview(self._flat_ptr)
+        self._fe = memoryview(self._flat_edges)
+        self._hi = memoryview(self._high)
+        self._owner = memoryview(self.edge_polygon)
+        self._x1 = memoryview(np.ascontiguousarray(self.coords[:, 0]))
+        self._y1 = memoryview(np.ascontiguousarray(self.coords[:, 1]))
+        self._inv = memoryview(self._inv_slope)
+        self._lean = memoryview(self._min_lean)
+        self._ok = memoryview(self._safe.view(np.uint8))
+        self._loc = memoryview(self._pos_locate)
+        self._val = memoryview(self._pos_valid)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ("_ys", "_sp", "_se", "_fp", "_fe", "_hi", "_owner",
+                     "_x1", "_y1", "_inv", "_lean", "_ok", "_loc", "_val"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._make_views()
+
+    def _position(self, p):
+        """Return the slab position of the first edge right of p, len(edges in
+        all slabs) if there is none, or -1 if p is too close to call."""
+        ys, y = self._ys, p.y
+        s = bisect_right(ys, y) - 1
+        if s < 0 or s >= len(ys) - 1 or not self._ok[s]:
+            return -1
+        tol = self._tol
+        if y - ys[s] <= tol or ys[s + 1] - y <= tol:
+            return -1
+        if not self._x_min <= p.x < INF:
+            return -1
+        se, x1, y1, inv = self._se, self._x1, self._y1, self._inv
+        lo, hi = self._sp[s], self._sp[s + 1]
+        start, end = lo, hi
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k = se[mid]
+            if x1[k] + (y - y1[k]) * inv[k] > p.x:
+                hi = mid
+            else:
+                lo = mid + 1
+        # Every edge of the slab is at least as far from p as the two
+        # neighbours are, horizontally
+        tol = tol / self._lean[s]
+        if lo < end:
+            k = se[lo]
+            if x1[k] + (y - y1[k]) * inv[k] - p.x <= tol:
+                return -1
+        if lo > start:
+            k = se[lo - 1]
+            if p.x - (x1[k] + (y - y1[k]) * inv[k]) <= tol:
+                return -1
+        return lo if lo < end else len(se)
+
+    def _inside(self, p):
+        """Return the set of positions in polygon_ids of the polygons that
+        polygon_crossing finds p inside."""
+        ys, sp, se, edges = self._ys, self._sp, self._se, self.edges
+        y = p.y
+        s = bisect_right(ys, y) - 1
+        if s < 0:
+            return set()
+        candidates = []
+        if s < len(ys) - 1:
+            candidates.extend(se[sp[s]:sp[s + 1]])
+        if ys[s] == y:
+            # On a slab boundary: also the edges ending here from below, and
+            # the horizontal edges at this y
+            hi = self._hi
+            if s > 0:
+                candidates.extend(k for k in se[sp[s - 1]:sp[s]] if hi[k] == y)
+            candidates.extend(self._fe[self._fp[s]:self._fp[s + 1]])
+        p2 = Point(INF, y)
+        inside = set()
+        for k in candidates:
+            edge = edges[k]
+            if p.x > edge.p1.x and p.x > edge.p2.x:
+                continue
+            if ray_crosses_edge(p, p2, edge):
+                inside ^= {self._owner[k]}
+        return inside
+
+    def locate(self, p):
+        """Return the id of the first polygon, in polygon_edges order, that p
+        is interior to, or -1. Same as point_in_polygon."""
+        j = self._position(p)
+        if j >= 0:
+            return self._loc[j]
+        inside = self._inside(p)
+        return self.polygon_ids[min(inside)] if inside else -1
+
+    def is_valid(self, p):
+        """Return True if p is inside the wall and outside every obstacle.
+        Same as point_valid."""
+        j = self._position(p)
+        if j >= 0:
+            return bool(self._val[j])
+        inside = self._inside(p)
+        return inside == ({self._wall} if self._wall >= 0 else set())
+
+    def locate_points(self, points, chunk_size=4096):
+        """Batch version of locate for an (N, 2) array of points: an (N,)
+        array of polygon ids, -1 where a point is in no polygon."""
+        first, n_odd, in_wall = self._odd_polygons(points, chunk_size)
+        ids = np.array(self.polygon_ids + [-1], dtype=np.intp)
+        return ids[np.where(n_odd > 0, first, -1)]
+
+    def valid_points(self, points, chunk_size=4096):
+        """Batch version of is_valid for an (N, 2) array of points."""
+        first, n_odd, in_wall = self._odd_polygons(points, chunk_size)
+        if self._wall < 0:
+            return n_odd == 0
+        return in_wall & (n_odd == 1)
+
+    def _odd_polygons(self, points, chunk_size):
+        """For each point: the smallest position of a polygon it is inside,
+        how many polygons it is inside, and whether one of them is the wall."""
+        points = np.asarray(points, float).reshape(-1, 2)
+        n_poly = len(self.polygon_ids)
+        first = np.full(len(points), n_poly, dtype=np.intp)
+        n_odd = np.zeros(len(points), dtype=np.intp)
+        in_wall = np.zeros(len(points), dtype=bool)
+        for start in range(0, len(points), chunk_size):
+            point_idx, edge_idx = self._crossing_pairs(points[start:start + chunk_size])
+            key = (start + point_idx) * n_poly + self.edge_polygon[edge_idx]
+            key, count = np.unique(key, return_counts=True)
+            key = key[count % 2 == 1]
+            pi, pos = np.divmod(key, n_poly)
+            np.minimum.at(first, pi, pos)
+            n_odd += np.bincount(pi, minlength=len(points))
+            in_wall[pi[pos == self._wall]] = True
+        return first, n_odd, in_wall
+
+    def _crossing_pairs(self, points):
+        """Return (point_idx, edge_idx) for every pair where polygon_crossing
+        counts the edge for the point."""
+        ys, y = self.ys, points[:, 1]
+        s = np.searchsorted(ys, y, side="right") - 1
+        exact = (s >= 0) & (ys[np.clip(s, 0, None)] == y)
+        rows = np.arange(len(points))
+
+        up = (s >= 0) & (s < len(ys) - 1)
+        parts = [expand_rows(self._slab_ptr, self._slab_edges, s[up], rows[up])]
+        below = exact & (s > 0)
+        pi, ei = expand_rows(self._slab_ptr, self._slab_edges, s[below] - 1, rows[below])
+        ends = self._high[ei] == y[pi]
+        parts.append((pi[ends], ei[ends]))
+        parts.append(expand_rows(self._flat_ptr, self._flat_edges, s[exact], rows[exact]))
+        point_idx = np.concatenate([pi for pi, _ in parts])
+        edge_idx = np.concatenate([ei for _, ei in parts])
+
+        coords = self.coords[edge_idx]
+        px = points[point_idx, 0]
+        keep = ~((px > coords[:, 0]) & (px > coords[:, 2]))
+        point_idx, edge_idx = point_idx[keep], edge_idx[keep]
+        crosses = _crosses(points[point_idx], self.coords[edge_idx])
+        return point_idx[crosses], edge_idx[crosses]
+
+
+def ranks(counts):
+    """[0, 1, .., counts[0] - 1, 0, 1, .., counts[1] - 1, ...]"""
+    total = int(counts.sum())
+    return np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+def csr_ptr(rows, n_rows):
+    """Row pointer of a CSR table whose entries lie in the given (sorted)
+    rows: entries of row r are at ptr[r]:ptr[r + 1]."""
+    ptr = np.zeros(n_rows + 1, dtype=np.intp)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=ptr[1:])
+    return ptr
+
+
+def expand_rows(ptr, index, rows, point_ids):
+    """Pair each point with every entry of its CSR row."""
+    starts = ptr[rows]
+    counts = ptr[rows + 1] - starts
+    return (np.repeat(point_ids, counts),
+            index[np.repeat(starts, counts) + ranks(counts)])
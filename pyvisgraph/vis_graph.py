@@ -1,18 +1,36 @@
-from pyvisgraph.classes import Edge
+from concurrent.futures import ProcessPoolExecutor
+from math import pi
+
+import numpy as np
+
+from pyvisgraph.classes import Edge, Point, PointPool
+from pyvisgraph.batch_geometry import (
+    as_point_array,
+    points_to_array,
+    edges_to_array,
+    closest_edge_points,
+    ccw_array,
+)
 from pyvisgraph.graph import PolygonGraph, ChainGraph, Graph
 from pyvisgraph.shortest_path import shortest_path
 from pyvisgraph.visible_vertices import (
     bitangent_lines,
-    point_in_polygon,
+    shared_bitangent_lines,
+    visibility_polygon,
     point_in_wall,
-    point_valid,
     convex_chain,
     bitangent_complement,
+    complement_rays,
     inflection_lines,
     extension_lines,
+    ray_cast,
+    ray_hit,
     edge_distance,
-    closest_point,
+    angle,
+    push_outside,
     ccw,
+    CCW,
+    CW,
 )
 
 
@@ -26,49 +44,348 @@ class VisGraph:
         bitangent_comp -- Graph: bitangent complement rays  (trigger S/M events)
         inflection     -- Graph: inflection rays            (trigger A/D events)
         extension      -- Graph: extension rays             (trigger N/P events)
+
+    graph is built by build(); each of the others is built, with the graphs
+    it depends on, the first time it is read, unless build ran eagerly.
     """
 
     def __init__(self):
         self.graph = None
-        self.visibility_graph = None
-        self.convex_chains = None
-        self.bitangent_comp = None
-        self.inflection = None
-        self.extension = None
+        self._visibility_graph = None
+        self._convex_chains = None
+        self._bitangent_comp = None
+        self._inflection = None
+        self._extension = None
+        self._options = {}
+        # Rays ending on a vertex or on a common point share one Point
+        self._pool = None
 
-    def build(self, polygons, status=True):
-        """Build all geometric graphs from a list of polygons.
+    def build(self, polygons, status=True, workers=None, shared_order=False, eager=False):
+        """Build the PolygonGraph from a list of polygons; the other graphs
+        follow on first use.
 
-        polygons -- list of polygons; each polygon is an ordered list of Points.
-                    The first polygon is the outer wall; the rest are obstacles.
+        polygons     -- list of polygons; each polygon is an ordered list of Points.
+                        The first polygon is the outer wall; the rest are obstacles.
+        status       -- show a progress bar while building the visibility graph.
+        workers      -- number of processes for the visibility graph sweeps
+                        and for the ray casts of the bitangent complement,
+                        inflection and extension graphs. None or 1 runs
+                        them serially in this process.
+        shared_order -- build the visibility graph with shared_bitangent_lines,
+                        one rotational sweep over all vertices instead of
+                        one angular sort and sweep per vertex. Runs in this
+                        process; workers is ignored.
+        eager        -- build all the graphs now.
         """
-        from tqdm import tqdm
-
         self.graph = PolygonGraph(polygons)
-        self.visibility_graph = Graph()
-        self.convex_chains = ChainGraph()
-        self.bitangent_comp = Graph()
-        self.inflection = Graph()
-        self.extension = Graph()
+        self._visibility_graph = None
+        self._convex_chains = None
+        self._bitangent_comp = None
+        self._inflection = None
+        self._extension = None
+        self._options = dict(status=status, workers=workers, shared_order=shared_order)
+        self._pool = PointPool(self.graph.get_points())
+        if eager:
+            # In the order of their dependencies, as the Points are pooled
+            self.visibility_graph
+            self.convex_chains
+            self._build_rays(("bitangent_comp", "inflection", "extension"))
+
+    def restore(self, graph, pool, visibility_graph, convex_chains, bitangent_comp,
+                inflection, extension):
+        """Take graphs built earlier for the PolygonGraph graph, e.g. loaded
+        from disk, in place of building them; pool holds their Points."""
+        self.graph = graph
+        self._visibility_graph = visibility_graph
+        self._convex_chains = convex_chains
+        self._bitangent_comp = bitangent_comp
+        self._inflection = inflection
+        self._extension = extension
+        self._options = dict(status=False, workers=None, shared_order=False)
+        self._pool = pool
+
+    def is_built(self, name):
+        """True if the named graph has been built."""
+        return name == "graph" or getattr(self, "_" + name) is not None
+
+    @property
+    def visibility_graph(self):
+        if self._visibility_graph is None and self.graph is not None:
+            self._visibility_graph = self._build_visibility_graph(**self._options)
+        return self._visibility_graph
+
+    @property
+    def convex_chains(self):
+        if self._convex_chains is None and self.graph is not None:
+            self._convex_chains = ChainGraph()
+            convex_chain(self.graph, self._convex_chains)
+        return self._convex_chains
+
+    @property
+    def bitangent_comp(self):
+        if self._bitangent_comp is None and self.graph is not None:
+            self._build_rays(("bitangent_comp",))
+        return self._bitangent_comp
+
+    @property
+    def inflection(self):
+        if self._inflection is None and self.graph is not None:
+            self._build_rays(("inflection",))
+        return self._inflection
+
+    @property
+    def extension(self):
+        if self._extension is None and self.graph is not None:
+            self._build_rays(("extension",))
+        return self._extension
+
+    def _build_rays(self, names):
+        """Build the named ray graphs among bitangent_comp, inflection and
+        extension that are not built yet.
+
+        With workers, their ray casts, which are nearly all of the work, are
+        first shared out over a process pool together; the graphs are then
+        put together here as in a serial build, in the same order, so their
+        edges and the eids numbered from them come out the same.
+        """
+        names = [name for name in names if getattr(self, "_" + name) is None]
+        if not names:
+            return
+        workers = self._options.get("workers")
+        hits = None
+        if workers and workers > 1:
+            hits = self._cast_rays(self._ray_queries(names), workers)
+        for name in names:
+            rays = Graph()
+            if name == "bitangent_comp":
+                bitangent_complement(self.graph, self.visibility_graph, rays, self._pool, hits)
+            elif name == "inflection":
+                inflection_lines(self.graph, self.convex_chains, rays, self._pool, hits)
+            else:
+                extension_lines(self.graph, self.convex_chains, rays, self._pool, hits)
+            setattr(self, "_" + name, rays)
+
+    def _ray_queries(self, names):
+        """Return the ray_key of every ray cast building the named graphs
+        makes, each once."""
+        vid = self.graph.vertex_id
+        queries = set()
+        if "bitangent_comp" in names:
+            for edge in self.visibility_graph.get_edges():
+                p1, p2 = vid(edge.p1), vid(edge.p2)
+                queries.update(((p1, p2, p1, p2), (p2, p1, p1, p2)))
+        if "inflection" in names:
+            for chain in self.convex_chains.chains.values():
+                if chain.start:
+                    start, p_p = vid(chain.start), vid(self.graph.get_prev_point(chain.start))
+                    end, p_n = vid(chain.end), vid(self.graph.get_next_point(chain.end))
+                    queries.update(((start, p_p, p_p, start), (end, p_n, p_n, end)))
+        if "extension" in names:
+            for chain in self.convex_chains.chains.values():
+                for edge in chain.edges:
+                    p1, p2 = vid(edge.p1), vid(edge.p2)
+                    queries.update(((p2, p1, p1, p2), (p1, p2, p2, p1)))
+        return sorted(queries)
+
+    def _cast_rays(self, queries, workers):
+        """Return {query: hit Point or None} for ray_key queries, computed
+        by workers processes in chunks."""
+        chunk = max(64, -(-len(queries) // (4 * workers)))
+        chunks = [queries[i:i + chunk] for i in range(0, len(queries), chunk)]
+        hits = {}
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(self.graph,)) as executor:
+            for batch, results in zip(chunks, executor.map(_ray_hits, chunks)):
+                for query, hit in zip(batch, results):
+                    hits[query] = Point(*hit) if hit is not None else None
+        return hits
+
+    def _build_visibility_graph(self, status, workers, shared_order):
+        from tqdm import tqdm
 
+        visibility_graph = Graph()
         points = self.graph.get_points()
         batch_size = 10
         batches = [points[i:i + batch_size] for i in range(0, len(points), batch_size)]
 
-        for batch in tqdm(batches, disable=not status):
-            for p1 in batch:
-                for p2 in bitangent_lines(p1, self.graph, scan="half"):
-                    self.visibility_graph.add_edge(Edge(p1, p2))
+        if shared_order:
+            for p1, visible in tqdm(shared_bitangent_lines(self.graph, scan="half"),
+                                    total=len(points), disable=not status):
+                for p2 in visible:
+                    visibility_graph.add_edge(Edge(p1, p2))
+        elif workers and workers > 1:
+            # Workers get the PolygonGraph once and exchange point indices,
+            # since the Points they return are copies of ours.
+            index_batches = [range(i, min(i + batch_size, len(points)))
+                             for i in range(0, len(points), batch_size)]
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_init_worker,
+                                     initargs=(self.graph,)) as executor:
+                results = executor.map(_bitangent_batch, index_batches)
+                for batch in tqdm(results, total=len(index_batches), disable=not status):
+                    for i, visible in batch:
+                        for j in visible:
+                            visibility_graph.add_edge(Edge(points[i], points[j]))
+        else:
+            for batch in tqdm(batches, disable=not status):
+                for p1 in batch:
+                    for p2 in bitangent_lines(p1, self.graph, scan="half"):
+                        visibility_graph.add_edge(Edge(p1, p2))
+        return visibility_graph
+
+    def add_polygon(self, polygon):
+        """Add polygon, a list of Points, after the existing ones and update
+        the graphs to what build would give for the longer list.
+
+        An obstacle only blocks lines of sight, so the bitangents kept are
+        those it cannot touch; the others and the new vertices' own are
+        found by sweeping from the vertices involved. Rays it cannot touch
+        are kept as well. The first polygon (the wall) is built in full.
+        Returns the new polygon's id, or None if PolygonGraph dropped it.
+
+        Where a line of sight passes through a third vertex, within the ccw
+        tolerance, the sweeps may not agree on it from its two ends; build
+        takes the answer from one end and this from the other, so the
+        graphs can then differ from build's by that bitangent.
+        """
+        if self.graph is None or not self.graph.polygons:
+            self.build([polygon], **dict(self._options, status=False))
+            return 0 if self.graph.polygons else None
+        count = len(self.graph.polygons)
+        graph = PolygonGraph(list(self.graph.polygons) + [polygon])
+        if len(graph.polygons) == count:
+            return None
+        self._update(graph, graph.polygons[count], added=True)
+        return count
+
+    def remove_polygon(self, pid):
+        """Remove polygon pid and update the graphs to what build would give
+        for the shorter list; the polygons after it move down one id.
+
+        Removing an obstacle only opens lines of sight, so all bitangents
+        between the remaining vertices are kept and sweeps run only from
+        vertices that may now see each other through where it was. Removing
+        the wall rebuilds everything. Raises IndexError if there is no
+        polygon pid.
+        """
+        count = len(self.graph.polygons) if self.graph is not None else 0
+        if not 0 <= pid < count:
+            raise IndexError(f"remove_polygon: no polygon {pid} among {count}")
+        polygons = [p for i, p in enumerate(self.graph.polygons) if i != pid]
+        if pid == 0:
+            self.build(polygons, **dict(self._options, status=False))
+            return
+        removed = self.graph.polygons[pid]
+        self._update(PolygonGraph(polygons), removed, added=False)
+
+    def _update(self, graph, changed, added):
+        """Bring the graphs from self.graph to graph, which differs by the
+        polygon changed (its Points), added or removed. Graphs not built yet
+        are left to be built from graph."""
+        old_visibility = self._visibility_graph
+        old_bitangent_comp = self._bitangent_comp
+        old_inflection, old_extension = self._inflection, self._extension
+        self.graph = graph
+        self._pool = pool = PointPool(graph.get_points())
+        self._visibility_graph = self._bitangent_comp = None
+        self._convex_chains = self._inflection = self._extension = None
+        coords = np.concatenate((graph.coords, points_to_array(changed)))
+        span = coords.max(axis=0) - coords.min(axis=0)
+        # Geometry within this distance of the changed polygon is redone
+        tol = 1e-9 * max(float(np.hypot(*span)), 1.0)
+        outline = _outline(changed)
+
+        # Bitangents, inflection and extension rays by their (vertex, side)
+        old_rays = {}
+        for edge in old_bitangent_comp.get_edges() if old_bitangent_comp else ():
+            old_rays.setdefault(Edge(edge.p1, edge.dual.p1), []).append(edge)
+        old_inflection = {(e.p1, e.side): e for e in old_inflection.get_edges()} \
+            if old_inflection else None
+        old_extension = {(e.p1, e.side): e for e in old_extension.get_edges()} \
+            if old_extension else None
+        touched = _touched([r for rays in old_rays.values() for r in rays]
+                           + list((old_inflection or {}).values())
+                           + list((old_extension or {}).values()),
+                           outline, tol)
+
+        if old_visibility is not None:
+            # Vertices in sweep get all their bitangents anew
+            old_edges = list(old_visibility.get_edges())
+            if added:
+                crosses, touches = _contacts(edges_to_array(old_edges), outline, tol)
+                kept = [e for e, c, t in zip(old_edges, crosses, touches) if not (c or t)]
+                sweep = set(changed)
+                sweep.update(_cover([(e.p1, e.p2) for e, t in zip(old_edges, touches) if t]))
+            else:
+                removed = set(changed)
+                kept = [e for e in old_edges if e.p1 not in removed and e.p2 not in removed]
+                sweep = _cover(_opened_pairs(graph, kept, outline, tol))
+            lines = [e for e in kept if e.p1 not in sweep and e.p2 not in sweep]
+            for p1 in graph.get_points():
+                if p1 in sweep:
+                    lines.extend(_oriented(graph, p1, p2) for p2 in bitangent_lines(p1, graph))
+            # Insert in build's order, which decides the iteration order of the
+            # edge sets, and with it which of two equal rays a Graph keeps
+            vid = graph.vertex_id
+            lines.sort(key=lambda e: (vid(e.p1), angle(e.p1, e.p2), edge_distance(e.p1, e.p2)))
+            self._visibility_graph = Graph()
+            self._visibility_graph.add_edges(lines)
 
-        convex_chain(self.graph, self.convex_chains)
-        bitangent_complement(self.graph, self.visibility_graph, self.bitangent_comp)
-        inflection_lines(self.graph, self.convex_chains, self.inflection)
-        extension_lines(self.graph, self.convex_chains, self.extension)
+        if old_bitangent_comp is not None:
+            # Complements of unchanged bitangents are kept, with their duals,
+            # unless a ray of theirs meets the polygon
+            old_lines = {edge: edge for edge in old_edges}
+            self._bitangent_comp = Graph()
+            for edge in self._visibility_graph.get_edges():
+                old = old_lines.get(edge)
+                rays = old_rays.get(edge, ()) if old is not None and old.p1 is edge.p1 else ()
+                # One ray per end that is not a point obstacle, unless the
+                # Graph kept an equal ray of another bitangent instead
+                ends = sum(graph.get_next_point(p) is not None for p in (edge.p1, edge.p2))
+                if len(rays) == ends and not any(id(r) in touched for r in rays):
+                    # In complement_rays' order, the ray from edge.p1 first
+                    rays = sorted(rays, key=lambda r: r.p1 is not edge.p1)
+                    for ray in rays:
+                        ray.p2 = pool.intern(ray.p2)
+                else:
+                    rays = complement_rays(graph, edge, pool)
+                self._bitangent_comp.add_edges(rays)
+
+        def ray(old, source, vertex, side):
+            edge = old.get((vertex, side))
+            if edge is None or id(edge) in touched:
+                edge = ray_cast(source, vertex, graph, pool)
+                edge.side = side
+            else:
+                edge.p2 = pool.intern(edge.p2)
+            return edge
+
+        # Chains are rebuilt, as inflection_lines and extension_lines
+        # iterate them, and their rays kept unless touched
+        if old_inflection is not None:
+            self._inflection = Graph()
+            for chain_id, chain in self.convex_chains.chains.items():
+                if chain.start:
+                    self._inflection.add_edge(ray(old_inflection, graph.get_prev_point(chain.start),
+                                                  chain.start, CW))
+                    self._inflection.add_edge(ray(old_inflection, graph.get_next_point(chain.end),
+                                                  chain.end, CCW))
+        if old_extension is not None:
+            self._extension = Graph()
+            for chain_id, chain in self.convex_chains.chains.items():
+                for edge in chain.edges:
+                    self._extension.add_edge(ray(old_extension, edge.p1, edge.p2, CW))
+                    self._extension.add_edge(ray(old_extension, edge.p2, edge.p1, CCW))
 
     def find_visible_vertices(self, point):
         """Return all polygon vertices visible (bitangent) from point."""
         return bitangent_lines(point, self.graph)
 
+    def visibility_polygon(self, point):
+        """Return the VisibilityPolygon seen from point."""
+        return visibility_polygon(point, self.graph)
+
     def shortest_path(self, origin, destination):
         """Return shortest path between origin and destination as a list of Points."""
         origin_exists = origin in self.visibility_graph
@@ -76,7 +393,7 @@ class VisGraph:
         if origin_exists and dest_exists:
             return shortest_path(self.visibility_graph, origin, destination)
 
-        add_to_visg = PolygonGraph([])
+        add_to_visg = Graph()
         orgn = None if origin_exists else origin
         dest = None if dest_exists else destination
         if not origin_exists:
@@ -88,13 +405,189 @@ class VisGraph:
         return shortest_path(self.visibility_graph, origin, destination, add_to_visg)
 
     def point_in_polygon(self, point):
-        return point_in_polygon(point, self.graph)
+        return self.graph.locate(point)
 
     def point_in_wall(self, point):
         return point_in_wall(point, self.graph)
 
     def point_valid(self, point):
-        return point_valid(point, self.graph)
+        return self.graph.is_valid(point)
+
+    def points_valid(self, points):
+        """Boolean array: for each point, True if it is inside the wall and
+        outside all obstacles. Batch version of point_valid; points is a list
+        of Points or an (N, 2) array."""
+        return self.graph.valid_points(as_point_array(points))
+
+    def classify_points(self, points):
+        """Array of the point_in_polygon result for each point, given as a
+        list of Points or an (N, 2) array."""
+        return self.graph.locate_points(as_point_array(points))
 
     def closest_point(self, point, polygon_id, length=0.001):
-        return closest_point(point, self.graph, polygon_id, length)
+        edges, coords = self.graph.polygon_edge_array(polygon_id)
+        close_points, dists = closest_edge_points((point.x, point.y), coords)
+        i = int(np.argmin(dists))
+        return push_outside(point, self.graph, Point(*close_points[i]), edges[i], length)
+
+
+def _outline(polygon):
+    """(K, 4) array of the edges of polygon, a list of Points; a single
+    point is one zero-length edge."""
+    xy = points_to_array(polygon)
+    return np.concatenate((xy, np.roll(xy, -1, axis=0)), axis=1)
+
+
+def _contacts(segments, edges, tol):
+    """For each of the (M, 4) segments, whether it crosses one of the (K, 4)
+    edges with all four endpoints further than tol from the other line, and
+    whether it otherwise comes within tol of one. Returns (crosses, touches)."""
+    crosses = np.zeros(len(segments), dtype=bool)
+    touches = np.zeros(len(segments), dtype=bool)
+    lo = edges.reshape(-1, 2).min(axis=0) - tol
+    hi = edges.reshape(-1, 2).max(axis=0) + tol
+    a, b = segments[:, 0:2], segments[:, 2:4]
+    near = np.flatnonzero((np.minimum(a, b) <= hi).all(axis=1)
+                          & (np.maximum(a, b) >= lo).all(axis=1))
+    a, b = a[near], b[near]
+    ab = b - a
+    ab_length = np.hypot(ab[:, 0], ab[:, 1])
+    cross, touch = crosses[near], touches[near]
+    for c, d in zip(edges[:, 0:2], edges[:, 2:4]):
+        cd = d - c
+        cd_length = np.hypot(cd[0], cd[1])
+        s1 = ab[:, 0] * (c[1] - a[:, 1]) - ab[:, 1] * (c[0] - a[:, 0])
+        s2 = ab[:, 0] * (d[1] - a[:, 1]) - ab[:, 1] * (d[0] - a[:, 0])
+        s3 = cd[0] * (a[:, 1] - c[1]) - cd[1] * (a[:, 0] - c[0])
+        s4 = cd[0] * (b[:, 1] - c[1]) - cd[1] * (b[:, 0] - c[0])
+        margin, edge_margin = tol * ab_length, tol * cd_length
+        proper = (((s1 > margin) & (s2 < -margin)) | ((s1 < -margin) & (s2 > margin))) & (
+            ((s3 > edge_margin) & (s4 < -edge_margin)) | ((s3 < -edge_margin) & (s4 > edge_margin)))
+        meet = (s1 * s2 <= 0) & (s3 * s4 <= 0)
+        distance = np.minimum.reduce([
+            _point_segment_distance(c, a, b),
+            _point_segment_distance(d, a, b),
+            _point_segment_distance(a, c, d),
+            _point_segment_distance(b, c, d),
+        ])
+        cross |= proper
+        touch |= meet | (distance <= tol)
+    crosses[near] = cross
+    touches[near] = touch & ~cross
+    return crosses, touches
+
+
+def _point_segment_distance(p, a, b):
+    ab = b - a
+    ap = p - a
+    length2 = (ab * ab).sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(length2 > 0, np.clip((ap * ab).sum(axis=-1) / length2, 0, 1), 0)
+    offset = ap - t[..., None] * ab
+    return np.hypot(offset[..., 0], offset[..., 1])
+
+
+def _touched(rays, outline, tol):
+    """Return the ids of the rays that meet or nearly meet the polygon
+    outline, so may end on it or be cut short by it."""
+    crosses, touches = _contacts(edges_to_array(rays), outline, tol)
+    return {id(ray) for ray, c, t in zip(rays, crosses, touches) if c or t}
+
+
+def _cover(pairs):
+    """Return a set of Points holding at least one end of each pair,
+    preferring the Points in most pairs."""
+    count = {}
+    for pair in pairs:
+        for p in pair:
+            count[p] = count.get(p, 0) + 1
+    cover = set()
+    for p, q in pairs:
+        if p not in cover and q not in cover:
+            cover.add(p if count[p] >= count[q] else q)
+    return cover
+
+
+def _opened_pairs(graph, edges, outline, tol, chunk_size=256):
+    """Return the pairs of vertices of graph that are not joined by one of
+    edges but could be bitangent through the removed polygon outline: the
+    boundary at each end lies on one side of the line between them, as
+    bitangent_lines tests, and the segment meets the outline."""
+    xy = graph.coords
+    n = len(xy)
+    points = graph.get_points()
+    nxt, prv = graph.next_ids, graph.prev_ids
+    ids = {id(p): i for i, p in enumerate(points)}
+    joined = np.array(sorted(ids[id(e.p1)] * n + ids[id(e.p2)] for e in edges)
+                      + sorted(ids[id(e.p2)] * n + ids[id(e.p1)] for e in edges),
+                      dtype=np.intp)
+    lo = outline.reshape(-1, 2).min(axis=0) - tol
+    hi = outline.reshape(-1, 2).max(axis=0) + tol
+    pairs = []
+    for start in range(0, n, chunk_size):
+        rows = np.arange(start, min(start + chunk_size, n))
+        # Segment bounding boxes overlapping the outline's, upper triangle only
+        box = ((np.minimum(xy[rows, None, 0], xy[None, :, 0]) <= hi[0])
+               & (np.maximum(xy[rows, None, 0], xy[None, :, 0]) >= lo[0])
+               & (np.minimum(xy[rows, None, 1], xy[None, :, 1]) <= hi[1])
+               & (np.maximum(xy[rows, None, 1], xy[None, :, 1]) >= lo[1])
+               & (rows[:, None] < np.arange(n)[None, :]))
+        i, j = np.nonzero(box)
+        i = rows[i]
+        keep = ~np.isin(i * n + j, joined)
+        i, j = i[keep], j[keep]
+        keep = _tangent(xy, nxt, prv, i, j) & _tangent(xy, nxt, prv, j, i)
+        i, j = i[keep], j[keep]
+        crosses, touches = _contacts(np.concatenate((xy[i], xy[j]), axis=1), outline, tol)
+        meet = crosses | touches
+        pairs.extend((points[a], points[b]) for a, b in zip(i[meet].tolist(), j[meet].tolist()))
+    return pairs
+
+
+def _tangent(xy, nxt, prv, i, j):
+    """Whether both boundary edges at vertex j lie on one side of the line
+    from vertex i, or j is a point obstacle."""
+    free = nxt[j] < 0
+    sides = (ccw_array(xy[i], xy[j], xy[nxt[j]]), ccw_array(xy[i], xy[j], xy[prv[j]]))
+    return free | (sides[0] == sides[1])
+
+
+def _oriented(graph, p1, p2):
+    """Edge(p1, p2) as build adds it: from the vertex whose half scan finds
+    the other, the earlier vertex of graph when both do."""
+    forward = angle(p1, p2) <= pi
+    if forward and (angle(p2, p1) > pi or graph.vertex_id(p1) < graph.vertex_id(p2)):
+        return Edge(p1, p2)
+    return Edge(p2, p1)
+
+
+# Per-process state for the parallel visibility graph build
+_worker_graph = None
+_worker_points = None
+_worker_index = None
+
+
+def _init_worker(graph):
+    global _worker_graph, _worker_points, _worker_index
+    _worker_graph = graph
+    _worker_points = graph.get_points()
+    _worker_index = {id(p): i for i, p in enumerate(_worker_points)}
+
+
+def _ray_hits(queries):
+    """Return the (x, y) hit, or None, of each ray_key query."""
+    points = _worker_points
+    hits = []
+    for origin, away, l0, l1 in queries:
+        hit = ray_hit(_worker_graph, points[origin], points[away], (points[l0], points[l1]))
+        hits.append((hit.x, hit.y) if hit is not None else None)
+    return hits
+
+
+def _bitangent_batch(indices):
+    """Return [(i, [j, ...]), ...]: indices of the points visible from each point i."""
+    return [
+        (i, [_worker_index[id(p)]
+             for p in bitangent_lines(_worker_points[i], _worker_graph, scan="half")])
+        for i in indices
+    ]
@@ -23,8 +23,11 @@ SOFTWARE.
 """
 
 from __future__ import division
+from fractions import Fraction
 from math import pi, sqrt, atan, acos
-from pyvisgraph.classes import Point, Edge
+from random import Random
+import numpy as np
+from pyvisgraph.classes import Point, Edge, VisibilityPolygon
 
 INF = 10000
 CCW = 1
@@ -37,10 +40,13 @@ T = 10**COLIN_TOLERANCE
 T2 = 10.0**COLIN_TOLERANCE
 # Tolerance for ccw(): normalized cross product |sin θ| < T_ccw is treated as collinear.
 T_ccw = 1e-11
+# Relative band around T_ccw**2 where ccw() falls back to the normalized test
+_CCW_FILTER_HI = 1 + 1e-6
+_CCW_FILTER_LO = 1 - 1e-6
 T_on_segment = 0
 
 
-def bitangent_lines(point, graph, scan="full"):
+def bitangent_lines(point, graph, scan="full", points=None, edges=None, polygon=None):
     """Returns list of Points in graph visible by point.
 
     If origin and/or destination Points are given, these will also be checked
@@ -48,14 +54,23 @@ def bitangent_lines(point, graph, scan="full"):
     graph, 'half' will check for visibility against half the points. This saves
     running time when building a complete visibility graph, as the points
     that are not checked will eventually be 'point'.
+
+    points -- graph points already sorted by (angle, distance) around point.
+    edges  -- edges that may cross the half line from point along the
+              positive x-axis. Both default to the whole graph; see
+              shared_bitangent_lines.
+    polygon -- a VisibilityPolygon to fill with the boundary seen from
+              point, traced during the same sweep; see visibility_polygon.
     """
-    edges = graph.get_edges()
-    points = graph.get_points()
-    # if origin:
-    #     points.append(origin)
-    # if destination:
-    #     points.append(destination)
-    points.sort(key=lambda p: (angle(point, p), edge_distance(point, p)))
+    if edges is None:
+        edges = graph.get_edges()
+    if points is None:
+        points = graph.get_points()
+        # if origin:
+        #     points.append(origin)
+        # if destination:
+        #     points.append(destination)
+        points.sort(key=lambda p: (angle(point, p), edge_distance(point, p)))
 
     # Initialize open_edges with any intersecting edges on the half line from
     # point along the positive x-axis
@@ -74,26 +89,31 @@ def bitangent_lines(point, graph, scan="full"):
     visible = []
     prev = None
     prev_visible = None
+    prev_in_sight = False
+    point_edges = graph[point]
+    point_adjacent = graph.get_adjacent_points(point)
     for p in points:
         if p == point:
             continue
         if scan == "half" and angle(point, p) > pi:
             break
+        p_edges = graph[p]
 
         # Update open_edges - remove clock wise edges incident on p
         if open_edges:
-            for edge in graph[p]:
+            for edge in p_edges:
                 if ccw(point, p, edge.get_adjacent(p)) == CW:
                     open_edges.delete(point, p, edge)
 
         # Check if p is visible from point
         is_visible = False
-        # ...Non-collinear points
-        if (
+        collinear = not (
             prev is None
             or ccw(point, prev, p) != COLLINEAR
             or not on_segment(point, prev, p)
-        ):
+        )
+        # ...Non-collinear points
+        if not collinear:
             if len(open_edges) == 0:
                 is_visible = True
             elif not edge_intersect(point, p, open_edges.smallest()):
@@ -114,16 +134,27 @@ def bitangent_lines(point, graph, scan="full"):
             # if is_visible and edge_in_polygon(prev, p, graph):
             #         is_visible = False
 
-        # Check if the visible edge is interior to its polygon
-        if is_visible and p not in graph.get_adjacent_points(point):
-            is_visible = not edge_in_polygon(point, p, graph)
+        if polygon is not None:
+            # Line of sight, before the bitangent checks below; a collinear
+            # point is in sight along the polygon edge from prev
+            if collinear:
+                in_sight = prev_in_sight and p in graph.get_adjacent_points(prev)
+            else:
+                # edge_intersect also blocks p on an edge that just touches
+                # it; the boundary needs the edge to cross before p
+                in_sight = is_visible or point_edge_distance(
+                    point, p, open_edges.smallest()
+                ) >= edge_distance(point, p) * (1 - 1e-9)
+            if in_sight:
+                _trace_boundary(point, p, prev, graph, open_edges, polygon)
+            prev_in_sight = in_sight
 
         # Check the two ends of a bitangent line, 
         # the two edges on each side should be on the same side of the line
         point_count = 0
         if is_visible:
             sides = []
-            _edges = graph[p]
+            _edges = p_edges
             if len(_edges) == 2:
                 for _edge in _edges:
                     sides.append(ccw(point, p, _edge.get_adjacent(p)))
@@ -141,7 +172,7 @@ def bitangent_lines(point, graph, scan="full"):
 
         if is_visible:
             sides = []
-            _edges = graph[point]
+            _edges = point_edges
             if len(_edges) == 2:
                 for edge in _edges:
                     sides.append(ccw(p, point, edge.get_adjacent(point)))
@@ -160,11 +191,16 @@ def bitangent_lines(point, graph, scan="full"):
         if scan == "half" and point_count > 1:
             is_visible = False
 
+        # Check if the visible edge is interior to its polygon. This walks
+        # every edge of the polygon, so it runs after the local tangent checks.
+        if is_visible and p not in point_adjacent:
+            is_visible = not edge_in_polygon(point, p, graph)
+
         if is_visible:
             visible.append(p)
 
         # Update open_edges - Add counter clock wise edges incident on p
-        for edge in graph[p]:
+        for edge in p_edges:
             if (point not in edge) and ccw(point, p, edge.get_adjacent(p)) == CCW:
                 open_edges.insert(point, p, edge)
 
@@ -173,20 +209,363 @@ def bitangent_lines(point, graph, scan="full"):
     return visible
 
 
+def visibility_polygon(point, graph):
+    """Return the VisibilityPolygon of point: the boundary of the region
+    visible from it, together with its bitangent vertices and the shadow
+    point behind each tangent vertex, all from one bitangent_lines sweep."""
+    polygon = VisibilityPolygon(point)
+    polygon.bitangents = bitangent_lines(point, graph, polygon=polygon)
+    return polygon
+
+
+def _trace_boundary(point, p, prev, graph, open_edges, polygon):
+    """Add the boundary around p, a vertex in sight of point, to polygon.
+
+    Called with the edges on the clockwise side of p already closed and
+    those on its counter clockwise side not yet opened, so the nearest open
+    edge is the one the view drops onto past a tangent vertex.
+    """
+    before = after = False
+    for edge in graph[p]:
+        q = edge.get_adjacent(p)
+        side = ccw(point, p, q)
+        if side == COLLINEAR:
+            # An edge along the scan line: the sweep reached its near end
+            # just before p
+            side = CW if q is prev else CCW
+        if side == CW:
+            before = True
+        else:
+            after = True
+    if before and after:
+        polygon.vertices.append(p)
+        return
+    shadow = None
+    if open_edges:
+        edge = open_edges.smallest()
+        hit = intersect_point(point, p, edge)
+        if hit is not None:
+            shadow = hit
+            polygon.shadows[p] = (hit, edge)
+    # Enter p from the shadow, leave it for the shadow, or both for an
+    # isolated point
+    if shadow is not None and not before:
+        polygon.vertices.append(shadow)
+    polygon.vertices.append(p)
+    if shadow is not None and not after:
+        polygon.vertices.append(shadow)
+
+
+def shared_bitangent_lines(graph, scan="half", chunk_size=256):
+    """Yield (point, visible) for every point of graph, a PolygonGraph, in
+    get_points() order.
+
+    Gives the same result as calling bitangent_lines on each point, from one
+    rotational sweep over all points instead of one angular sort and sweep
+    per point. A rotation tree (Overmars and Welzl, "New methods for
+    computing visibility graphs", 1988) hands out every pair of points once,
+    in angular order around both of them, so the whole graph takes O(n^2)
+    time rather than O(n^2 log n), and no n x n angle matrix is built.
+
+    Each point keeps the edge its sweep line currently meets first, or SELF
+    while the line runs into the point's own polygon. When the sweep of p
+    passes q, q is in sight if it is nearer than that edge, and past q the
+    line meets an edge leaving q on the far side, or else whatever the line
+    of q meets in the same direction; the tree has brought q's own sweep up
+    to exactly that direction. The bitangent checks are those of
+    bitangent_lines. chunk_size rows of points are held in memory while the
+    first edge of each sweep line is found.
+    """
+    points = graph.get_points()
+    n = len(points)
+    if n == 0:
+        return
+    xs = [p.x for p in points]
+    ys = [p.y for p in points]
+    ends = [tuple(e) for e in graph.edge_ids.tolist()]
+    nbrs = [[] for _ in range(n)]  # (neighbour id, edge index)
+    for k, (a, b) in enumerate(ends):
+        nbrs[a].append((b, k))
+        nbrs[b].append((a, k))
+    for i in range(n):
+        if len(nbrs[i]) not in (0, 2):
+            raise Exception(
+                "len(_edges) should be 0 or 2, but is {}".format(len(nbrs[i]))
+            )
+    next_ids = graph.next_ids.tolist()
+    prev_ids = graph.prev_ids.tolist()
+
+    def orient(a, b, c):
+        return _cross_sign(xs[a], ys[a], xs[b], ys[b], xs[a], ys[a], xs[c], ys[c])
+
+    # The sweep turns every line from just above the positive x-axis up to
+    # the negative x-axis, so q is ahead of p if it is higher, or as high
+    # and further left. blocker holds an edge index, SELF or _OPEN.
+    key = list(zip(ys, [-x for x in xs]))
+    blocker = _first_edges(xs, ys, ends, chunk_size)
+    for i in range(n):
+        if nbrs[i] and not _free_along_x(xs, ys, i, prev_ids[i], next_ids[i], orient):
+            blocker[i] = _SELF
+
+    def handle(p, q):
+        """Move the sweep of p past q; True if q is in sight of p."""
+        b = blocker[p]
+        adjacent = q == next_ids[p] or q == prev_ids[p]
+        if adjacent:
+            in_sight = True
+        elif b == _SELF:
+            in_sight = False
+        elif b == _OPEN or q in ends[b]:
+            in_sight = True
+        else:
+            side = orient(ends[b][0], ends[b][1], p)
+            in_sight = side != 0 and orient(ends[b][0], ends[b][1], q) == side
+        if q == next_ids[p]:
+            # Past the edge to next, the line runs into p's own polygon
+            blocker[p] = _SELF
+        elif in_sight and nbrs[q]:
+            blocker[p] = _edge_past(p, q, nbrs, orient, blocker, xs, ys)
+        return in_sight
+
+    def less(a, b, c, d):
+        """Return True if the line from a to b comes before the one from c to d."""
+        if b >= n or d >= n:
+            return b != d and (b == neg or d == pos)
+        s = _cross_sign(xs[a], ys[a], xs[b], ys[b], xs[c], ys[c], xs[d], ys[d])
+        if s:
+            return s > 0
+        if a == c:
+            # Along one line, the nearer point first
+            return (xs[b] - xs[a]) ** 2 + (ys[b] - ys[a]) ** 2 < (
+                xs[d] - xs[a]
+            ) ** 2 + (ys[d] - ys[a]) ** 2
+        # Along a line through several points, (c, a) before (a, b)
+        return b == c
+
+    # The rotation tree: each point hangs from the point ahead of it that
+    # its sweep reaches next, children ordered by that direction. neg and
+    # pos stand for the points at infinity below and above.
+    neg, pos = n, n + 1
+    order = sorted(range(n), key=key.__getitem__, reverse=True)
+    parent = [neg] * n + [pos, -1]
+    first = [-1] * (n + 2)
+    last = [-1] * (n + 2)
+    left = [-1] * (n + 2)
+    right = [-1] * (n + 2)
+    for a, b in zip(order, order[1:]):
+        right[a], left[b] = b, a
+    first[neg], last[neg] = order[0], order[-1]
+    first[pos] = last[pos] = neg
+
+    visible = [[] for _ in range(n)]
+    level = [[] for _ in range(n)]  # in sight along the positive x-axis
+    prev = [-1] * n
+    stack = [order[0]]
+    while stack:
+        p = stack.pop()
+        q = parent[p]
+        # Only a leftmost leaf has its next pair ready
+        if first[p] != -1 or q == pos or first[q] != p:
+            continue
+        p_right = right[p]
+        if q != neg:
+            in_sight = handle(p, q)
+            r, prev[p] = prev[p], q
+            # ...but further points on the same line are not, as in
+            # bitangent_lines
+            if in_sight and not (
+                r >= 0
+                and ccw(points[p], points[r], points[q]) == COLLINEAR
+                and on_segment(points[p], points[r], points[q])
+            ) and _is_bitangent(points[p], points[q], nbrs[p], nbrs[q], points, scan):
+                visible[p].append(points[q])
+                if ys[q] == ys[p]:
+                    level[q].append(points[p])
+
+        # Detach p from q and hang it from the first point ahead of it
+        # after q, found to the left of q in the tree
+        first[q] = p_right
+        if p_right != -1:
+            left[p_right] = -1
+        else:
+            last[q] = -1
+        t, z = parent[q], left[q]
+        if z == -1 or not (key[z] > key[p] and less(p, q, p, z) and less(p, z, p, t)):
+            left[p], right[p] = z, q
+            if z != -1:
+                right[z] = p
+            else:
+                first[t] = p
+            left[q] = p
+            parent[p] = t
+        else:
+            c = last[z]
+            while c != -1 and key[c] > key[p] and less(p, q, p, c) and less(p, c, p, z):
+                z, c = c, last[c]
+            left[p], right[p] = c, -1
+            if c != -1:
+                right[c] = p
+            else:
+                first[z] = p
+            last[z] = p
+            parent[p] = z
+
+        if parent[p] != pos and first[parent[p]] == p:
+            stack.append(p)
+        if p_right != -1:
+            stack.append(p_right)
+
+    for i in range(n):
+        level[i].sort(key=lambda p: abs(p.x - xs[i]))
+        yield points[i], level[i] + visible[i]
+
+
+# Sweep line states of shared_bitangent_lines besides an edge index
+_SELF = -1
+_OPEN = -2
+
+
+def _cross_sign(ax, ay, bx, by, cx, cy, dx, dy):
+    """Return the sign of the cross product (b - a) x (d - c), computed
+    exactly: a float filter, with Fractions for the results near 0."""
+    ux, uy, vx, vy = bx - ax, by - ay, dx - cx, dy - cy
+    t1 = ux * vy
+    t2 = uy * vx
+    det = t1 - t2
+    bound = 1e-15 * (abs(t1) + abs(t2))
+    if det > bound:
+        return 1
+    if det < -bound:
+        return -1
+    if t1 == 0 and t2 == 0:
+        return 0
+    F = Fraction
+    det = (F(bx) - F(ax)) * (F(dy) - F(cy)) - (F(by) - F(ay)) * (F(dx) - F(cx))
+    return (det > 0) - (det < 0)
+
+
+def _first_edges(xs, ys, ends, chunk_size):
+    """Index of the edge the line from each point along the positive
+    x-axis, tilted up by an infinitesimal angle, meets first; _OPEN if none.
+
+    An edge from a point on the line counts if it rises from it, and the
+    edges of the point itself never do.
+    """
+    n = len(xs)
+    blocker = [_OPEN] * n
+    if not ends:
+        return blocker
+    ex = np.array([[xs[a], xs[b]] for a, b in ends])
+    ey = np.array([[ys[a], ys[b]] for a, b in ends])
+    low = ey.argmin(axis=1)
+    rows = np.arange(len(ends))
+    x0, y0 = ex[rows, low], ey[rows, low]
+    x1, y1 = ex[rows, 1 - low], ey[rows, 1 - low]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (x1 - x0) / (y1 - y0)
+    px, py = np.array(xs), np.array(ys)
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        y = py[start:stop, None]
+        with np.errstate(invalid="ignore"):
+            hit_x = np.where(y0 == y, x0, x0 + (y - y0) * slope)
+        hit = (y0 <= y) & (y < y1) & (hit_x > px[start:stop, None])
+        hit_x = np.where(hit, hit_x, np.inf)
+        nearest = hit_x.min(axis=1)
+        # Edges from one point on the line: the one that rises the least
+        # to the right is met first
+        ties = np.where(hit_x == nearest[:, None], slope, np.inf)
+        for i, k, d in zip(range(start, stop), ties.argmin(axis=1), nearest):
+            if d < np.inf:
+                blocker[i] = int(k)
+    return blocker
+
+
+def _free_along_x(xs, ys, v, u, w, orient):
+    """Return True if the line from vertex v along the positive x-axis,
+    tilted up by an infinitesimal angle, leaves into the free space; u and
+    w are the previous and next vertices of v. The infeasible side of each
+    edge is on its left, so the free space at v lies counter clockwise from
+    v->u to v->w."""
+    ax, ay = xs[u] - xs[v], ys[u] - ys[v]
+    bx, by = xs[w] - xs[v], ys[w] - ys[v]
+    # Signs of a x d and d x b for d = (1, eps)
+    a_d = -ay if ay else ax
+    d_b = by if by else -bx
+    turn = orient(v, u, w)
+    if turn > 0:
+        return a_d > 0 and d_b > 0
+    if turn < 0:
+        return a_d > 0 or d_b > 0
+    if ax * bx + ay * by < 0:
+        return a_d > 0
+    return True
+
+
+def _edge_past(p, q, nbrs, orient, blocker, xs, ys):
+    """Return the edge the sweep line of p meets just past q, a vertex in
+    sight of it."""
+    # Edges of q on the far (counter clockwise) side of the line; an edge
+    # along the line counts as on that side if it leads away from p
+    ahead = []
+    for r, k in nbrs[q]:
+        if r == p:
+            continue
+        side = orient(p, q, r)
+        along = side == 0
+        if along:
+            side = (xs[r] - xs[q]) * (xs[q] - xs[p]) + (ys[r] - ys[q]) * (ys[q] - ys[p])
+        if side > 0:
+            ahead.append((r, k, along))
+    if not ahead:
+        # The line passes q and goes on as q's own line does
+        return blocker[q]
+    if len(ahead) == 1:
+        return ahead[0][1]
+    (r1, k1, along1), (r2, k2, along2) = ahead
+    if along1 or along2:
+        return k2 if along1 else k1
+    # The edge that turns back further towards p is met first
+    return k1 if orient(q, r2, r1) > 0 else k2
+
+
+def _is_bitangent(point, p, point_nbrs, p_nbrs, points, scan):
+    """The checks bitangent_lines makes on p, in sight of point: the
+    neighbours of each end lie on one side of the line, and two point
+    obstacles are not joined in a 'half' scan."""
+    point_count = 0
+    if p_nbrs:
+        if ccw(point, p, points[p_nbrs[0][0]]) != ccw(point, p, points[p_nbrs[1][0]]):
+            return False
+    else:
+        point_count += 1
+    if point_nbrs:
+        if ccw(p, point, points[point_nbrs[0][0]]) != ccw(p, point, points[point_nbrs[1][0]]):
+            return False
+    else:
+        point_count += 1
+    return not (scan == "half" and point_count > 1)
+
+
 def convex_chain(graph, conv_chain):
     """_summary_
     convex_chain compute the convex vertex chains in 'graph', and put them in 'conv_chain'
+
+    One pass along each polygon's boundary: a chain is a run of consecutive
+    convex vertices, kept in boundary order with the edges between them. The
+    run still open when the pass gets back to the start continues into the
+    first run, and is joined to it; if every vertex is convex, the one chain
+    is closed.
+
     Args:
         graph (PolygonGraph): The original graph
         conv_chain (ChainGraph): The convex chain graph
 
     Raises:
-        Exception: _description_
-        Exception: _description_
+        Exception: A polygon vertex has no prev or next point
     """
     chain_id = 0
     for pid, polygon in graph.polygon_vertices.items():
-        chain_id_init = chain_id
         is_prev_conv = False
 
         p = polygon[0]
@@ -198,6 +577,7 @@ def convex_chain(graph, conv_chain):
         if ccw(p_p, prev_point, p_n) == CCW:
             is_prev_conv = True
 
+        runs = []  # (chain_points, chain_edges) of each run ended in the pass
         chain_points = []
         chain_edges = []
         for i in range(len(polygon)):
@@ -210,137 +590,133 @@ def convex_chain(graph, conv_chain):
                 if (
                     is_prev_conv
                 ):  # If the previos vertex is also convex, add the edge between them
-                    chain_edges.append(list(graph[p_p, p])[0])
+                    chain_edges.append(graph.get_prev_edge(p))
                 is_prev_conv = True
             else:
                 if is_prev_conv:  # Reach the end of the chain
-                    conv_chain.new_chain(chain_id, chain_points, chain_edges)
+                    runs.append((chain_points, chain_edges))
                     chain_points = []
                     chain_edges = []
-                    chain_id += 1
                 is_prev_conv = False
             p = p_n
 
+        # Chain ids as when the last run was merged into the first by id,
+        # which took an id of its own
+        n_ids = len(runs) + bool(chain_points)
         if chain_points:
-            # If vertices remain in the current chain after traverse the polygon,
-            # it means the chain continues from end of the polygon to the beginning of the polygon
-            conv_chain.add_or_new_chain(chain_id_init, chain_points, chain_edges)
-            chain_points = []
-            chain_edges = []
-            chain_id += 1
+            # The last run continues into the first, which began at polygon[0]
+            if runs:
+                first_points, first_edges = runs[0]
+                runs[0] = (chain_points + first_points, chain_edges + first_edges)
+            else:
+                # A closed chain, whose first edge closes it
+                runs.append((chain_points, chain_edges[1:] + chain_edges[:1]))
+        for k, (points, edges) in enumerate(runs):
+            conv_chain.new_chain(chain_id + k, points, edges)
+        chain_id += n_ids
 
 
-def bitangent_complement(graph, visgraph, bitcomp):
+def bitangent_complement(graph, visgraph, bitcomp, pool=None, hits=None):
     # Calculate Bitangent Complement Lines
+    # pool (PointPool), if given, interns the hit points
+    # hits, if given, holds the ray casts precomputed (see ray_hit)
     for bit_line in visgraph.get_edges():
         # print(bit_line)
-        p1 = bit_line.p1
-        p2 = bit_line.p2
-        p1_d_min = float("inf")
-        p1_p_min = None
-        p2_d_min = float("inf")
-        p2_p_min = None
-        p1_vec = (p2 - p1).to_vec()
-        p2_vec = p1_vec * -1
-        for edge in graph.get_edges():
-            p = intersect_point(p1, p2, edge)
-            if p and p != p1 and p != p2 and on_segment(edge.p1, p, edge.p2):
-                # print(edge)
-                # print(p)
-                if (p - p1).to_vec().dot(p1_vec) < 0:
-                    d = edge_distance(p, p1)
-                    if d < p1_d_min:
-                        p1_d_min = d
-                        p1_p_min = p
-                if (p - p2).to_vec().dot(p2_vec) < 0:
-                    d = edge_distance(p, p2)
-                    if d < p2_d_min:
-                        p2_d_min = d
-                        p2_p_min = p
-        edge1 = None
-        edge2 = None
-        if p1_p_min:
-            _next_point = graph.get_next_point(bit_line.p1)
-            if _next_point:
-                edge1 = Edge(bit_line.p1, p1_p_min)
-                edge1.side = ccw(p1_p_min, bit_line.p1, _next_point)
-                if edge1.side == COLLINEAR:
-                    raise Exception(
-                        "ERROR: Bitangent complement is collinear with a boundary edge"
-                    )
-                bitcomp.add_edge(edge1)
-        else:
-            raise Exception("bitangent complement for p1 not found")
-
-        if p2_p_min:
-            _next_point = graph.get_next_point(bit_line.p2)
-            if _next_point:
-                edge2 = Edge(bit_line.p2, p2_p_min)
-                edge2.side = ccw(p2_p_min, bit_line.p2, _next_point)
-                if edge2.side == COLLINEAR:
-                    raise Exception(
-                        "ERROR: Bitangent complement is collinear with a boundary edge"
-                    )
-                bitcomp.add_edge(edge2)
-        else:
-            raise Exception("bitangent complement for p2 not found")
-
-        if edge1 and edge2:
-            edge1.dual = edge2
-            edge2.dual = edge1
-        elif edge1 and not edge2:
-            # for point obstacle, the gap has no side, thus side = 0
-            edge1.dual = Edge(bit_line.p2, bit_line.p2, side=0)
-        elif edge2 and not edge1:
-            edge2.dual = Edge(bit_line.p1, bit_line.p1, side=0)
-        else:
-            raise Exception("ERROR: Both bitangent complements are None")
+        for edge in complement_rays(graph, bit_line, pool, hits):
+            bitcomp.add_edge(edge)
+
+
+def complement_rays(graph, bit_line, pool=None, hits=None):
+    """Return the bitangent complement rays of bit_line, dual to each other:
+    (edge1, edge2), or only the one from its end that is not a point
+    obstacle."""
+    p1 = bit_line.p1
+    p2 = bit_line.p2
+    # Extend the bitangent beyond each end until it hits the boundary
+    p1_p_min = ray_hit(graph, p1, p2, (p1, p2), hits)
+    p2_p_min = ray_hit(graph, p2, p1, (p1, p2), hits)
+    if pool is not None:
+        p1_p_min = p1_p_min and pool.intern(p1_p_min)
+        p2_p_min = p2_p_min and pool.intern(p2_p_min)
+    edge1 = None
+    edge2 = None
+    if p1_p_min:
+        _next_point = graph.get_next_point(bit_line.p1)
+        if _next_point:
+            edge1 = Edge(bit_line.p1, p1_p_min)
+            edge1.side = ccw(p1_p_min, bit_line.p1, _next_point)
+            if edge1.side == COLLINEAR:
+                raise Exception(
+                    "ERROR: Bitangent complement is collinear with a boundary edge"
+                )
+    else:
+        raise Exception("bitangent complement for p1 not found")
+
+    if p2_p_min:
+        _next_point = graph.get_next_point(bit_line.p2)
+        if _next_point:
+            edge2 = Edge(bit_line.p2, p2_p_min)
+            edge2.side = ccw(p2_p_min, bit_line.p2, _next_point)
+            if edge2.side == COLLINEAR:
+                raise Exception(
+                    "ERROR: Bitangent complement is collinear with a boundary edge"
+                )
+    else:
+        raise Exception("bitangent complement for p2 not found")
+
+    if edge1 and edge2:
+        edge1.dual = edge2
+        edge2.dual = edge1
+        return edge1, edge2
+    elif edge1 and not edge2:
+        # for point obstacle, the gap has no side, thus side = 0
+        edge1.dual = Edge(bit_line.p2, bit_line.p2, side=0)
+        return (edge1,)
+    elif edge2 and not edge1:
+        edge2.dual = Edge(bit_line.p1, bit_line.p1, side=0)
+        return (edge2,)
+    else:
+        raise Exception("ERROR: Both bitangent complements are None")
 
 
-def inflection_lines(graph, conv_chain, inflx):
+def inflection_lines(graph, conv_chain, inflx, pool=None, hits=None):
     for chain_id, chain in conv_chain.chains.items():
         if chain.start:
             p_p = graph.get_prev_point(chain.start)
-            edge = ray_cast(p_p, chain.start, graph)
+            edge = ray_cast(p_p, chain.start, graph, pool, hits)
             edge.side = CW  # In GUI, boundary on the lhs
             inflx.add_edge(edge)
 
             p_n = graph.get_next_point(chain.end)
-            edge = ray_cast(p_n, chain.end, graph)
+            edge = ray_cast(p_n, chain.end, graph, pool, hits)
             edge.side = CCW  # In GUI, boundary on the rhs
             inflx.add_edge(edge)
 
 
-def extension_lines(graph, conv_chain, extlines):
+def extension_lines(graph, conv_chain, extlines, pool=None, hits=None):
     # lines where the gap vertex changes
     # They are extension of convex chains except for the inflection lines
     for chain_id, chain in conv_chain.chains.items():
         for edge in chain.edges:
-            extline = ray_cast(edge.p1, edge.p2, graph)
+            extline = ray_cast(edge.p1, edge.p2, graph, pool, hits)
             extline.side = CW
             extlines.add_edge(extline)
 
-            extline = ray_cast(edge.p2, edge.p1, graph)
+            extline = ray_cast(edge.p2, edge.p1, graph, pool, hits)
             extline.side = CCW
             extlines.add_edge(extline)
 
 
-def ray_cast(p1, p2, graph):
+def ray_cast(p1, p2, graph, pool=None, hits=None):
     """
-    extend an ray from p2 in the direction of p1->p2 until it hit an edge
+    extend an ray from p2 in the direction of p1->p2 until it hit an edge;
+    pool (PointPool), if given, interns the hit point; hits, if given,
+    holds the ray casts precomputed (see ray_hit)
     """
-    p2_d_min = float("inf")
-    p2_p_min = None
-    p2_vec = (p2 - p1).to_vec()
-    for edge in graph.get_edges():
-        p = intersect_point(p1, p2, edge)
-        if p and p != p1 and p != p2 and on_segment(edge.p1, p, edge.p2):
-            if (p - p2).to_vec().dot(p2_vec) > 0:
-                d = edge_distance(p, p2)
-                if d < p2_d_min:
-                    p2_d_min = d
-                    p2_p_min = p
+    p2_p_min = ray_hit(graph, p2, p1, (p1, p2), hits)
     if p2_p_min:
+        if pool is not None:
+            p2_p_min = pool.intern(p2_p_min)
         edge = Edge(p2, p2_p_min)
         edge.side = ccw(p2_p_min, p2, graph.get_next_point(p2))
         return edge
@@ -348,6 +724,24 @@ def ray_cast(p1, p2, graph):
         raise Exception("Cannot extend p1->p2")
 
 
+def ray_hit(graph, origin, away, line, hits=None):
+    """Return the point where the ray from origin, pointing directly away
+    from away, first hits the boundary, or None. Edges at either point of
+    line, the pair (origin and away in some order) handed to intersect_point,
+    are ignored. hits, if given, maps ray_key of each ray cast to its hit
+    point, computed beforehand, e.g. in other processes."""
+    if hits is not None:
+        return hits[ray_key(graph, origin, away, line)]
+    hit, _ = graph.first_hit(origin, origin - away, exclude=line, line=line)
+    return hit
+
+
+def ray_key(graph, origin, away, line):
+    """The vertex ids of the ray cast ray_hit(graph, origin, away, line)."""
+    return (graph.vertex_id(origin), graph.vertex_id(away),
+            graph.vertex_id(line[0]), graph.vertex_id(line[1]))
+
+
 def polygon_crossing(p1, poly_edges):
     """Returns True if Point p1 is internal to the polygon. The polygon is
     defined by the Edges in poly_edges. Uses crossings algorithm and takes into
@@ -361,22 +755,27 @@ def polygon_crossing(p1, poly_edges):
             continue
         if p1.x > edge.p1.x and p1.x > edge.p2.x:
             continue
-        # Deal with points collinear to p1
-        edge_p1_collinear = ccw(p1, edge.p1, p2) == COLLINEAR
-        edge_p2_collinear = ccw(p1, edge.p2, p2) == COLLINEAR
-        if edge_p1_collinear and edge_p2_collinear:
-            continue
-        if edge_p1_collinear or edge_p2_collinear:
-            collinear_point = edge.p1 if edge_p1_collinear else edge.p2
-            if collinear_point.x > p1.x and edge.get_adjacent(collinear_point).y > p1.y:
-                intersect_count += 1
-        elif edge_intersect(p1, p2, edge):
+        if ray_crosses_edge(p1, p2, edge):
             intersect_count += 1
     if intersect_count % 2 == 0:
         return False
     return True
 
 
+def ray_crosses_edge(p1, p2, edge):
+    """Whether polygon_crossing() counts edge for the ray from p1 to p2 =
+    Point(INF, p1.y), once the edge has passed its bounding checks."""
+    # Deal with points collinear to p1
+    edge_p1_collinear = ccw(p1, edge.p1, p2) == COLLINEAR
+    edge_p2_collinear = ccw(p1, edge.p2, p2) == COLLINEAR
+    if edge_p1_collinear and edge_p2_collinear:
+        return False
+    if edge_p1_collinear or edge_p2_collinear:
+        collinear_point = edge.p1 if edge_p1_collinear else edge.p2
+        return collinear_point.x > p1.x and edge.get_adjacent(collinear_point).y > p1.y
+    return edge_intersect(p1, p2, edge)
+
+
 def edge_in_polygon(p1, p2, graph):
     """Return true if the edge from p1 to p2 is interior to any polygon
     in graph."""
@@ -449,8 +848,12 @@ def closest_point(p, graph, polygon_id, length=0.001):
             close_dist = d
             close_point = pc
             close_edge = e
+    return push_outside(p, graph, close_point, close_edge, length)
+
 
-    # Extend the newly found point so it is outside the polygon by `length`.
+def push_outside(p, graph, close_point, close_edge, length=0.001):
+    """Second step of closest_point: move close_point, the point of
+    close_edge closest to p, outside the polygon by length."""
     if close_point in close_edge:
         c = close_edge.p1 if close_point == close_edge.p1 else close_edge.p2
         edges = list(graph[c])
@@ -557,20 +960,37 @@ def angle2(point_a, point_b, point_c):
     if a == 0 or c == 0:
         return 0
     cos_value = (a + c - b) / (2 * sqrt(a) * sqrt(c))
-    return acos(int(cos_value * T) / T2)
+    # Rounding can push |cos| slightly past 1 for near-collinear points
+    return acos(max(-1.0, min(1.0, int(cos_value * T) / T2)))
 
 
 def ccw(A, B, C):
     """Return 1 if counter clockwise, -1 if clock wise, 0 if collinear"""
-    v_AB = [(B.x - A.x), (B.y - A.y)]
-    v_AC = [(C.x - A.x), (C.y - A.y)]
-    n_AB = sqrt(v_AB[0] ** 2 + v_AB[1] ** 2)
-    n_AC = sqrt(v_AC[0] ** 2 + v_AC[1] ** 2)
-    if n_AB == 0 or n_AC == 0:
+    abx = B.x - A.x
+    aby = B.y - A.y
+    acx = C.x - A.x
+    acy = C.y - A.y
+    n2_AB = abx * abx + aby * aby
+    n2_AC = acx * acx + acy * acy
+    if n2_AB == 0 or n2_AC == 0:
+        return 0
+
+    # Compare area**2 with T_ccw**2 * |AB|**2 * |AC|**2 instead of dividing by
+    # both norms. The bands are far wider than the rounding error of either
+    # form, so only cases right at the tolerance need the normalized test.
+    area = abx * acy - aby * acx
+    area2 = area * area
+    bound = T_ccw * T_ccw * n2_AB * n2_AC
+    if area2 > bound * _CCW_FILTER_HI:
+        return CCW if area > 0 else CW
+    if area2 < bound * _CCW_FILTER_LO:
         return 0
+    return _ccw_normalized(area, n2_AB, n2_AC)
 
-    area = float(v_AB[0] * v_AC[1] - v_AB[1] * v_AC[0])
-    collinear_coef = area / n_AB / n_AC
+
+def _ccw_normalized(area, n2_AB, n2_AC):
+    """The normalized-cross-product test that ccw() filters for."""
+    collinear_coef = float(area) / sqrt(n2_AB) / sqrt(n2_AC)
 
     if collinear_coef > T_ccw:
         return CCW
@@ -636,19 +1056,72 @@ def edge_intersect(p1, q1, edge):
 
 
 class OpenEdges(object):
+    """Edges crossed by the current scan line of the angular sweep, ordered by
+    their distance from the scan origin (see _less_than).
+
+    The edges are kept in a treap with parent links. insert descends the tree
+    with _less_than, so it costs O(log n) comparisons instead of the O(n)
+    list.insert of a sorted list. delete looks the node up by edge and needs
+    no comparisons at all. Nodes are keyed by id(edge): the sweep always
+    passes the Edge objects stored in the graph.
+    """
+
     def __init__(self):
-        self._open_edges = []
+        self._root = None
+        self._nodes = {}
+        self._len = 0
 
     def insert(self, p1, p2, edge):
-        self._open_edges.insert(self._index(p1, p2, edge), edge)
+        self._len += 1
+        node = self._nodes.get(id(edge))
+        if node is not None:
+            node.count += 1
+            return
+        node = _OpenEdgeNode(edge)
+        self._nodes[id(edge)] = node
+        if self._root is None:
+            self._root = node
+            return
+        parent = self._root
+        while True:
+            if self._less_than(p1, p2, edge, parent.edge):
+                if parent.left is None:
+                    parent.left = node
+                    break
+                parent = parent.left
+            else:
+                if parent.right is None:
+                    parent.right = node
+                    break
+                parent = parent.right
+        node.parent = parent
+        while node.parent is not None and node.priority > node.parent.priority:
+            self._rotate_up(node)
 
     def delete(self, p1, p2, edge):
-        index = self._index(p1, p2, edge) - 1
-        if self._open_edges[index] == edge:
-            del self._open_edges[index]
+        node = self._nodes.get(id(edge))
+        if node is None:
+            return
+        self._len -= 1
+        if node.count > 1:
+            node.count -= 1
+            return
+        del self._nodes[id(edge)]
+        while node.left is not None and node.right is not None:
+            if node.left.priority > node.right.priority:
+                self._rotate_up(node.left)
+            else:
+                self._rotate_up(node.right)
+        child = node.left if node.left is not None else node.right
+        self._replace(node, child)
 
     def smallest(self):
-        return self._open_edges[0]
+        node = self._root
+        if node is None:
+            raise IndexError("smallest: OpenEdges is empty")
+        while node.left is not None:
+            node = node.left
+        return node.edge
 
     def _less_than(self, p1, p2, edge1, edge2):
         """Return True if edge1 is smaller than edge2, False otherwise."""
@@ -674,19 +1147,66 @@ class OpenEdges(object):
                 return True
             return False
 
-    def _index(self, p1, p2, edge):
-        lo = 0
-        hi = len(self._open_edges)
-        while lo < hi:
-            mid = (lo + hi) // 2
-            if self._less_than(p1, p2, edge, self._open_edges[mid]):
-                hi = mid
-            else:
-                lo = mid + 1
-        return lo
+    def _rotate_up(self, node):
+        """Rotate node above its parent, keeping the in-order sequence."""
+        parent = node.parent
+        if node is parent.left:
+            parent.left = node.right
+            if node.right is not None:
+                node.right.parent = parent
+            node.right = parent
+        else:
+            parent.right = node.left
+            if node.left is not None:
+                node.left.parent = parent
+            node.left = parent
+        self._replace(parent, node)
+        parent.parent = node
+
+    def _replace(self, node, new):
+        """Put new (possibly None) where node hangs from its parent."""
+        parent = node.parent
+        if parent is None:
+            self._root = new
+        elif node is parent.left:
+            parent.left = new
+        else:
+            parent.right = new
+        if new is not None:
+            new.parent = parent
 
     def __len__(self):
-        return len(self._open_edges)
+        return self._len
 
     def __getitem__(self, index):
-        return self._open_edges[index]
+        edges = list(self)
+        return edges[index]
+
+    def __iter__(self):
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            for _ in range(node.count):
+                yield node.edge
+            node = node.right
+
+
+# Treap priorities come from a generator of our own, so sweeps neither
+# advance nor depend on the global random state, and run the same each time
+_priority = Random(0).random
+
+
+class _OpenEdgeNode(object):
+    __slots__ = ("edge", "count", "priority", "left", "right", "parent")
+
+    def __init__(self, edge):
+        self.edge = edge
+        self.count = 1
+        self.priority = _priority()
+        self.left = None
+        self.right = None
+        self.parent = None
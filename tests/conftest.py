@@ -0,0 +1,45 @@
+import glob
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pyvisgraph.classes import Point  # noqa: E402
+from backend import Environment  # noqa: E402
+from utils.svg_utils import parse_svg_env_file, interpolate_path  # noqa: E402
+
+
+def _sample_maps():
+    """The maps in environments/, the SVGs with an 'env' wall polygon, and
+    the robot path drawn on each."""
+    maps, paths = {}, {}
+    for path in sorted(glob.glob(os.path.join(ROOT, "environments", "*.svg"))):
+        try:
+            data = parse_svg_env_file(path)
+        except ValueError:
+            continue  # figures and path-only SVGs have no 'env' polygon
+        maps[os.path.basename(path)] = data["env_polygon_points"]
+        paths[os.path.basename(path)] = data["path_points"]
+    return maps, paths
+
+
+SAMPLE_MAPS, SAMPLE_PATHS = _sample_maps()
+
+
+@pytest.fixture(params=sorted(SAMPLE_MAPS))
+def sample_map(request):
+    """(name, wall): the wall of a map in environments/, as a list of Points."""
+    return request.param, [Point(x, y) for x, y in SAMPLE_MAPS[request.param]]
+
+
+@pytest.fixture(scope="session", params=sorted(SAMPLE_MAPS))
+def sample_env(request):
+    """(name, env, path): an Environment of a map in environments/ and the
+    robot path drawn on it, as 100 evenly spaced Points."""
+    env = Environment()
+    env.build([[Point(x, y) for x, y in SAMPLE_MAPS[request.param]]], status=False)
+    path = [Point(x, y) for x, y in interpolate_path(SAMPLE_PATHS[request.param], 100)]
+    return request.param, env, path
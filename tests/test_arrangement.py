@@ -0,0 +1,14 @@
+from pyvisgraph.event_arrangement import EventArrangement
+from pyvisgraph.visible_vertices import bitangent_lines
+
+
+def test_arrangement_matches_sweep_with_bounded_faces(sample_env):
+    name, env, path = sample_env
+    arrangement = EventArrangement(env.polygon_graph, env.event_edges, max_faces=8)
+    # Twice along the path, so that pieces are both reused and evicted
+    for p in path + path:
+        assert arrangement.bitangents(p) == bitangent_lines(p, env.polygon_graph), name
+        assert len(arrangement.faces) <= 8, name
+    points = [(p.x, p.y) for p in path]
+    assert arrangement.bitangents_batch(points) == [
+        bitangent_lines(p, env.polygon_graph) for p in path], name
@@ -0,0 +1,98 @@
+from math import cos, sin, hypot
+
+import pytest
+
+from pyvisgraph.classes import Point
+from pyvisgraph.graph import PolygonGraph
+from backend import Environment
+
+
+def _xy(p):
+    return (p.x, p.y)
+
+
+def _rays(graph):
+    return {(_xy(e.p1), _xy(e.p2), e.side, e.eid,
+             e.dual and (_xy(e.dual.p1), _xy(e.dual.p2), e.dual.side))
+            for e in graph.get_edges()}
+
+
+def _snapshot(env):
+    """Every graph of env as comparable values: edges, sides and eids."""
+    return {
+        "visibility_graph": {frozenset((_xy(e.p1), _xy(e.p2)))
+                             for e in env.visibility_graph.get_edges()},
+        "convex_chains": {chain_id: ([_xy(v) for v in c.vertices],
+                                     [(_xy(e.p1), _xy(e.p2)) for e in c.edges],
+                                     c.start and _xy(c.start), c.end and _xy(c.end))
+                          for chain_id, c in env.convex_chains.chains.items()},
+        "bitangent_comp": _rays(env.bitangent_comp),
+        "inflection": _rays(env.inflection),
+        "extension": _rays(env.extension),
+    }
+
+
+def _fresh(polygons):
+    env = Environment()
+    env.build([[Point(p.x, p.y) for p in poly] for poly in polygons], status=False, eager=True)
+    return env
+
+
+def _obstacles(wall, count=3):
+    """Small triangles inside the wall, clear of it and of each other."""
+    graph = PolygonGraph([[Point(p.x, p.y) for p in wall]])
+    xs, ys = [p.x for p in wall], [p.y for p in wall]
+    r = 0.03 * min(max(xs) - min(xs), max(ys) - min(ys))
+    centers = []
+    for i in range(1, 8):
+        for j in range(1, 8):
+            c = Point(min(xs) + (max(xs) - min(xs)) * i / 8, min(ys) + (max(ys) - min(ys)) * j / 8)
+            if not graph.is_valid(c):
+                continue
+            if any(_segment_distance(c, e.p1, e.p2) < 3 * r for e in graph.get_edges()):
+                continue
+            if any(hypot(c.x - o.x, c.y - o.y) < 6 * r for o in centers):
+                continue
+            centers.append(c)
+    step = max(len(centers) // count, 1)
+    # Turned and sized apart, so no three vertices of different obstacles
+    # line up (see VisGraph.add_polygon)
+    return [[Point(c.x + r * (1 - 0.1 * k) * cos(a + 0.7 * k), c.y + r * (1 - 0.1 * k) * sin(a + 0.7 * k))
+             for a in (0.3, 2.4, 4.3)]
+            for k, c in enumerate(centers[::step][:count])]
+
+
+def _segment_distance(p, a, b):
+    dx, dy = b.x - a.x, b.y - a.y
+    t = ((p.x - a.x) * dx + (p.y - a.y) * dy) / (dx * dx + dy * dy)
+    t = min(max(t, 0.0), 1.0)
+    return hypot(p.x - a.x - t * dx, p.y - a.y - t * dy)
+
+
+def test_add_and_remove_polygon_match_full_rebuild(sample_map):
+    name, wall = sample_map
+    obstacles = _obstacles(wall)
+    assert obstacles, name
+
+    env = _fresh([wall])
+    polygons = [wall]
+    steps = [("add", o) for o in obstacles] + [("remove", 1), ("remove", len(obstacles) - 1)]
+    for action, arg in steps:
+        if action == "add":
+            pid = env.add_polygon([Point(p.x, p.y) for p in arg])
+            assert pid == len(polygons), name
+            polygons.append(arg)
+        else:
+            env.remove_polygon(arg)
+            del polygons[arg]
+        assert _snapshot(env) == _snapshot(_fresh(polygons)), (name, action, len(polygons))
+
+
+def test_remove_polygon_rejects_unknown_ids(sample_map):
+    name, wall = sample_map
+    env = _fresh([wall] + _obstacles(wall, count=1))
+    before = _snapshot(env)
+    for pid in (-1, 2, 10):
+        with pytest.raises(IndexError):
+            env.remove_polygon(pid)
+        assert _snapshot(env) == before, (name, pid)
@@ -0,0 +1,42 @@
+from collections import Counter
+
+from pyvisgraph.classes import Point, Edge
+from backend.gap import GapEventType
+from backend.robot import Robot
+
+
+def test_gaps_stay_in_order_of_appearance(sample_env):
+    name, env, path = sample_env
+    robot = Robot(env, path[0])
+    for p1, p2 in zip(path, path[1:]):
+        before = {g.id for g in robot.gaps}
+        events = robot.move(Edge(p1, p2))
+        gaps = robot.gaps
+        ids = [g.id for g in gaps]
+        # Gaps only join at the end, and keep their id and place
+        assert ids == sorted(set(ids)), name
+        added = sum(e.etype in (GapEventType.A, GapEventType.S) for e in events)
+        assert len([i for i in ids if i not in before]) == added, name
+        assert Counter(g.vertex for g in gaps) == Counter(env.find_visible_vertices(p2)), name
+
+
+def test_visibility_is_swept_once_per_position(sample_env):
+    name, env, path = sample_env
+    robot = Robot(env, path[0])
+    visibility = robot.visibility
+    assert robot.visibility is visibility, name
+    assert [g.vertex for g in robot.gaps] == env.find_visible_vertices(path[0]), name
+
+    robot.move(Edge(path[0], path[1]))
+    assert robot.visibility is not visibility, name
+    assert robot.visibility.origin == path[1], name
+    assert robot.visibility.bitangents == env.find_visible_vertices(path[1]), name
+
+
+def test_advance_with_zero_direction_stays_put(sample_env):
+    name, env, path = sample_env
+    robot = Robot(env, path[0])
+    gaps = list(robot.gaps)
+    assert env.next_event(path[0], Point(0.0, 0.0), 1.0) == [], name
+    assert robot.advance(Point(0.0, 0.0), 1.0) == [], name
+    assert robot.pos == path[0] and robot.gaps == gaps, name
@@ -0,0 +1,24 @@
+from pyvisgraph.classes import Point
+from pyvisgraph.vis_graph import VisGraph
+
+
+def _visibility_edges(polygons, shared_order):
+    vis_graph = VisGraph()
+    vis_graph.build(polygons, status=False, shared_order=shared_order)
+    return {((e.p1.x, e.p1.y), (e.p2.x, e.p2.y)) for e in vis_graph.visibility_graph.get_edges()}
+
+
+def test_shared_order_matches_default_builder(sample_map):
+    name, wall = sample_map
+    assert _visibility_edges([wall], True) == _visibility_edges([wall], False), name
+
+
+def test_shared_order_matches_default_builder_on_obstacles():
+    # Rows and columns of squares and point obstacles: many vertices lie on
+    # one line
+    wall = [Point(0, 0), Point(800, 0), Point(800, 600), Point(0, 600)]
+    squares = [[Point(x, y), Point(x + 50, y), Point(x + 50, y + 50), Point(x, y + 50)]
+               for x in range(100, 700, 150) for y in range(100, 500, 150)]
+    dots = [[Point(x, 75)] for x in range(75, 700, 150)]
+    polygons = [wall] + squares + dots
+    assert _visibility_edges(polygons, True) == _visibility_edges(polygons, False)
@@ -7,7 +7,7 @@ from math import sqrt
 import xml.etree.ElementTree as ET
 
 import pyvisgraph as vg
-from pyvisgraph.visible_vertices import intersect_point, edge_distance, on_segment
+from pyvisgraph.visible_vertices import edge_distance
 
 SVG_NS = 'http://www.w3.org/2000/svg'
 INKSCAPE_NS = 'http://www.inkscape.org/namespaces/inkscape'
@@ -272,33 +272,7 @@ def interpolate_path(points, n):
 
 def _shadow_endpoint(robot_pos, gap_vertex, graph):
     """Cast a ray from robot_pos through gap_vertex; return (shadow_pt, hit_edge)."""
-    dx = gap_vertex.x - robot_pos.x
-    dy = gap_vertex.y - robot_pos.y
-    length = sqrt(dx * dx + dy * dy)
-    if length == 0:
-        return None, None
-    scale = 1e6 / length
-    far = vg.Point(gap_vertex.x + dx * scale, gap_vertex.y + dy * scale)
-
-    min_dist = float('inf')
-    nearest = None
-    hit_edge = None
-    for edge in graph.get_edges():
-        if gap_vertex in edge:
-            continue
-        p = intersect_point(gap_vertex, far, edge)
-        if p is None:
-            continue
-        if not on_segment(edge.p1, p, edge.p2): # verify p is on edge
-            continue
-        if (p.x - gap_vertex.x) * dx + (p.y - gap_vertex.y) * dy <= 0: # verify p is in the ray direction from gap_vertex
-            continue
-        d = edge_distance(gap_vertex, p)
-        if d < min_dist:
-            min_dist = d
-            nearest = p
-            hit_edge = edge
-    return nearest, hit_edge
+    return graph.first_hit(gap_vertex, gap_vertex - robot_pos, exclude=(gap_vertex,))
 
 
 def _build_shadow_graph(graph, shadow_insertions):
@@ -338,14 +312,18 @@ def _trace_shadow_polygon(gap, shadow_pt, next_pt, prev_pt, max_steps=5000):
     return vertices
 
 
-def compute_shadow_polygons(robot_pos, gaps, polygon_graph):
+def compute_shadow_polygons(robot_pos, gaps, polygon_graph, visibility=None):
     """Return a list of shadow polygon vertex lists (each a list of vg.Point).
 
     Each polygon encloses the region hidden behind one gap vertex.
+    visibility -- optional VisibilityPolygon of robot_pos; its shadow points
+                  are used instead of casting a ray per gap.
     """
+    shadows = visibility.shadows if visibility is not None else {}
     shadow_info = []
     for gap in gaps:
-        shadow_pt, hit_edge = _shadow_endpoint(robot_pos, gap.vertex, polygon_graph)
+        shadow_pt, hit_edge = shadows.get(gap.vertex) or _shadow_endpoint(
+            robot_pos, gap.vertex, polygon_graph)
         if shadow_pt is not None and hit_edge is not None:
             shadow_info.append((gap, shadow_pt, hit_edge))
 